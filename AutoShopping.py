@@ -1,75 +1,212 @@
-import cv2
-import numpy as np
-from PIL import Image, ImageTk
 import tkinter as tk
-from tkinter import Canvas, Label, Frame, Entry, messagebox
+from tkinter import Canvas, Label, Frame, Entry, messagebox, simpledialog
 import threading
 import time
-from mss import mss
 import sys
-from pynput.mouse import Button, Controller as MouseController
-from pynput.keyboard import Key, Controller as KeyboardController, Listener as KeyboardListener
 import os
 import json
+import csv
 from pathlib import Path
+from collections import namedtuple, OrderedDict, deque
 import ctypes
 import platform
 from datetime import datetime, timedelta
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
 import hashlib
+import functools
+from contextlib import contextmanager
 import socket
 import struct
+import queue
+import heapq
+import itertools
 import base64
 import uuid
+import re
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+# 重型依赖（OpenCV、NumPy、PIL、mss、pynput）延迟到引擎启动时才导入，
+# 配置窗口只依赖tkinter，可以尽快显示
+cv2 = None
+np = None
+Image = ImageTk = None
+mss = None
+Button = MouseController = None
+Key = KeyboardController = KeyboardListener = None
+
+_engine_import_lock = threading.Lock()
+
+# 启动耗时探针（供 benchmarks/startup_bench.py 使用）
+STARTUP_PROBE = os.environ.get("DELTASHOPPING_STARTUP_PROBE")
+
+
+def load_vision_modules():
+    """导入图像识别所需的模块（OpenCV、NumPy），重复调用直接返回"""
+    global cv2, np
+    if cv2 is not None:
+        return
+    with _engine_import_lock:
+        if cv2 is not None:
+            return
+        import numpy
+        import cv2 as opencv
+        np = numpy
+        cv2 = opencv
+
+
+def load_engine_modules():
+    """导入识别引擎的全部依赖（截图、预览、鼠标键盘控制），重复调用直接返回"""
+    global Image, ImageTk, mss, Button, MouseController, Key, KeyboardController, KeyboardListener
+    load_vision_modules()
+    if KeyboardListener is not None:
+        return
+    with _engine_import_lock:
+        if KeyboardListener is not None:
+            return
+        from PIL import Image as pil_image, ImageTk as pil_imagetk
+        from mss import mss as mss_factory
+        from pynput.mouse import Button as mouse_button, Controller as mouse_controller
+        from pynput.keyboard import Key as keyboard_key, Controller as keyboard_controller
+        from pynput.keyboard import Listener as keyboard_listener
+        Image, ImageTk = pil_image, pil_imagetk
+        mss = mss_factory
+        Button, MouseController = mouse_button, mouse_controller
+        Key, KeyboardController = keyboard_key, keyboard_controller
+        KeyboardListener = keyboard_listener
+
+
+def preload_engine_modules():
+    """在后台线程预先导入引擎依赖（配置窗口显示期间进行）"""
+    def _preload():
+        try:
+            load_engine_modules()
+        except Exception as e:
+            print(f"预加载模块失败: {e}")
+    threading.Thread(target=_preload, name="preload", daemon=True).start()
+
+
+def startup_probe_mark(name):
+    """设置了DELTASHOPPING_STARTUP_PROBE时，把启动里程碑时刻追加到探针文件"""
+    if not STARTUP_PROBE:
+        return
+    with open(STARTUP_PROBE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'mark': name, 'time': time.time()}) + "\n")
 
 
-def get_network_time():
-    """从NTP服务器获取网络时间戳"""
-    ntp_servers = [
-        "ntp.aliyun.com"  # 阿里云时间服务器
-    ]
+NTP_SERVERS = [
+    "ntp.aliyun.com"  # 阿里云时间服务器
+]
 
+
+def get_network_time(servers=NTP_SERVERS, timeout=2):
+    """从NTP服务器获取网络时间
+
+    返回 (网络时间戳, 对应的time.monotonic()时刻)，取请求往返的中点以抵消网络延迟；
+    所有服务器都失败时返回None。
+    """
     # NTP协议常量
     NTP_PACKET_FORMAT = "!12I"
     NTP_DELTA = 2208988800  # 1900-01-01 00:00:00 到 1970-01-01 00:00:00 的秒数
 
-    for server in ntp_servers:
+    for server in servers:
+        sock = None
         try:
             # 创建UDP套接字
             sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(2)  # 设置2秒超时
+            sock.settimeout(timeout)
 
             # 构建NTP数据包
             packet = bytearray(48)
             packet[0] = 0x1B  # 设置协议版本和模式
 
             # 发送请求
+            sent_at = time.monotonic()
             sock.sendto(packet, (server, 123))
 
             # 接收响应
             data, _ = sock.recvfrom(1024)
+            received_at = time.monotonic()
 
             if len(data) >= 48:
-                # 解析NTP时间戳
+                # 解析NTP时间戳：传输时间戳的整数部分（第10个字段）和小数部分（第11个字段）
                 unpacked = struct.unpack(NTP_PACKET_FORMAT, data[:48])
-                # 提取传输时间戳（第10个字段）
-                ntp_time = unpacked[10] - NTP_DELTA
-                return ntp_time
+                ntp_time = unpacked[10] - NTP_DELTA + unpacked[11] / 2 ** 32
+                return ntp_time, (sent_at + received_at) / 2
         except (socket.timeout, socket.gaierror, ConnectionRefusedError, OSError):
             continue
         finally:
-            try:
+            if sock is not None:
                 sock.close()
-            except:
-                pass
 
-    print(f"请检查网络是否连接！")
-    return 0
+    return None
+
+
+class NetworkTimeService:
+    """后台网络时间服务
+
+    后台线程启动时查询一次NTP并定期重新同步，只保存网络时间相对time.monotonic()的偏移，
+    now()直接由内存计算，不做任何网络I/O。尚未同步或离线时退回本地时钟。
+    """
+
+    def __init__(self, servers=NTP_SERVERS, resync_interval=1800, retry_interval=60, timeout=2):
+        self.servers = servers
+        self.resync_interval = resync_interval
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self.offset = None  # 网络时间 - time.monotonic()
+        self.synced_at = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """启动后台同步线程（重复调用无副作用）"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name="ntp", daemon=True)
+            self.thread.start()
+
+    @property
+    def synced(self):
+        return self.offset is not None
+
+    def sync(self):
+        """同步一次，成功返回True"""
+        result = get_network_time(self.servers, self.timeout)
+        if result is None:
+            return False
+        ntp_time, monotonic_at = result
+        self.offset = ntp_time - monotonic_at
+        self.synced_at = time.monotonic()
+        return True
+
+    def _run(self):
+        warned = False
+        while True:
+            if self.sync():
+                warned = False
+                time.sleep(self.resync_interval)
+            else:
+                if not warned and not self.synced:
+                    print(f"请检查网络是否连接！暂时使用本地时间")
+                    warned = True
+                time.sleep(self.retry_interval)
+
+    def now(self):
+        """当前时间戳（秒）"""
+        offset = self.offset
+        if offset is None:
+            return time.time()
+        return time.monotonic() + offset
+
+
+TIME_SERVICE = NetworkTimeService()
+
+
 def get_accurate_time():
-    """获取准确时间（优先网络时间），返回datetime对象"""
-    timestamp = get_network_time()
-    return datetime.fromtimestamp(timestamp)
+    """获取准确时间（优先网络时间，不阻塞），返回datetime对象"""
+    TIME_SERVICE.start()
+    return datetime.fromtimestamp(TIME_SERVICE.now())
 def resource_path(relative_path):
     """获取资源文件的绝对路径。在开发时和打包后均可使用"""
     try:
@@ -100,8 +237,9 @@ CONFIG_FILE = get_config_path()
 
 
 # ==================== 配置文件加密部分 ====================
+@functools.lru_cache(maxsize=1)
 def derive_key():
-    """派生加密密钥（基于系统唯一标识符）"""
+    """派生加密密钥（基于系统唯一标识符，进程内只计算一次）"""
     # 获取系统标识符（MAC地址+主机名）
     system_id = f"{uuid.getnode()}-{platform.node()}".encode()
 
@@ -110,6 +248,9 @@ def derive_key():
     return hashlib.pbkdf2_hmac('sha256', system_id, salt, 100000, 32)
 def encrypt_config(data):
     """加密配置数据"""
+    from Crypto.Cipher import AES
+    from Crypto.Util.Padding import pad
+
     key = derive_key()
     iv = os.urandom(16)  # 随机初始化向量
 
@@ -127,6 +268,9 @@ def encrypt_config(data):
 
 def decrypt_config(encrypted):
     """解密配置数据"""
+    from Crypto.Cipher import AES
+    from Crypto.Util.Padding import unpad
+
     try:
         key = derive_key()
         data = base64.b64decode(encrypted)
@@ -190,35 +334,2747 @@ def load_config():
     except Exception as e:
         print(f"Error loading config: {str(e)}")
 
-    return default_config
+    return default_config
+
+
+_config_txn_lock = threading.RLock()
+_config_txn_depth = 0
+_config_txn_pending = None
+
+
+@contextmanager
+def config_transaction():
+    """配置事务：期间的save_config只记下最新配置，退出时统一加密写入一次"""
+    global _config_txn_depth, _config_txn_pending
+    with _config_txn_lock:
+        _config_txn_depth += 1
+        try:
+            yield
+        finally:
+            _config_txn_depth -= 1
+            if _config_txn_depth == 0 and _config_txn_pending is not None:
+                pending, _config_txn_pending = _config_txn_pending, None
+                _write_config(pending)
+
+
+def save_config(config):
+    """加密并保存配置（在事务中时推迟到事务结束）"""
+    global _config_txn_pending
+    with _config_txn_lock:
+        if _config_txn_depth > 0:
+            _config_txn_pending = config
+            return
+        _write_config(config)
+
+
+def _write_config(config):
+    """原子写入：先写临时文件并落盘，再替换正式文件，写入中途崩溃不会损坏配置"""
+    encrypted = encrypt_config(config)
+    config_path = get_config_path()
+
+    # 确保目录存在
+    config_path.parent.mkdir(exist_ok=True, parents=True)
+
+    tmp_path = config_path.with_name(config_path.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(encrypted)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, config_path)
+
+# ====== 新增关机功能 ======
+def shutdown_computer():
+    """执行关机命令，支持Windows和Linux系统"""
+    try:
+        system_name = platform.system()
+        if system_name == "Windows":
+            # Windows关机命令（立即关机）
+            os.system("shutdown /s /t 0")
+        elif system_name == "Linux":
+            # Linux关机命令
+            os.system("sudo shutdown -h now")
+        else:
+            print(f"不支持的系统: {system_name}")
+    except Exception as e:
+        print(f"关机失败: {str(e)}")
+
+
+# ==================== 定时调度部分 ====================
+class ScheduledTask:
+    """调度器中的一个定时任务"""
+
+    def __init__(self, deadline, callback, on_ui):
+        self.deadline = deadline  # time.monotonic() 绝对截止时刻
+        self.callback = callback
+        self.on_ui = on_ui
+        self.cancelled = False
+        self.fired = False
+
+    def remaining(self):
+        """距离截止时刻的秒数（已过期返回0）"""
+        return max(0.0, self.deadline - time.monotonic())
+
+
+class DeadlineScheduler:
+    """统一的截止时刻调度器
+
+    单个后台线程维护按 time.monotonic() 绝对截止时刻排序的堆，不会因为逐秒递减而漂移。
+    on_ui=True 的回调通过 dispatch（通常是 root.after(0, ...)）投递到界面线程执行；
+    on_ui=False 的回调直接在调度线程执行，不能操作界面。
+    """
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self.thread.start()
+
+    def call_at(self, deadline, callback, on_ui=True):
+        """在指定的 time.monotonic() 时刻执行回调，返回任务对象"""
+        task = ScheduledTask(deadline, callback, on_ui)
+        with self.condition:
+            heapq.heappush(self.heap, (deadline, next(self.counter), task))
+            self.condition.notify()
+        return task
+
+    def call_later(self, delay, callback, on_ui=True):
+        """在delay秒后执行回调，返回任务对象"""
+        return self.call_at(time.monotonic() + delay, callback, on_ui)
+
+    def cancel(self, task):
+        """取消任务（任务为None或已执行时无影响）"""
+        if task is None:
+            return
+        with self.condition:
+            task.cancelled = True
+            self.condition.notify()
+
+    def stop(self):
+        """停止调度线程，未执行的任务全部丢弃"""
+        with self.condition:
+            self.running = False
+            self.heap.clear()
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    deadline, _, task = self.heap[0]
+                    if task.cancelled:
+                        heapq.heappop(self.heap)
+                        continue
+                    delay = deadline - time.monotonic()
+                    if delay > 0:
+                        self.condition.wait(delay)
+                        continue
+                    heapq.heappop(self.heap)
+                    task.fired = True
+                    break
+                else:
+                    return
+
+            try:
+                if task.on_ui:
+                    self.dispatch(task.callback)
+                else:
+                    task.callback()
+            except Exception as e:
+                print(f"定时任务执行失败: {e}")
+
+
+def next_daily_deadline(time_str):
+    """把HH:MM换算成下一次到达该时刻的 time.monotonic() 截止时刻（已过则取明天）"""
+    hour, minute = map(int, time_str.split(':'))
+    now = get_accurate_time()
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target < now:
+        target += timedelta(days=1)
+    return time.monotonic() + (target - now).total_seconds()
+
+
+# ==================== 性能统计部分 ====================
+class LatencyHistogram:
+    """固定大小的HDR风格延迟直方图（单位：微秒）
+
+    小于32us的值逐一计数，其余按2的幂分段、每段16个子桶，相对误差约3%。
+    record()只有一次位运算和一次列表自增，可以在热循环中常开。
+    """
+
+    SUB_BITS = 5
+    SUB_COUNT = 1 << SUB_BITS
+    HALF_COUNT = SUB_COUNT >> 1
+    MAX_EXPONENT = 32  # 最大约2^37微秒，远超任何单帧耗时
+
+    def __init__(self):
+        self.counts = [0] * (self.SUB_COUNT + self.MAX_EXPONENT * self.HALF_COUNT)
+        self.reset()
+
+    def reset(self):
+        """清空统计"""
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.total = 0
+        self.sum_us = 0
+        self.min_us = 1 << 62
+        self.max_us = 0
+
+    def _index(self, value):
+        """计算数值所在的桶下标"""
+        if value < self.SUB_COUNT:
+            return value
+        exponent = value.bit_length() - self.SUB_BITS
+        if exponent > self.MAX_EXPONENT:
+            return len(self.counts) - 1
+        return self.SUB_COUNT + (exponent - 1) * self.HALF_COUNT + (value >> exponent) - self.HALF_COUNT
+
+    def _bucket_value(self, index):
+        """返回桶的代表值（桶中点）"""
+        if index < self.SUB_COUNT:
+            return index
+        exponent = (index - self.SUB_COUNT) // self.HALF_COUNT + 1
+        mantissa = (index - self.SUB_COUNT) % self.HALF_COUNT + self.HALF_COUNT
+        return (mantissa << exponent) + ((1 << exponent) >> 1)
+
+    def record(self, duration_ns):
+        """记录一次耗时（纳秒）"""
+        value = duration_ns // 1000
+        if value < 0:
+            value = 0
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        self.sum_us += value
+        if value > self.max_us:
+            self.max_us = value
+        if value < self.min_us:
+            self.min_us = value
+
+    def percentile(self, percent):
+        """返回指定百分位的耗时（微秒），无数据时返回0"""
+        if self.total == 0:
+            return 0
+        target = max(1, int(self.total * percent / 100.0 + 0.999999))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                if seen >= target:
+                    return min(max(self._bucket_value(index), self.min_us), self.max_us)
+        return self.max_us
+
+    def snapshot(self):
+        """返回统计摘要字典"""
+        total = self.total
+        return {
+            'count': total,
+            'mean_us': round(self.sum_us / total, 1) if total else 0,
+            'min_us': self.min_us if total else 0,
+            'max_us': self.max_us,
+            'p50_us': self.percentile(50),
+            'p90_us': self.percentile(90),
+            'p99_us': self.percentile(99),
+            'p999_us': self.percentile(99.9),
+        }
+
+
+class PerfStats:
+    """按阶段汇总耗时的性能统计
+
+    每个阶段一个直方图，阶段名由调用方决定（如grab、preprocess、match）。
+    每个阶段只由一个线程写入，读取方拿到的是近似一致的快照，足够用于展示。
+    """
+
+    EXPORT_FIELDS = ['count', 'mean_us', 'min_us', 'max_us', 'p50_us', 'p90_us', 'p99_us', 'p999_us']
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self.started_at = datetime.now()
+
+    def record(self, stage, duration_ns):
+        """记录某阶段的一次耗时（纳秒）"""
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        histogram.record(duration_ns)
+
+    def snapshot(self):
+        """返回 {阶段: 摘要} 字典"""
+        return {stage: histogram.snapshot() for stage, histogram in list(self.histograms.items())}
+
+    def reset(self):
+        """清空所有阶段的统计"""
+        for histogram in list(self.histograms.values()):
+            histogram.reset()
+
+    def format_table(self):
+        """格式化为适合等宽字体显示的文本表格（单位：毫秒）"""
+        lines = [f"{'阶段':<16}{'次数':>8}{'平均':>8}{'P50':>8}{'P99':>8}{'最大':>8}"]
+        for stage, stats in self.snapshot().items():
+            lines.append(f"{stage:<16}{stats['count']:>8}"
+                         f"{stats['mean_us'] / 1000:>8.2f}{stats['p50_us'] / 1000:>8.2f}"
+                         f"{stats['p99_us'] / 1000:>8.2f}{stats['max_us'] / 1000:>8.2f}")
+        return "\n".join(lines)
+
+    def export(self, directory):
+        """导出为JSON和CSV文件，返回两个文件路径"""
+        directory = Path(directory)
+        directory.mkdir(exist_ok=True, parents=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        snapshot = self.snapshot()
+
+        json_path = directory / f"perf_stats_{stamp}.json"
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'exported_at': datetime.now().isoformat(timespec='seconds'),
+                'stages': snapshot
+            }, f, ensure_ascii=False, indent=2)
+
+        csv_path = directory / f"perf_stats_{stamp}.csv"
+        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['stage'] + self.EXPORT_FIELDS)
+            for stage, stats in snapshot.items():
+                writer.writerow([stage] + [stats[field] for field in self.EXPORT_FIELDS])
+
+        return json_path, csv_path
+
+
+class BuyLatencyLog:
+    """抢购端到端延迟记录
+
+    每次抢购记录五个时间点：满足条件的价格首次出现的截图时刻、决定点击时刻、
+    点击开始/结束时刻、检测到成功标志时刻。每条记录以一行JSON追加写入文件，
+    会话结束时追加一行百分位汇总。
+    """
+
+    SUCCESS_TIMEOUT = 10.0  # 点击后多少秒内出现的成功标志归属于该次点击
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.pending = None
+        self.attempts = 0
+        self.successes = 0
+        self.stats = PerfStats()
+        self.session = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 以perf_counter为准计算时间差，换算成墙上时间仅用于记录
+        self._wall0 = time.time()
+        self._perf0 = time.perf_counter_ns()
+
+    def _to_wall(self, ns):
+        return None if ns is None else round(self._wall0 + (ns - self._perf0) / 1e9, 6)
+
+    def begin_attempt(self, price, capture_ns, decision_ns, click_start_ns, click_end_ns):
+        """记录一次点击，等待成功标志（或超时）后写入"""
+        with self.lock:
+            self._flush_pending()
+            self.attempts += 1
+            self.pending = {
+                'price': price,
+                'capture_ns': capture_ns,
+                'decision_ns': decision_ns,
+                'click_start_ns': click_start_ns,
+                'click_end_ns': click_end_ns,
+                'success_ns': None
+            }
+
+    def mark_success(self, detected_ns):
+        """文本监控检测到成功标志时调用"""
+        with self.lock:
+            pending = self.pending
+            if pending is None or detected_ns < pending['click_start_ns']:
+                return
+            if (detected_ns - pending['click_end_ns']) / 1e9 > self.SUCCESS_TIMEOUT:
+                return
+            pending['success_ns'] = detected_ns
+            self.successes += 1
+            self._flush_pending()
+
+    def _flush_pending(self):
+        """写出挂起的记录（调用方需持有锁）"""
+        pending = self.pending
+        if pending is None:
+            return
+        self.pending = None
+
+        spans = {
+            'capture_to_decision': (pending['capture_ns'], pending['decision_ns']),
+            'decision_to_click_end': (pending['decision_ns'], pending['click_end_ns']),
+            'capture_to_click_end': (pending['capture_ns'], pending['click_end_ns']),
+            'click_end_to_success': (pending['click_end_ns'], pending['success_ns']),
+            'capture_to_success': (pending['capture_ns'], pending['success_ns']),
+        }
+        durations_ms = {}
+        for name, (start_ns, end_ns) in spans.items():
+            if start_ns is None or end_ns is None:
+                durations_ms[name] = None
+                continue
+            self.stats.record(name, end_ns - start_ns)
+            durations_ms[name] = round((end_ns - start_ns) / 1e6, 3)
+
+        self._append({
+            'type': 'attempt',
+            'session': self.session,
+            'price': pending['price'],
+            'capture_ts': self._to_wall(pending['capture_ns']),
+            'decision_ts': self._to_wall(pending['decision_ns']),
+            'click_start_ts': self._to_wall(pending['click_start_ns']),
+            'click_end_ts': self._to_wall(pending['click_end_ns']),
+            'success_ts': self._to_wall(pending['success_ns']),
+            'durations_ms': durations_ms
+        })
+
+    def _append(self, record):
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"写入延迟记录失败: {e}")
+
+    def summary(self):
+        """返回本次会话的百分位汇总（毫秒）"""
+        latency_ms = {}
+        for name, stats in self.stats.snapshot().items():
+            latency_ms[name] = {
+                'count': stats['count'],
+                'p50': stats['p50_us'] / 1000,
+                'p90': stats['p90_us'] / 1000,
+                'p99': stats['p99_us'] / 1000,
+                'max': stats['max_us'] / 1000
+            }
+        return {
+            'type': 'summary',
+            'session': self.session,
+            'attempts': self.attempts,
+            'successes': self.successes,
+            'latency_ms': latency_ms
+        }
+
+    def close(self):
+        """会话结束：写出挂起记录和汇总"""
+        with self.lock:
+            self._flush_pending()
+            if self.attempts == 0:
+                return
+            summary = self.summary()
+            self._append(summary)
+        for name, stats in summary['latency_ms'].items():
+            print(f"{name}: P50={stats['p50']:.1f}ms P90={stats['p90']:.1f}ms P99={stats['p99']:.1f}ms")
+
+
+class FrameGovernor:
+    """采集循环的帧间隔控制器
+
+    用time.thread_time测量本线程每帧实际消耗的CPU时间（EWMA平滑），据此决定帧周期:
+        周期 = max(目标延迟, CPU成本 / CPU预算)
+    OpenCV线程池大于1时matchTemplate等的计算分散在池线程中，本线程的CPU时间统计不到，
+    此时改用整个进程的CPU时间（包含其他线程，偏保守，宁可多限速也不超预算）。
+    cpu_budget是该循环最多占用单个核心的比例，target_latency是期望的帧周期（秒）。
+    两者冲突时以CPU预算为准（保证游戏不掉帧），并报告目标延迟无法达到。
+    每帧至少休眠MIN_SLEEP秒，处理再慢也不会空转占满一个核心。
+    """
+    MIN_SLEEP = 0.005
+    ALPHA = 0.2  # EWMA平滑系数
+
+    def __init__(self, name, cpu_budget=0.5, target_latency=0.05):
+        self.name = name
+        self.cpu_budget = max(0.01, min(1.0, cpu_budget))
+        self.target_latency = max(0.001, target_latency)
+        self.cost = None  # 每帧CPU时间（秒，EWMA）
+        self.busy = None  # 每帧处理耗时（秒，EWMA，含等待IO）
+        self.period = self.target_latency
+        self.target_met = True
+        self.cpu_clock = time.thread_time
+        self._clock = self.cpu_clock
+        self._cpu_start = self._wall_start = 0.0
+
+    def count_pool_threads(self, pooled):
+        """OpenCV线程池是否多线程：是则按进程CPU时间计费（下一帧生效）"""
+        self.cpu_clock = time.process_time if pooled else time.thread_time
+
+    def begin(self):
+        """一帧处理开始"""
+        self._clock = self.cpu_clock
+        self._cpu_start = self._clock()
+        self._wall_start = time.perf_counter()
+
+    def end(self):
+        """一帧处理结束，返回本帧之后应休眠的秒数"""
+        cpu = self._clock() - self._cpu_start
+        busy = time.perf_counter() - self._wall_start
+        if self.cost is None:
+            self.cost, self.busy = cpu, busy
+        else:
+            self.cost += self.ALPHA * (cpu - self.cost)
+            self.busy += self.ALPHA * (busy - self.busy)
+
+        self.period = max(self.target_latency, self.cost / self.cpu_budget, busy + self.MIN_SLEEP)
+        target_met = self.period <= self.target_latency * 1.1
+        if target_met != self.target_met:
+            self.target_met = target_met
+            if target_met:
+                LOG.info(f"governor.{self.name}", f"[{self.name}] 已恢复目标帧周期 {self.target_latency * 1000:.0f}ms")
+            else:
+                LOG.warning(f"governor.{self.name}", f"[{self.name}] 无法达到目标帧周期",
+                            target_ms=round(self.target_latency * 1000), cpu_ms=round(self.cost * 1000, 1),
+                            budget=f"{self.cpu_budget:.0%}", period_ms=round(self.period * 1000))
+        return max(self.period - busy, self.MIN_SLEEP)
+
+    def format_status(self):
+        if self.cost is None:
+            return f"{self.name}: 未运行"
+        share = self.cost / self.period if self.period else 0.0
+        status = "" if self.target_met else "（达不到目标）"
+        return (f"{self.name}: 周期{self.period * 1000:.0f}ms 目标{self.target_latency * 1000:.0f}ms"
+                f" CPU{self.cost * 1000:.1f}ms/帧 占用{share:.0%}/预算{self.cpu_budget:.0%}{status}")
+
+
+class SamplingProfiler:
+    """低开销采样分析器
+
+    后台线程按固定间隔读取所有线程的当前调用栈（sys._current_frames），
+    按"线程名;调用者;...;被调用者"折叠计数，停止后可输出为折叠栈文件，
+    用flamegraph.pl或speedscope查看。
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """开始采样（清空上次结果）"""
+        if self.running:
+            return
+        self.counts = {}
+        self.samples = 0
+        self.started_at = datetime.now()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止采样"""
+        if not self.running:
+            return
+        self.stop_event.set()
+        self.thread.join(1.0)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        thread_names = {}
+        counts = self.counts
+        while not self.stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                name = thread_names.get(thread_id)
+                if name is None:
+                    thread_names.update({t.ident: t.name for t in threading.enumerate()})
+                    name = thread_names.get(thread_id, str(thread_id))
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(name)
+                key = ";".join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            self.samples += 1
+
+    def dump(self, directory):
+        """写出折叠栈文件，返回文件路径"""
+        stamp = (self.started_at or datetime.now()).strftime("%Y%m%d_%H%M%S")
+        path = Path(directory) / f"profile_{stamp}.collapsed"
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+# ==================== 线程调度部分 ====================
+# 线程运行参数：OpenCV线程池大小（None为DEFAULT_CV_THREADS）、识别线程/点击线程绑定的CPU核心（空为不绑定）、
+# 是否提升点击线程优先级
+RuntimeSettings = namedtuple('RuntimeSettings', ['cv_threads', 'ocr_cores', 'click_cores', 'boost_click'])
+DEFAULT_RUNTIME = RuntimeSettings(None, (), (), True)
+# 默认单线程：识别计算都在识别线程内，帧限速器按本线程CPU时间计费才准确，也不会占满游戏的核心
+DEFAULT_CV_THREADS = 1
+
+_THREAD_QUERY_LIMITED_INFORMATION = 0x0800
+_THREAD_PRIORITY_HIGHEST = 2
+_LINUX_BOOST_NICE = -5
+
+
+def parse_core_list(text):
+    """把"2,3"或"2-4"形式的核心列表解析为元组，空字符串返回()"""
+    cores = set()
+    for part in text.replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = (int(v) for v in part.split("-", 1))
+            cores.update(range(first, last + 1))
+        else:
+            cores.add(int(part))
+    if any(core < 0 for core in cores):
+        raise ValueError("核心编号不能为负")
+    return tuple(sorted(cores))
+
+
+def format_core_list(cores):
+    return ",".join(str(core) for core in cores)
+
+
+@functools.lru_cache(maxsize=None)
+def _kernel32():
+    """线程调度用的kernel32（开启use_last_error，调用失败时ctypes.get_last_error才能取到真实错误码）"""
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.GetCurrentThread.restype = ctypes.c_void_p
+    kernel32.SetThreadAffinityMask.restype = ctypes.c_size_t
+    kernel32.SetThreadAffinityMask.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    kernel32.SetThreadPriority.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    kernel32.OpenThread.restype = ctypes.c_void_p
+    return kernel32
+
+
+def set_current_thread_affinity(cores):
+    """把调用线程绑定到指定核心（Linux用sched_setaffinity，Windows用SetThreadAffinityMask）"""
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)  # Linux下pid 0表示调用线程本身
+        return
+    if sys.platform == 'win32':
+        kernel32 = _kernel32()
+        mask = 0
+        for core in cores:
+            mask |= 1 << core
+        if not kernel32.SetThreadAffinityMask(kernel32.GetCurrentThread(), mask):
+            raise OSError(ctypes.get_last_error(), "SetThreadAffinityMask失败")
+        return
+    raise OSError("当前系统不支持线程绑核")
+
+
+def raise_current_thread_priority():
+    """提升调用线程的调度优先级（Linux需要权限才能调低nice值）"""
+    if sys.platform == 'win32':
+        kernel32 = _kernel32()
+        if not kernel32.SetThreadPriority(kernel32.GetCurrentThread(), _THREAD_PRIORITY_HIGHEST):
+            raise OSError(ctypes.get_last_error(), "SetThreadPriority失败")
+        return
+    # Linux的nice值按线程生效，PRIO_PROCESS配合线程ID只影响该线程
+    os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), _LINUX_BOOST_NICE)
+
+
+def thread_cpu_time(native_id):
+    """读取任意线程累计的CPU时间（秒），无法读取时返回None"""
+    if sys.platform == 'win32':
+        kernel32 = _kernel32()
+        handle = kernel32.OpenThread(_THREAD_QUERY_LIMITED_INFORMATION, False, native_id)
+        if not handle:
+            return None
+        try:
+            creation, exit_time, kernel, user = (ctypes.c_ulonglong() for _ in range(4))
+            if not kernel32.GetThreadTimes(ctypes.c_void_p(handle), ctypes.byref(creation), ctypes.byref(exit_time),
+                                           ctypes.byref(kernel), ctypes.byref(user)):
+                return None
+            return (kernel.value + user.value) / 1e7  # 100纳秒为单位
+        finally:
+            kernel32.CloseHandle(ctypes.c_void_p(handle))
+    try:
+        with open(f"/proc/self/task/{native_id}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # 去掉"pid (comm)"之后，utime/stime是第12、13个字段
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ThreadRuntime:
+    """线程运行时控制：OpenCV线程池、线程绑核、点击线程优先级和各线程CPU占用
+
+    绑核和优先级只能作用于调用线程，各工作线程启动时（以及设置变化后的下一帧）自行调用enter()；
+    其他线程（界面、键盘监听）用track()登记后只统计CPU占用。
+    """
+
+    def __init__(self):
+        self.threads = OrderedDict()  # 角色 -> {'native_id', 'cores', 'boosted'}
+        self.last_sample = {}  # 角色 -> (CPU秒, 墙钟秒)
+        self.cpu_share = {}  # 角色 -> 最近一个采样间隔内的单核占用比例
+        self.cv_threads = None
+        self.all_cores = tuple(sorted(os.sched_getaffinity(0))) if hasattr(os, 'sched_getaffinity') \
+            else tuple(range(os.cpu_count() or 1))
+
+    def configure_opencv(self, cv_threads):
+        """设置OpenCV内部线程池大小（None为DEFAULT_CV_THREADS，0或1为单线程）"""
+        if cv_threads is None:
+            cv_threads = DEFAULT_CV_THREADS
+        if cv_threads == self.cv_threads:
+            return
+        load_vision_modules()
+        cv2.setNumThreads(int(cv_threads))
+        self.cv_threads = cv_threads
+        LOG.info('runtime.opencv', f"OpenCV线程数: {cv2.getNumThreads()}")
+
+    @property
+    def opencv_pooled(self):
+        """OpenCV是否在线程池中并行计算（计算的CPU时间不在调用线程上）"""
+        return cv2 is not None and cv2.getNumThreads() > 1
+
+    def track(self, role, native_id):
+        """登记一个只统计CPU占用的线程"""
+        if native_id is not None:
+            self.threads[role] = {'native_id': native_id, 'cores': (), 'boosted': False}
+
+    def enter(self, role, cores=(), boost=False):
+        """在线程内调用：登记本线程，并按设置绑核、提升优先级（失败只记录日志）"""
+        entry = {'native_id': threading.get_native_id(), 'cores': (), 'boosted': False}
+        previous = self.threads.get(role)
+        # 取消绑定时恢复为进程启动时可用的全部核心
+        target = cores or (self.all_cores if previous is not None and previous['cores'] else ())
+        if target:
+            try:
+                set_current_thread_affinity(target)
+                entry['cores'] = tuple(cores)
+            except (OSError, ValueError) as e:
+                LOG.warning(f'runtime.affinity.{role}', f"线程{role}绑定核心{format_core_list(cores)}失败: {e}")
+        if boost:
+            try:
+                raise_current_thread_priority()
+                entry['boosted'] = True
+            except (OSError, AttributeError) as e:
+                LOG.warning(f'runtime.priority.{role}', f"提升线程{role}优先级失败: {e}")
+        self.threads[role] = entry
+
+    def sample(self):
+        """更新各线程的CPU占用（两次调用之间的增量），返回 {角色: 占用比例}"""
+        now = time.perf_counter()
+        for role, entry in list(self.threads.items()):
+            cpu = thread_cpu_time(entry['native_id'])
+            if cpu is None:
+                self.cpu_share.pop(role, None)
+                continue
+            previous = self.last_sample.get(role)
+            self.last_sample[role] = (cpu, now)
+            if previous is not None and now > previous[1]:
+                self.cpu_share[role] = max(0.0, (cpu - previous[0]) / (now - previous[1]))
+        return dict(self.cpu_share)
+
+    def format_status(self):
+        cv_threads = cv2.getNumThreads() if cv2 is not None else "未加载"
+        lines = [f"OpenCV线程数: {cv_threads}"]
+        for role, entry in list(self.threads.items()):
+            share = self.cpu_share.get(role)
+            text = f"线程{role}: CPU {share:.0%}" if share is not None else f"线程{role}: CPU -"
+            if entry['cores']:
+                text += f" 核心{format_core_list(entry['cores'])}"
+            if entry['boosted']:
+                text += " 高优先级"
+            lines.append(text)
+        return "\n".join(lines)
+
+
+# ==================== 诊断部分 ====================
+class TraceRecorder:
+    """时间线追踪
+
+    各线程的span（名称、线程、起止时间）写入固定容量的环形缓冲区（deque.append本身线程安全，
+    不加锁），旧记录自动丢弃。按需导出为Chrome trace JSON，可用chrome://tracing或Perfetto打开。
+    缓冲区常开，容量只保留一次导出所需的最近几十秒，没有参数的span不保存参数字典。
+    """
+
+    DEFAULT_CAPACITY = 30000
+
+    def __init__(self, capacity=None):
+        self.events = deque(maxlen=capacity or self.DEFAULT_CAPACITY)
+        self.thread_names = {}
+
+    def add(self, name, start_ns, end_ns, **args):
+        """记录一个已结束的span（perf_counter_ns时间戳）"""
+        ident = threading.get_ident()
+        if ident not in self.thread_names:
+            self.thread_names[ident] = threading.current_thread().name
+        self.events.append((name, ident, start_ns, end_ns, args or None))
+
+    @contextmanager
+    def span(self, name, **args):
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, start_ns, time.perf_counter_ns(), **args)
+
+    def instant(self, name, **args):
+        """记录一个瞬时事件"""
+        now = time.perf_counter_ns()
+        self.add(name, now, now, **args)
+
+    def export(self, directory):
+        """导出Chrome trace JSON，返回文件路径"""
+        directory = Path(directory)
+        directory.mkdir(exist_ok=True, parents=True)
+        path = directory / f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        pid = os.getpid()
+        trace_events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': ident, 'args': {'name': name}}
+                        for ident, name in list(self.thread_names.items())]
+        for name, ident, start_ns, end_ns, args in list(self.events):
+            event = {'name': name, 'pid': pid, 'tid': ident, 'ts': start_ns / 1000}
+            if end_ns == start_ns:
+                event.update(ph='i', s='t')
+            else:
+                event.update(ph='X', dur=(end_ns - start_ns) / 1000)
+            if args:
+                event['args'] = args
+            trace_events.append(event)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        return path
+
+
+class RateLimitedLogger:
+    """结构化、按消息键限流的日志
+
+    每条日志写成一行JSON（时间、级别、键、消息、附加字段），同时在控制台打印可读文本。
+    同一个key在interval秒内最多输出burst条，超出的只计数不输出，
+    该key下一次输出时附带被抑制的条数，错误风暴不会拖慢热路径。
+    """
+
+    def __init__(self, interval=5.0, burst=3):
+        self.interval = interval
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.windows = {}  # key -> [窗口开始时间, 已输出条数, 被抑制条数]
+        self.file = None
+
+    def open(self, path):
+        """同时写入JSONL文件（行缓冲）"""
+        self.close()
+        self.file = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def log(self, level, key, message, **fields):
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                window = self.windows[key] = [now, 0, 0]
+            else:
+                suppressed = 0
+            if window[1] >= self.burst:
+                window[2] += 1
+                return
+            window[1] += 1
+
+            record = {'time': datetime.now().isoformat(timespec='milliseconds'),
+                      'level': level, 'key': key, 'message': message}
+            if fields:
+                record['fields'] = fields
+            if suppressed:
+                record['suppressed'] = suppressed
+            text = f"[{level}] {message}"
+            if fields:
+                text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+            if suppressed:
+                text += f"（此前{self.interval:g}秒内另有{suppressed}条相同日志被省略）"
+            print(text)
+            if self.file is not None:
+                self.file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def info(self, key, message, **fields):
+        self.log('INFO', key, message, **fields)
+
+    def warning(self, key, message, **fields):
+        self.log('WARNING', key, message, **fields)
+
+    def error(self, key, message, **fields):
+        self.log('ERROR', key, message, **fields)
+
+
+LOG = RateLimitedLogger()
+
+
+# ==================== 数字识别部分 ====================
+DIGIT_RESOLUTIONS = ('1k', '2k', '4k')
+PRICE_PADDING = 20  # 价格区域二值图四周填充的像素数
+
+# status: ok / no_digits / no_match / invalid
+OcrResult = namedtuple('OcrResult', ['status', 'value', 'text', 'confidence', 'resolutions'])
+
+
+def load_digit_templates(resolutions=DIGIT_RESOLUTIONS, base_dir=None):
+    """加载数字模板，返回 {分辨率: {数字: 灰度模板}}"""
+    load_vision_modules()
+    templates = {resolution: {} for resolution in resolutions}
+
+    for resolution in templates.keys():
+        for digit in range(10):
+            relative_path = f"digits{resolution}/{digit}.png"
+            template_path = str(Path(base_dir) / relative_path) if base_dir else resource_path(relative_path)
+            try:
+                with open(template_path, 'rb') as f:
+                    img_data = np.frombuffer(f.read(), dtype=np.uint8)
+                    template = cv2.imdecode(img_data, cv2.IMREAD_GRAYSCALE)
+                templates[resolution][digit] = template
+            except Exception as e:
+                print(f"加载模板失败 [{resolution}/{digit}]: {e}")
+
+    return templates
+
+
+class FrameWorkspace:
+    """单个区域每帧复用的工作缓冲区
+
+    按名称保存预分配的数组，作为OpenCV调用的dst/result参数。
+    尺寸不变时每帧都复用同一块内存，区域尺寸变化时对应缓冲区自动重建，
+    不会随运行时间增长。一个工作区只能由一个线程使用。
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def buffer(self, name, shape, dtype='uint8', zero=False):
+        """取名为name的缓冲区，尺寸或类型不符时重新分配（zero=True时新分配的缓冲区清零）"""
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.zeros(shape, dtype=dtype) if zero else np.empty(shape, dtype=dtype)
+            self.buffers[name] = buf
+        return buf
+
+
+def preprocess_image(image, dst=None):
+    """
+    对图像进行自适应二值化预处理
+    参数:
+        image: 输入灰度图像
+        dst: 可选的输出数组（预分配缓冲区）
+    返回:
+        预处理后的二值图像
+    """
+    # 自适应二值化参数设置
+    block_size = 31  # 邻域大小，必须是奇数
+    c_value = -2  # 从计算阈值中减去的常数
+
+    # 应用自适应二值化（高斯加权）
+    return cv2.adaptiveThreshold(
+        image,
+        255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY,
+        block_size,
+        c_value,
+        dst=dst
+    )
+
+
+def _threshold_matches(res, template_shape, digit, resolution, matches, mask=None):
+    """按动态阈值提取匹配窗口，追加到matches（mask为可选的预分配掩码缓冲区）"""
+    _, max_val, _, _ = cv2.minMaxLoc(res)
+
+    # 动态阈值：最高置信度的75%且不低于0.7
+    threshold = max(0.7, max_val * 0.75)
+    mask = cv2.compare(res, threshold, cv2.CMP_GE, dst=mask)
+    points = cv2.findNonZero(mask)
+    if points is None:
+        return
+
+    # 提取匹配位置（与np.where相同的行优先顺序）
+    h, w = template_shape
+    for x, y in points.reshape(-1, 2).tolist():
+        matches.append((x, y, w, h, digit, res[y, x], resolution))
+
+
+def match_digit_templates(binary, templates, workspace=None):
+    """对填充后的二值图逐个模板匹配，返回 [(x, y, w, h, digit, confidence, resolution)]
+
+    传入workspace时匹配结果图和阈值掩码使用预分配缓冲区。
+    """
+    matches = []
+    img_h, img_w = binary.shape
+
+    # 多分辨率模板匹配
+    for resolution, digit_templates in templates.items():
+        for digit, template in digit_templates.items():
+            # 跳过空模板
+            if template is None or template.size == 0:
+                continue
+
+            # 模板匹配
+            h, w = template.shape
+            res = mask = None
+            if workspace is not None:
+                shape = (img_h - h + 1, img_w - w + 1)
+                res = workspace.buffer(('match', resolution, digit), shape, 'float32')
+                mask = workspace.buffer(('mask', resolution, digit), shape)
+            res = cv2.matchTemplate(binary, template, cv2.TM_CCOEFF_NORMED, result=res)
+            _threshold_matches(res, (h, w), digit, resolution, matches, mask)
+
+    return matches
+
+
+def build_mosaic(binaries, gutter, workspace=None):
+    """把多张二值图纵向拼成一张（左对齐），相邻两张之间留gutter行全零间隔带
+
+    返回 (mosaic, [(y偏移, 高, 宽)])
+    """
+    width = max(b.shape[1] for b in binaries)
+    height = sum(b.shape[0] for b in binaries) + gutter * (len(binaries) - 1)
+    if workspace is None:
+        mosaic = np.zeros((height, width), dtype=np.uint8)
+    else:
+        mosaic = workspace.buffer('mosaic', (height, width))
+        mosaic.fill(0)
+    layout = []
+    y = 0
+    for binary in binaries:
+        h, w = binary.shape
+        mosaic[y:y + h, :w] = binary
+        layout.append((y, h, w))
+        y += h + gutter
+    return mosaic, layout
+
+
+def match_digit_templates_mosaic(binaries, templates, workspace=None):
+    """多张填充后的二值图拼成一张，每个模板只做一次matchTemplate
+
+    结果图中只保留完全落在某张小图内部的窗口，并按小图各自计算动态阈值，
+    因此与逐张调用match_digit_templates的结果一致。
+    返回与binaries一一对应的匹配列表。
+    """
+    # 每张图四周已有PRICE_PADDING像素全零填充，相邻两张之间天然隔着40行间隔带；
+    # 跨图窗口在下面按小图裁剪时会被丢弃，所以不再额外加间隔
+    mosaic, layout = build_mosaic(binaries, 0, workspace)
+    matches = [[] for _ in binaries]
+
+    for resolution, digit_templates in templates.items():
+        for digit, template in digit_templates.items():
+            # 跳过空模板
+            if template is None or template.size == 0:
+                continue
+
+            h, w = template.shape
+            res = mask = None
+            if workspace is not None:
+                shape = (mosaic.shape[0] - h + 1, mosaic.shape[1] - w + 1)
+                res = workspace.buffer(('match', resolution, digit), shape, 'float32')
+                mask = workspace.buffer(('mask', resolution, digit), shape)
+            res = cv2.matchTemplate(mosaic, template, cv2.TM_CCOEFF_NORMED, result=res)
+            for index, (top, roi_h, roi_w) in enumerate(layout):
+                if roi_h < h or roi_w < w:
+                    continue
+                # 该小图内的有效窗口（坐标即小图内坐标）
+                rows, cols = slice(top, top + roi_h - h + 1), slice(0, roi_w - w + 1)
+                _threshold_matches(res[rows, cols], (h, w), digit, resolution, matches[index],
+                                   None if mask is None else mask[rows, cols])
+
+    return matches
+
+
+def decode_digit_matches(matches):
+    """非极大值抑制并按x坐标组合成价格"""
+    if not matches:
+        return OcrResult('no_digits', None, '', 0.0, set())
+
+    boxes_wh = [[int(x), int(y), int(w), int(h)] for (x, y, w, h, _, _, _) in matches]
+    scores = [float(conf) for (_, _, _, _, _, conf, _) in matches]
+
+    # OpenCV NMS处理
+    indices = cv2.dnn.NMSBoxes(
+        boxes_wh,
+        scores,
+        score_threshold=0.5,
+        nms_threshold=0.3  # 重叠度>30%则抑制
+    )
+    if indices is None or len(indices) == 0:
+        return OcrResult('no_match', None, '', 0.0, set())
+
+    # 保留NMS筛选后的匹配
+    filtered_matches = []
+    for i in np.asarray(indices).flatten():
+        x, y, w, h, digit, conf, res = matches[i]
+        filtered_matches.append((x, digit, conf, res))
+
+    # 空间聚类与数字序列组合
+    filtered_matches.sort(key=lambda x: x[0])  # 按x坐标排序
+    digits = []
+    confidences = []
+    prev_x = -100
+    used_resolutions = set()
+
+    for x, digit, conf, res in filtered_matches:
+        if abs(x - prev_x) > 5:  # 基础去重
+            digits.append(str(digit))
+            confidences.append(float(conf))
+            prev_x = x
+            used_resolutions.add(res)  # 记录使用的分辨率
+
+    # 结果格式化与校验（置信度取最终采用的数字中最弱的一个，一位认不准整个价格就不可靠）
+    price_str = ''.join(digits)
+    confidence = min(confidences)
+    if not price_str.isdigit():
+        return OcrResult('invalid', None, price_str, confidence, used_resolutions)
+
+    return OcrResult('ok', int(price_str), price_str, confidence, used_resolutions)
+
+
+def binarize_padded(img_bgra, padding_width, workspace=None):
+    """BGRA截图 -> 二值化并四周填充padding_width像素的0
+
+    传入workspace时灰度图写入预分配缓冲区，二值图直接写进填充图的内部区域
+    （填充图只在分配时清零一次，边框始终为0），不再需要copyMakeBorder。
+    """
+    if workspace is None:
+        gray = cv2.cvtColor(img_bgra, cv2.COLOR_BGRA2GRAY)
+        binary = preprocess_image(gray)
+        # 在预处理后，进行填充
+        return cv2.copyMakeBorder(binary,
+                                  padding_width, padding_width,
+                                  padding_width, padding_width,
+                                  cv2.BORDER_CONSTANT, value=0)
+
+    h, w = img_bgra.shape[:2]
+    gray = cv2.cvtColor(img_bgra, cv2.COLOR_BGRA2GRAY, dst=workspace.buffer('gray', (h, w)))
+    padded = workspace.buffer('padded', (h + 2 * padding_width, w + 2 * padding_width), zero=True)
+    preprocess_image(gray, dst=padded[padding_width:padding_width + h, padding_width:padding_width + w])
+    return padded
+
+
+def binarize_price_image(img_bgra, workspace=None):
+    """BGRA截图 -> 二值化并四周填充，作为模板匹配的输入"""
+    return binarize_padded(img_bgra, PRICE_PADDING, workspace)
+
+
+def binary_fingerprint(binary):
+    """二值图前景外接矩形内容的指纹（按位打包后blake2b），没有前景时返回None
+
+    只取外接矩形，同一价格在区域内轻微平移时指纹不变。
+    """
+    x, y, w, h = cv2.boundingRect(binary)  # 8位单通道图直接取非零像素的外接矩形
+    if w == 0:
+        return None
+    digest = hashlib.blake2b(np.packbits(binary[y:y + h, x:x + w]).tobytes(), digest_size=16)
+    digest.update(struct.pack('<II', w, h))
+    return digest.digest()
+
+
+class OcrResultCache:
+    """识别结果LRU缓存，键为binary_fingerprint，命中时跳过模板匹配
+
+    条目数上限max_entries（每条约几百字节），超出时淘汰最久未用的条目，
+    长时间运行内存也不会增长。缓存只对创建时的那套模板有效。
+    只在采集线程中读写，计数器供统计面板读取。
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def reset_counters(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def clear(self):
+        """清空缓存条目（模板更换后调用）"""
+        self.entries.clear()
+
+    def format_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (f"识别缓存: 命中{self.hits} 未命中{self.misses} 淘汰{self.evictions}"
+                f" 命中率{hit_rate:.1%} 条目{len(self.entries)}/{self.max_entries}")
+
+
+def _match_binaries(binaries, templates, perf=None, mosaic=True, workspaces=None, mosaic_workspace=None):
+    """对一组填充后的二值图做模板匹配和NMS，返回OcrResult列表"""
+    t_match = time.perf_counter_ns()
+    if mosaic and len(binaries) > 1:
+        all_matches = match_digit_templates_mosaic(binaries, templates, mosaic_workspace)
+    else:
+        all_matches = [match_digit_templates(binary, templates, workspace)
+                       for binary, workspace in zip(binaries, workspaces or [None] * len(binaries))]
+    t_nms = time.perf_counter_ns()
+
+    results = [decode_digit_matches(matches) for matches in all_matches]
+    if perf is not None:
+        perf.record('match', t_nms - t_match)
+        perf.record('nms', time.perf_counter_ns() - t_nms)
+    return results
+
+
+def recognize_price(img_bgra, templates, perf=None, cache=None, workspace=None):
+    """从BGRA截图中识别价格（预处理 + 多分辨率模板匹配 + NMS），返回OcrResult"""
+    return recognize_prices([img_bgra], templates, perf, cache=cache,
+                            workspaces=None if workspace is None else [workspace])[0]
+
+
+def recognize_prices(images, templates, perf=None, mosaic=True, cache=None,
+                     workspaces=None, mosaic_workspace=None):
+    """同一帧内多个价格区域一起识别，返回OcrResult列表
+
+    mosaic为True且多于一个区域需要匹配时拼图批量匹配，否则逐区域匹配。
+    传入cache时先按二值图指纹查缓存，只有未命中的区域做模板匹配。
+    workspaces（每个区域一个）和mosaic_workspace为预分配缓冲区，省略时每帧新分配。
+    """
+    # 1. 图像预处理
+    t_pre = time.perf_counter_ns()
+    binaries = [binarize_price_image(img, workspace)
+                for img, workspace in zip(images, workspaces or [None] * len(images))]
+    if perf is not None:
+        perf.record('preprocess', time.perf_counter_ns() - t_pre)
+    results = [None] * len(binaries)
+    keys = [None] * len(binaries)
+
+    # 2. 查缓存
+    if cache is not None:
+        for index, binary in enumerate(binaries):
+            keys[index] = binary_fingerprint(binary)
+            if keys[index] is not None:
+                results[index] = cache.get(keys[index])
+
+    # 3. 模板匹配、NMS与数字组合
+    pending = [index for index, result in enumerate(results) if result is None]
+    if pending:
+        matched = _match_binaries([binaries[i] for i in pending], templates, perf, mosaic,
+                                  workspaces and [workspaces[i] for i in pending], mosaic_workspace)
+        for index, result in zip(pending, matched):
+            results[index] = result
+            if cache is not None and keys[index] is not None:
+                cache.put(keys[index], result)
+    return results
+
+
+class MatchModeSelector:
+    """多区域识别时在逐区域匹配和拼图匹配之间自动选择
+
+    拼图是否更快取决于OpenCV的线程数和区域尺寸（单线程下大图的matchTemplate反而更慢），
+    所以前TRIAL_FRAMES帧两种方式交替计时，之后固定使用中位耗时较低的一种。
+    """
+    TRIAL_FRAMES = 20
+
+    def __init__(self):
+        self.trials = {True: [], False: []}
+        self.mosaic = None  # 选定前为None
+
+    def recognize(self, images, templates, perf=None, cache=None, workspaces=None, mosaic_workspace=None):
+        if len(images) == 1 or self.mosaic is not None:
+            return recognize_prices(images, templates, perf, mosaic=bool(self.mosaic), cache=cache,
+                                    workspaces=workspaces, mosaic_workspace=mosaic_workspace)
+
+        # 计时阶段不查缓存，否则命中会干扰两种方式的对比
+        mode = len(self.trials[True]) <= len(self.trials[False])
+        t0 = time.perf_counter_ns()
+        results = recognize_prices(images, templates, perf, mosaic=mode,
+                                   workspaces=workspaces, mosaic_workspace=mosaic_workspace)
+        self.trials[mode].append(time.perf_counter_ns() - t0)
+
+        if len(self.trials[False]) >= self.TRIAL_FRAMES // 2:
+            mosaic_ns = sorted(self.trials[True])[len(self.trials[True]) // 2]
+            per_roi_ns = sorted(self.trials[False])[len(self.trials[False]) // 2]
+            self.mosaic = mosaic_ns < per_roi_ns
+            LOG.info('match_mode', f"多区域识别: 拼图 {mosaic_ns / 1e6:.2f}ms / 逐区域 {per_roi_ns / 1e6:.2f}ms，"
+                                   f"使用{'拼图' if self.mosaic else '逐区域'}匹配")
+        return results
+
+
+# ==================== 复核识别部分 ====================
+# 模板匹配置信度偏低或位数突变时，交给Tesseract（或PaddleOCR）在后台线程复核
+TESSERACT_DEFAULT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+
+def _load_tesseract():
+    """返回识别函数(灰度图)->文本，未安装时抛出异常"""
+    import pytesseract
+    if os.name == 'nt' and os.path.exists(TESSERACT_DEFAULT_CMD):
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_DEFAULT_CMD
+    pytesseract.get_tesseract_version()  # 找不到可执行文件时抛出异常
+    config = '--psm 7 -c tessedit_char_whitelist=0123456789,'
+    return lambda gray: pytesseract.image_to_string(gray, config=config)
+
+
+def _load_paddleocr():
+    """返回识别函数(灰度图)->文本，未安装时抛出异常"""
+    from paddleocr import PaddleOCR
+    engine = PaddleOCR(lang='en', use_doc_orientation_classify=False,
+                       use_doc_unwarping=False, use_textline_orientation=False)
+
+    def recognize(gray):
+        image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        texts = []
+        for page in engine.predict(image):
+            texts.extend(page['rec_texts'])
+        return ''.join(texts)
+    return recognize
+
+
+VERIFY_BACKENDS = (
+    ('tesseract', _load_tesseract),
+    ('paddleocr', _load_paddleocr),
+)
+
+
+def parse_verified_price(text):
+    """从复核引擎的文本中取出价格，没有数字时返回None"""
+    digits = re.sub(r'\D', '', text or '')
+    return int(digits) if digits else None
+
+
+def prepare_verify_image(img_bgra):
+    """放大并转为白底黑字，OCR引擎对这种输入最稳定"""
+    gray = cv2.cvtColor(img_bgra, cv2.COLOR_BGRA2GRAY)
+    gray = cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return cv2.copyMakeBorder(binary, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=255)
+
+
+def read_price_offline(img_bgra):
+    """用第一个可用的离线OCR引擎同步识别价格，没有可用引擎或读不出时返回None"""
+    for name, loader in VERIFY_BACKENDS:
+        try:
+            return parse_verified_price(loader()(prepare_verify_image(img_bgra)))
+        except Exception as e:
+            print(f"离线识别引擎{name}不可用: {e}")
+    return None
+
+
+class PriceVerifier:
+    """低置信度价格的第二意见识别
+
+    单个后台线程运行，首次使用时才加载识别库（可能需要数秒）。
+    同一时间只处理一张图，忙时直接丢弃新请求，不会拖慢采集线程。
+    结果通过回调callback(price或None)返回，回调在复核线程中执行。
+    """
+
+    def __init__(self, perf=None, backends=VERIFY_BACKENDS):
+        self.perf = perf
+        self.backends = backends
+        self.backend_name = None
+        self.recognize_text = None
+        self.available = None  # None:未加载, True:可用, False:没有可用的识别库
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="verify")
+        self.lock = threading.Lock()
+        self.busy = False
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+
+    def submit(self, img_bgra, callback):
+        """提交复核，返回是否被接受"""
+        if self.available is False:
+            return False
+        with self.lock:
+            if self.busy:
+                self.dropped += 1
+                return False
+            self.busy = True
+            self.submitted += 1
+        self.executor.submit(self._run, img_bgra.copy(), callback)
+        return True
+
+    def _load_backend(self):
+        errors = {}
+        for name, loader in self.backends:
+            try:
+                self.recognize_text = loader()
+                self.backend_name = name
+                self.available = True
+                LOG.info('verify.backend', f"复核识别引擎: {name}")
+                return
+            except Exception as e:
+                errors[name] = str(e)
+        self.available = False
+        LOG.warning('verify.unavailable',
+                    "没有可用的复核识别引擎，低置信度读数将不经复核直接确认"
+                    "（需要pytesseract模块和Tesseract-OCR程序，见requirements-runtime.txt）",
+                    **errors)
+
+    def _run(self, img_bgra, callback):
+        try:
+            if self.available is None:
+                self._load_backend()
+            if not self.available:
+                return
+            t0 = time.perf_counter_ns()
+            price = parse_verified_price(self.recognize_text(prepare_verify_image(img_bgra)))
+            if self.perf is not None:
+                self.perf.record('verify', time.perf_counter_ns() - t0)
+            self.completed += 1
+            callback(price)
+        except Exception as e:
+            LOG.error('verify', f"复核识别失败: {e}")
+        finally:
+            with self.lock:
+                self.busy = False
+
+    def format_stats(self):
+        if self.available is False:
+            return "复核识别: 无可用引擎（未安装Tesseract/PaddleOCR）"
+        return (f"复核识别({self.backend_name or '未加载'}): 提交{self.submitted}"
+                f" 完成{self.completed} 忙时丢弃{self.dropped}")
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class PriceTracker:
+    """单个商品的价格跟踪
+
+    快速路径（模板匹配）的读数先作为暂定价格；置信度足够且位数没有突变时立即确认，
+    否则等复核结果：一致则确认，不一致则作废，直到读数变化。
+    只有确认的价格才用于购买判断。复核不可用时暂定价格直接确认（与原来行为一致）。
+    """
+    LOW_CONFIDENCE = 0.75  # 低于此置信度需要复核
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tentative = None
+        self.confirmed = None
+        self.last_confirmed = None  # 最近一次确认的价格，用于判断位数突变
+        self.rejected = False
+        self.verifying = False
+        self.sequence = 0  # 暂定价格每变化一次加1，过期的复核结果据此丢弃
+
+    def observe(self, result, verify_available=True):
+        """记录一次快速路径结果，需要复核时返回序号，否则返回None"""
+        with self.lock:
+            if result.status != 'ok':
+                self.tentative = self.confirmed = None
+                self.rejected = self.verifying = False
+                return None
+
+            value = result.value
+            if value != self.tentative:
+                self.sequence += 1
+                self.tentative = value
+                self.confirmed = None
+                self.rejected = self.verifying = False
+                jump = (self.last_confirmed is not None
+                        and len(str(value)) != len(str(self.last_confirmed)))
+                if not verify_available or (result.confidence >= self.LOW_CONFIDENCE and not jump):
+                    self._confirm(value)
+                    return None
+
+            if self.confirmed is None and not self.rejected and not self.verifying:
+                self.verifying = True
+                return self.sequence
+            return None
+
+    def cancel_verify(self, sequence):
+        """复核请求没有被接受（复核线程忙），下一帧再试"""
+        with self.lock:
+            if sequence == self.sequence:
+                self.verifying = False
+
+    def verify(self, sequence, price):
+        """复核结果（复核线程中调用），price为None表示复核引擎也读不出，沿用快速路径结果"""
+        with self.lock:
+            if sequence != self.sequence:
+                return
+            self.verifying = False
+            if price is None or price == self.tentative:
+                self._confirm(self.tentative)
+            else:
+                self.rejected = True
+
+    def _confirm(self, value):
+        self.confirmed = value
+        self.last_confirmed = value
+
+    @property
+    def price(self):
+        """用于购买判断的价格"""
+        return self.confirmed
+
+    @property
+    def pending(self):
+        """等待复核的暂定价格（已确认或已作废时为None），供预判点击提前移动光标"""
+        if self.confirmed is None and not self.rejected:
+            return self.tentative
+        return None
+
+    def status_text(self):
+        if self.verifying:
+            return "复核中"
+        if self.rejected:
+            return "复核不一致"
+        return ""
+
+
+# ==================== 价格统计部分 ====================
+# 确认后的价格按商品做流式统计（分位数草图+EWMA+最值），内存与读数数量无关，
+# 退出时保存、启动时合并，用于根据真实行情选择最低价/最高价
+class KllSketch:
+    """KLL分位数草图
+
+    每层一个压缩器，第h层每个元素代表2^h个读数；某层超过容量时排序后随机取奇数位或偶数位
+    晋升到上一层。顶层容量k，往下每层按c递减，保留的元素总数约为k/(1-c)，
+    分位数的秩误差约为1.7/k（k=200时约1%）。
+    """
+    DEFAULT_K = 200
+    DECAY = 2 / 3
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self.rng = random.Random(seed)
+        self.retained = 0
+        self.max_retained = self._max_retained()
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(self.k * self.DECAY ** depth + 0.5))
+
+    def _retained(self):
+        return sum(len(level) for level in self.levels)
+
+    def _max_retained(self):
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def update(self, value):
+        """加入一个读数"""
+        self.levels[0].append(value)
+        self.count += 1
+        self.retained += 1
+        if self.retained >= self.max_retained:
+            self._compress()
+
+    def _compress(self):
+        """压缩第一个超过容量的层"""
+        for level, items in enumerate(self.levels):
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                    self.max_retained = self._max_retained()
+                items.sort()
+                # 奇数个时留下一个，保证晋升的元素成对
+                keep = [items.pop()] if len(items) % 2 else []
+                offset = self.rng.randint(0, 1)
+                promoted = items[offset::2]
+                self.levels[level + 1].extend(promoted)
+                self.retained -= len(items) - len(promoted)
+                self.levels[level] = keep
+                return
+
+    def merge(self, other):
+        """合并另一个草图（如上次会话保存的统计）"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        self.max_retained = self._max_retained()
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self.retained = self._retained()
+        while self.retained >= self.max_retained:
+            self._compress()
+
+    def quantile(self, q):
+        """返回q分位（0~1）的近似值，无数据时返回None"""
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+        if not weighted:
+            return None
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return value
+        return weighted[-1][0]
+
+    def to_dict(self):
+        return {'k': self.k, 'count': self.count, 'levels': [list(items) for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(int(data.get('k', cls.DEFAULT_K)))
+        sketch.levels = [list(items) for items in data.get('levels', [])] or [[]]
+        sketch.count = int(data.get('count', 0))
+        sketch.retained = sketch._retained()
+        sketch.max_retained = sketch._max_retained()
+        return sketch
+
+
+class PriceStats:
+    """单个商品的流式价格统计：分位数草图、EWMA、最低/最高价和读数次数"""
+    EWMA_ALPHA = 0.1
+
+    def __init__(self, sketch=None):
+        self.sketch = sketch or KllSketch()
+        self.ewma = None
+        self.min = None
+        self.max = None
+        self.last = None
+
+    @property
+    def count(self):
+        return self.sketch.count
+
+    def update(self, price):
+        self.sketch.update(price)
+        self.last = price
+        self.ewma = price if self.ewma is None else self.ewma + self.EWMA_ALPHA * (price - self.ewma)
+        self.min = price if self.min is None else min(self.min, price)
+        self.max = price if self.max is None else max(self.max, price)
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def snapshot(self):
+        """返回统计摘要字典"""
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'ewma': round(self.ewma, 1) if self.ewma is not None else None,
+            'p10': self.quantile(0.1),
+            'p25': self.quantile(0.25),
+            'p50': self.quantile(0.5),
+            'p75': self.quantile(0.75),
+            'p90': self.quantile(0.9),
+        }
+
+    def to_dict(self):
+        return dict(self.snapshot(), sketch=self.sketch.to_dict())
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(KllSketch.from_dict(data.get('sketch', {})))
+        stats.ewma = data.get('ewma')
+        stats.min = data.get('min')
+        stats.max = data.get('max')
+        return stats
+
+
+class PriceStatsBook:
+    """按商品汇总的价格统计（采集线程写入，界面线程读取）
+
+    商品以"名称@价格区域"识别：主商品的名称固定，框选到别的商品（区域变化）后另起一份统计，
+    换回原区域时继续之前的统计。只保留最近更新的MAX_ITEMS份。
+    """
+    FORMAT_VERSION = 2
+    MAX_ITEMS = 50
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.lock = threading.Lock()
+        self.items = OrderedDict()  # 标识 -> (名称, PriceStats)，按最近更新排序
+        if self.path is not None and self.path.exists():
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') != self.FORMAT_VERSION:
+                    raise ValueError("旧版本的统计文件（按名称统计）")
+                for key, item in data.get('items', {}).items():
+                    self.items[key] = (item['name'], PriceStats.from_dict(item))
+            except (OSError, ValueError, TypeError, AttributeError, KeyError) as e:
+                print(f"价格统计文件无法读取，重新开始统计: {e}")
+                self.items.clear()
+
+    @staticmethod
+    def key_of(item):
+        """商品的统计标识：名称@x,y,w,h"""
+        return f"{item.name}@{','.join(str(v) for v in item.region)}"
+
+    def update(self, item, price):
+        """记录一次确认的价格"""
+        key = self.key_of(item)
+        with self.lock:
+            entry = self.items.get(key)
+            if entry is None:
+                entry = self.items[key] = (item.name, PriceStats())
+                while len(self.items) > self.MAX_ITEMS:
+                    self.items.popitem(last=False)
+            else:
+                self.items.move_to_end(key)
+            entry[1].update(price)
+
+    def snapshot(self, item):
+        with self.lock:
+            entry = self.items.get(self.key_of(item))
+            return entry[1].snapshot() if entry is not None else None
+
+    def reset(self, items):
+        """清空指定商品的统计"""
+        with self.lock:
+            for item in items:
+                self.items.pop(self.key_of(item), None)
+
+    def format_summary(self, item):
+        """一行摘要，用于悬浮窗"""
+        stats = self.snapshot(item)
+        if not stats or not stats['count']:
+            return f"{item.name}: 暂无价格统计"
+        return (f"{item.name}: P10 {stats['p10']:,}  P50 {stats['p50']:,}  P90 {stats['p90']:,}"
+                f"  均值 {stats['ewma']:,.0f}  ({stats['count']}次)")
+
+    def format_table(self, items):
+        """当前监控商品的统计，格式化为适合等宽字体显示的文本表格"""
+        lines = [f"{'商品':<10}{'次数':>7}{'最低':>9}{'P10':>9}{'P50':>9}{'P90':>9}{'最高':>9}"]
+        for item in items:
+            stats = self.snapshot(item)
+            if stats and stats['count']:
+                lines.append(f"{item.name:<10}{stats['count']:>7}{stats['min']:>9}{stats['p10']:>9}"
+                             f"{stats['p50']:>9}{stats['p90']:>9}{stats['max']:>9}")
+        return "\n".join(lines)
+
+    def save(self):
+        """写入统计文件（先写临时文件再替换）"""
+        if self.path is None:
+            return None
+        with self.lock:
+            data = {'version': self.FORMAT_VERSION,
+                    'saved_at': datetime.now().isoformat(timespec='seconds'),
+                    'items': {key: dict(stats.to_dict(), name=name) for key, (name, stats) in self.items.items()}}
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        temp_path = self.path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        return self.path
+
+
+# ==================== 模板校准部分 ====================
+# 用户在监控区域中现场采集数字字形，按区域尺寸和DPI保存专用模板，
+# 下次启动直接加载这一套，不再用三套自带模板逐一匹配
+CALIBRATED_RESOLUTION = 'calibrated'
+
+
+def get_screen_dpi():
+    """系统DPI（Windows以外返回96）"""
+    try:
+        return int(ctypes.windll.user32.GetDpiForSystem())
+    except Exception:
+        return 96
+
+
+def get_calibration_dir(region, dpi=None):
+    """校准模板目录：配置目录/templates/<宽>x<高>@<DPI>"""
+    if dpi is None:
+        dpi = get_screen_dpi()
+    return get_config_path().parent / "templates" / f"{region[2]}x{region[3]}@{dpi}"
+
+
+def segment_digit_glyphs(img_bgra):
+    """分割截图中的数字字形
+
+    与识别时相同的二值化后取连通域，水平方向重叠的连通域合并（断笔），
+    高度不到最高字形60%的视为逗号或噪点丢弃。
+    返回按x排序的 [(x, y, w, h)] 和二值图。
+    """
+    gray = cv2.cvtColor(img_bgra, cv2.COLOR_BGRA2GRAY)
+    binary = preprocess_image(gray)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+
+    boxes = []
+    for x, y, w, h, area in sorted(stats[1:count].tolist()):
+        if area < 4:
+            continue
+        if boxes and x < boxes[-1][0] + boxes[-1][2]:
+            # 与前一个框水平重叠，合并
+            px, py, pw, ph = boxes[-1]
+            right, bottom = max(px + pw, x + w), max(py + ph, y + h)
+            px, py = min(px, x), min(py, y)
+            boxes[-1] = (px, py, right - px, bottom - py)
+        else:
+            boxes.append((x, y, w, h))
+
+    if not boxes:
+        return [], binary
+    tallest = max(h for _, _, _, h in boxes)
+    return [box for box in boxes if box[3] >= tallest * 0.6], binary
+
+
+def build_calibrated_templates(binary, boxes, price_text, fallback=None, previous=None):
+    """按用户给出的价格给字形标注数字，生成 {数字: 模板}
+
+    模板四周保留约字高1/4的黑边（与自带模板一样带背景，匹配区分度更好）。
+    同一数字出现多次时取平均；价格中没有出现的数字优先沿用previous
+    （之前校准时现场采集的模板），其余从fallback（自带模板）中选高度最接近的一套缩放补齐。
+    字形数与价格位数不一致时抛出ValueError。
+    返回 ({数字: 模板}, 缩放补齐的数字列表)
+    """
+    digits = [c for c in price_text if c.isdigit()]
+    if len(digits) != len(boxes):
+        raise ValueError(f"检测到{len(boxes)}个数字，但输入的价格有{len(digits)}位")
+
+    glyph_height = int(np.median([h for _, _, _, h in boxes]))
+    margin = max(1, glyph_height // 4)
+    padded = cv2.copyMakeBorder(binary, margin, margin, margin, margin, cv2.BORDER_CONSTANT, value=0)
+    samples = {}
+    for digit, (x, y, w, h) in zip(digits, boxes):
+        samples.setdefault(int(digit), []).append(padded[y:y + h + 2 * margin, x:x + w + 2 * margin])
+
+    templates = {}
+    for digit, crops in samples.items():
+        h, w = crops[0].shape
+        stack = [cv2.resize(crop, (w, h), interpolation=cv2.INTER_AREA).astype(np.float32) for crop in crops]
+        _, templates[digit] = cv2.threshold(np.mean(stack, axis=0).astype(np.uint8), 127, 255, cv2.THRESH_BINARY)
+
+    for digit, template in (previous or {}).items():
+        templates.setdefault(digit, template)
+
+    missing = [digit for digit in range(10) if digit not in templates]
+    if missing and fallback:
+        # 自带模板裁到字形外接矩形（统一为黑底白字），选字高最接近的一套
+        glyph_sets = []
+        for digit_templates in fallback.values():
+            glyphs = {}
+            for digit in missing:
+                template = digit_templates.get(digit)
+                if template is None or template.size == 0:
+                    break
+                if template.mean() > 127:
+                    template = 255 - template
+                points = cv2.findNonZero(template)
+                if points is None:
+                    break
+                x, y, w, h = cv2.boundingRect(points)
+                glyphs[digit] = template[y:y + h, x:x + w]
+            else:
+                glyph_sets.append(glyphs)
+        if glyph_sets:
+            source = min(glyph_sets, key=lambda glyphs: abs(
+                np.median([g.shape[0] for g in glyphs.values()]) - glyph_height))
+            for digit, glyph in source.items():
+                width = max(1, round(glyph.shape[1] * glyph_height / glyph.shape[0]))
+                resized = cv2.resize(glyph, (width, glyph_height), interpolation=cv2.INTER_AREA)
+                _, resized = cv2.threshold(resized, 127, 255, cv2.THRESH_BINARY)
+                templates[digit] = cv2.copyMakeBorder(resized, margin, margin, margin, margin,
+                                                      cv2.BORDER_CONSTANT, value=0)
+    return templates, missing
+
+
+def save_calibrated_templates(templates, directory, meta):
+    """保存校准模板（PNG，imencode写入以兼容中文路径）和说明文件"""
+    directory = Path(directory)
+    directory.mkdir(exist_ok=True, parents=True)
+    for digit, template in templates.items():
+        ok, data = cv2.imencode('.png', template)
+        if ok:
+            with open(directory / f"{digit}.png", 'wb') as f:
+                f.write(data.tobytes())
+    with open(directory / "calibration.json", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def load_calibration_meta(directory):
+    """读取校准说明文件，不存在时返回None"""
+    try:
+        with open(Path(directory) / "calibration.json", encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_calibrated_templates(directory):
+    """加载校准模板，返回 {CALIBRATED_RESOLUTION: {数字: 模板}}；不存在或不完整时返回None"""
+    directory = Path(directory)
+    if not (directory / "calibration.json").exists():
+        return None
+    load_vision_modules()
+    digit_templates = {}
+    for digit in range(10):
+        try:
+            with open(directory / f"{digit}.png", 'rb') as f:
+                template = cv2.imdecode(np.frombuffer(f.read(), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        except OSError:
+            return None
+        if template is None:
+            return None
+        digit_templates[digit] = template
+    return {CALIBRATED_RESOLUTION: digit_templates}
+
+
+def calibration_stamp(directory):
+    """校准版本标识（说明文件的修改时间和校准ID），未校准时返回None
+
+    目录只按区域尺寸和DPI区分，同一尺寸重新校准后目录不变，这个标识会变。
+    """
+    try:
+        mtime_ns = (Path(directory) / "calibration.json").stat().st_mtime_ns
+    except OSError:
+        return None
+    meta = load_calibration_meta(directory) or {}
+    return mtime_ns, meta.get('calibration_id'), meta.get('calibrated_at')
+
+
+class TemplateSource:
+    """采集线程使用的数字模板
+
+    主商品区域有校准模板时只用校准模板，否则用自带的三套模板。区域尺寸变化或重新校准时重新加载，
+    同时清空识别缓存（缓存只对建立时的那套模板有效）。
+    calibration_dir/bundled可替换，供benchmarks/soak.py在临时目录中检查重新校准。
+    """
+
+    def __init__(self, cache=None, calibration_dir=None, bundled=None):
+        self.cache = cache
+        self.calibration_dir = calibration_dir or get_calibration_dir
+        self.bundled = bundled
+        self.key = None
+        self.templates = None
+
+    def refresh(self, region):
+        """按区域检查校准是否变化，模板被替换时返回True"""
+        directory = self.calibration_dir(region)
+        key = (directory, calibration_stamp(directory))
+        if key == self.key:
+            return False
+        self.key = key
+        templates = load_calibrated_templates(directory) if key[1] is not None else None
+        if templates is None:
+            if self.bundled is None:
+                self.bundled = load_digit_templates()
+            templates = self.bundled
+        if templates is self.templates:
+            return False
+        self.templates = templates
+        if self.cache is not None:
+            self.cache.clear()
+        return True
+
+
+# ==================== 会话事件记录部分 ====================
+EVENT_PRICE = 1
+EVENT_CLICK = 2
+EVENT_SUCCESS = 3
+EVENT_REFRESH = 4
+
+# 事件类型 -> (名称, 负载格式, 字段名)；item为监控列表中的商品序号
+EVENT_FORMATS = {
+    EVENT_PRICE: ('price', struct.Struct('<Bqf'), ('item', 'price', 'confidence')),
+    EVENT_CLICK: ('click', struct.Struct('<Bq'), ('item', 'price')),
+    EVENT_SUCCESS: ('success', struct.Struct('<Bf'), ('item', 'confidence')),
+    EVENT_REFRESH: ('refresh', struct.Struct('<I'), ('cycle',)),
+}
+EVENT_HEADER = struct.Struct('<HBd')  # 负载长度、事件类型、时间戳（秒）
+EVENT_FILE_MAGIC = b"DSEV2\n"
+
+SessionEvent = namedtuple('SessionEvent', ['type', 'name', 'timestamp', 'fields'])
+
+
+def encode_event(event_type, timestamp, values):
+    """把一个事件编码为带长度前缀的二进制记录"""
+    payload = EVENT_FORMATS[event_type][1].pack(*values)
+    return EVENT_HEADER.pack(len(payload), event_type, timestamp) + payload
+
+
+def decode_events(data):
+    """解码一段二进制记录，遇到不完整的尾部记录（如写入中途崩溃）时停止"""
+    offset = 0
+    size = len(data)
+    while offset + EVENT_HEADER.size <= size:
+        length, event_type, timestamp = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        if offset + length > size:
+            return
+        payload = data[offset:offset + length]
+        offset += length
+
+        event_format = EVENT_FORMATS.get(event_type)
+        if event_format is None or event_format[1].size != length:
+            # 未知事件类型（新版本写入）直接跳过
+            continue
+        name, payload_struct, field_names = event_format
+        yield SessionEvent(event_type, name, timestamp, dict(zip(field_names, payload_struct.unpack(payload))))
+
+
+def read_events(source, event_types=None, since=None, until=None):
+    """读取事件文件或目录（按文件名即时间顺序），可按类型和时间范围过滤
+
+    since/until 为时间戳（秒）或datetime。
+    """
+    if isinstance(since, datetime):
+        since = since.timestamp()
+    if isinstance(until, datetime):
+        until = until.timestamp()
+
+    source = Path(source)
+    paths = sorted(source.glob("events_*.dsev")) if source.is_dir() else [source]
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(EVENT_FILE_MAGIC):
+            print(f"跳过无法识别的事件文件: {path}")
+            continue
+        for event in decode_events(memoryview(data)[len(EVENT_FILE_MAGIC):]):
+            if event_types is not None and event.type not in event_types:
+                continue
+            if since is not None and event.timestamp < since:
+                continue
+            if until is not None and event.timestamp > until:
+                continue
+            yield event
+
+
+class SessionEventStore:
+    """追加写入的会话事件存储
+
+    热循环中的append()只把元组放进有界队列，不做编码也不碰磁盘；
+    后台线程批量编码写入，文件超过大小上限时滚动到新文件；滚动时按文件数和总字节数上限
+    删除最旧的事件文件（包括以前会话的），当前文件不删。
+    队列满时丢弃事件并计数，绝不阻塞调用方。
+    设置了publisher（EventPublisher）时，同一批编码结果也推送给本机订阅者。
+    """
+
+    def __init__(self, directory, max_file_bytes=16 * 1024 * 1024, batch_interval=0.5, queue_size=65536,
+                 max_files=64, max_total_bytes=256 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.max_total_bytes = max_total_bytes
+        self.batch_interval = batch_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self.session = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.file_index = 0
+        self.file = None
+        self.file_bytes = 0
+        self.publisher = None
+        self.thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+        self.thread.start()
+
+    def append(self, event_type, *values):
+        """记录一个事件（非阻塞）"""
+        try:
+            self.queue.put_nowait((event_type, time.time(), values))
+        except queue.Full:
+            self.dropped += 1
+
+    def _open_next_file(self):
+        if self.file is not None:
+            self.file.close()
+        self.file_index += 1
+        path = self.directory / f"events_{self.session}_{self.file_index:04d}.dsev"
+        self.file = open(path, 'ab')
+        self.file.write(EVENT_FILE_MAGIC)
+        self.file_bytes = len(EVENT_FILE_MAGIC)
+        self._prune(path)
+
+    def _prune(self, current):
+        """按文件数和总字节数上限删除最旧的事件文件（文件名按时间排序）"""
+        try:
+            paths = [p for p in sorted(self.directory.glob("events_*.dsev")) if p != current]
+            sizes = [p.stat().st_size for p in paths]
+        except OSError as e:
+            LOG.error('events.prune', f"清理旧事件文件失败: {e}")
+            return
+        total = sum(sizes) + self.file_bytes
+        count = len(paths) + 1
+        for path, size in zip(paths, sizes):
+            if count <= self.max_files and total <= self.max_total_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError as e:
+                LOG.error('events.prune', f"删除旧事件文件失败: {e}", path=str(path))
+                continue
+            count -= 1
+            total -= size
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self.queue.get(timeout=self.batch_interval)]
+            except queue.Empty:
+                publisher = self.publisher
+                if publisher is not None:
+                    publisher.flush()
+                continue
+            # 一次取空队列，合并成一次写入
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            chunks = []
+            for item in batch:
+                if item is None:
+                    stopping = True
+                    continue
+                event_type, timestamp, values = item
+                try:
+                    chunks.append(encode_event(event_type, timestamp, values))
+                except (KeyError, struct.error) as e:
+                    LOG.error('events.encode', f"事件编码失败: {e}", event_type=event_type)
+            if not chunks:
+                continue
+
+            data = b"".join(chunks)
+            publisher = self.publisher
+            if publisher is not None:
+                publisher.publish(data)
+            try:
+                if self.file is None or self.file_bytes >= self.max_file_bytes:
+                    self._open_next_file()
+                self.file.write(data)
+                self.file.flush()
+                self.file_bytes += len(data)
+                self.written += len(chunks)
+            except OSError as e:
+                LOG.error('events.write', f"写入事件文件失败: {e}", batch=len(chunks))
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def close(self, timeout=2.0):
+        """写完队列中剩余事件后关闭文件"""
+        if not self.thread.is_alive():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+
+class EventPublisher:
+    """本机事件推送：把事件记录（与事件文件相同的二进制格式）实时推送给任意个订阅者
+
+    优先用Unix域套接字，平台不支持或创建失败时改用127.0.0.1上的TCP端口，
+    实际地址写入数据目录的publisher.json，订阅端（subscribe_events）据此连接。
+    publish()在事件写入线程中调用，识别线程没有额外开销；所有连接都是非阻塞的，
+    每个订阅者有积压上限，读得太慢的订阅者直接断开，发布方永不阻塞。
+    """
+    MAX_BACKLOG = 1024 * 1024  # 单个订阅者最多积压的字节数
+    ADDRESS_FILE = "publisher.json"
+    SOCKET_FILE = "events.sock"
+
+    def __init__(self, directory, max_backlog=MAX_BACKLOG, prefer_unix=True):
+        self.directory = Path(directory)
+        self.max_backlog = max_backlog
+        self.lock = threading.Lock()
+        self.subscribers = {}  # 连接 -> 待发送数据
+        self.connected = 0
+        self.dropped = 0
+        self.server, self.address = self._listen(prefer_unix)
+        self.address_path = self.directory / self.ADDRESS_FILE
+        with open(self.address_path, 'w', encoding='utf-8') as f:
+            json.dump(self.address, f)
+        self.running = True
+        self.thread = threading.Thread(target=self._accept_loop, name="event-publisher", daemon=True)
+        self.thread.start()
+
+    def _listen(self, prefer_unix):
+        if prefer_unix and hasattr(socket, 'AF_UNIX'):
+            path = self.directory / self.SOCKET_FILE
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                if path.exists():
+                    path.unlink()  # 上次异常退出留下的套接字文件
+                server.bind(str(path))
+                server.listen(8)
+                return server, {'family': 'unix', 'address': str(path)}
+            except OSError as e:
+                server.close()
+                print(f"Unix域套接字不可用，改用TCP: {e}")
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(8)
+        return server, {'family': 'tcp', 'address': list(server.getsockname())}
+
+    def _accept_loop(self):
+        self.server.settimeout(0.5)
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            conn.setblocking(False)
+            with self.lock:
+                self.subscribers[conn] = bytearray(EVENT_FILE_MAGIC)
+                self.connected += 1
+                self._send(conn)
+
+    def _send(self, conn):
+        """尽量发送积压数据（持有锁时调用），出错或积压超限时断开"""
+        buffer = self.subscribers[conn]
+        try:
+            sent = conn.send(buffer)
+            del buffer[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self._drop(conn)
+            return
+        if len(buffer) > self.max_backlog:
+            self.dropped += 1
+            self._drop(conn)
+
+    def _drop(self, conn):
+        del self.subscribers[conn]
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def publish(self, data):
+        """推送一段已编码的事件记录（事件写入线程调用）"""
+        with self.lock:
+            for conn, buffer in list(self.subscribers.items()):
+                buffer += data
+                self._send(conn)
+
+    def flush(self):
+        """发送之前因对方接收缓冲区满而积压的数据"""
+        with self.lock:
+            for conn, buffer in list(self.subscribers.items()):
+                if buffer:
+                    self._send(conn)
+
+    def format_stats(self):
+        return f"事件推送: {len(self.subscribers)}个订阅者（累计{self.connected}个，断开慢订阅者{self.dropped}个）"
+
+    def close(self):
+        """停止接受连接并断开所有订阅者"""
+        self.running = False
+        self.server.close()
+        self.thread.join(1.0)
+        with self.lock:
+            for conn in list(self.subscribers):
+                self._drop(conn)
+        for path in (self.address_path,
+                     Path(self.address['address']) if self.address['family'] == 'unix' else None):
+            if path is not None:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+
+def subscribe_events(directory=None, address=None, event_types=None):
+    """订阅正在运行的程序推送的事件，逐个生成SessionEvent，发布方关闭或断开时结束
+
+    address为EventPublisher.address，省略时从directory（默认数据目录的events文件夹）中的
+    publisher.json读取。
+    """
+    if address is None:
+        directory = Path(directory) if directory else get_data_dir("events")
+        with open(directory / EventPublisher.ADDRESS_FILE, encoding='utf-8') as f:
+            address = json.load(f)
+    if address['family'] == 'unix':
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(address['address'])
+    else:
+        conn = socket.create_connection(tuple(address['address']))
+
+    with conn:
+        buffer = bytearray()
+        header_checked = False
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                return
+            buffer += chunk
+            if not header_checked:
+                if len(buffer) < len(EVENT_FILE_MAGIC):
+                    continue
+                if not buffer.startswith(EVENT_FILE_MAGIC):
+                    raise ValueError("无法识别的事件流")
+                del buffer[:len(EVENT_FILE_MAGIC)]
+                header_checked = True
+            # 只解码完整的记录，不完整的尾部留到下次
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(buffer):
+                end = offset + EVENT_HEADER.size + EVENT_HEADER.unpack_from(buffer, offset)[0]
+                if end > len(buffer):
+                    break
+                for event in decode_events(bytes(buffer[offset:end])):
+                    if event_types is None or event.type in event_types:
+                        yield event
+                offset = end
+            del buffer[:offset]
+
+
+# ==================== 监控列表部分 ====================
+# 一个监控商品的配置：价格识别区域、价格区间、点击位置和次数上限
+WatchItem = namedtuple('WatchItem', ['name', 'region', 'threshold1', 'threshold2',
+                                     'click_position', 'num_position', 'max_attempts', 'max_success'])
+
+
+def watch_item_from_dict(data):
+    """从配置字典构造WatchItem（列表坐标转为元组）"""
+    return WatchItem(
+        name=str(data['name']),
+        region=tuple(data['region']),
+        threshold1=int(data['threshold1']),
+        threshold2=int(data['threshold2']),
+        click_position=tuple(data['click_position']),
+        num_position=tuple(data['num_position']),
+        max_attempts=int(data.get('max_attempts', 1)),
+        max_success=int(data.get('max_success', 1)),
+    )
+
+
+def watch_item_to_dict(item):
+    """转为可写入配置的字典"""
+    return {key: list(value) if isinstance(value, tuple) else value
+            for key, value in item._asdict().items()}
+
+
+def load_watchlist(config):
+    """从配置读取额外监控商品，跳过损坏的条目"""
+    items = []
+    for data in config.get('watchlist') or []:
+        try:
+            items.append(watch_item_from_dict(data))
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"忽略无效的监控商品配置: {e}")
+    return items
+
+
+def capture_bounds(regions):
+    """多个(x, y, w, h)区域的外接矩形，作为一次截图的范围"""
+    left = min(r[0] for r in regions)
+    top = min(r[1] for r in regions)
+    right = max(r[0] + r[2] for r in regions)
+    bottom = max(r[1] + r[3] for r in regions)
+    return {'left': left, 'top': top, 'width': right - left, 'height': bottom - top}
+
+
+CAPTURE_MERGE_RATIO = 2.0  # 合并后的截图面积不超过各区域面积之和的这个倍数时才合并为一次截图
+
+
+def cluster_regions(regions, merge_ratio=CAPTURE_MERGE_RATIO):
+    """把区域分组，每组截一次图
+
+    相邻的区域合并成一组（外接矩形面积不超过组内区域面积之和的merge_ratio倍），
+    相距很远的区域各自单独截图，避免外接矩形接近全屏。返回区域下标列表的列表。
+    """
+    def area(bounds):
+        return bounds['width'] * bounds['height']
+
+    groups = [[i] for i in range(len(regions))]
+    merged = True
+    while merged and len(groups) > 1:
+        merged = False
+        best = None
+        for a in range(len(groups)):
+            for b in range(a + 1, len(groups)):
+                members = groups[a] + groups[b]
+                covered = sum(regions[i][2] * regions[i][3] for i in members)
+                cost = area(capture_bounds([regions[i] for i in members]))
+                if cost <= merge_ratio * covered and (best is None or cost - covered < best[0]):
+                    best = (cost - covered, a, b)
+        if best is not None:
+            _, a, b = best
+            groups[a] = sorted(groups[a] + groups.pop(b))
+            merged = True
+    return groups
+
+
+def capture_layout(watch_items):
+    """截图分组：[(截图范围, [(商品下标, 行切片, 列切片)])]"""
+    regions = [item.region for item in watch_items]
+    layout = []
+    for group in cluster_regions(regions):
+        bounds = capture_bounds([regions[i] for i in group])
+        slices = [
+            (i,
+             slice(regions[i][1] - bounds['top'], regions[i][1] - bounds['top'] + regions[i][3]),
+             slice(regions[i][0] - bounds['left'], regions[i][0] - bounds['left'] + regions[i][2]))
+            for i in group
+        ]
+        layout.append((bounds, slices))
+    return layout
+
+
+# 引擎运行参数（不可变）：重新配置时整体替换，采集/识别线程在帧与帧之间取用新值
+EngineSettings = namedtuple('EngineSettings', ['watch_items', 'text_region', 'shutdown_time', 'auto_refresh_time',
+                                               'refresh_interval_steps', 'success_window',
+                                               'cpu_budget', 'target_latency', 'runtime', 'speculative'],
+                            defaults=(DEFAULT_RUNTIME, False))
+
+
+def make_engine_settings(threshold1, threshold2, max_attempts, max_success, monitor_region, click_region,
+                         num_region, text_region, shutdown_time=None, auto_refresh_time=None,
+                         refresh_interval_steps=10, success_window=3.0, watchlist=(),
+                         cpu_budget=0.5, target_latency=0.05, runtime=DEFAULT_RUNTIME, speculative=False):
+    """由配置窗口的各项参数构造EngineSettings（主商品 + 监控列表中的额外商品）"""
+    primary = WatchItem("主商品", tuple(monitor_region), threshold1, threshold2,
+                        tuple(click_region), tuple(num_region), max_attempts, max_success)
+    return EngineSettings((primary,) + tuple(watchlist), tuple(text_region), shutdown_time, auto_refresh_time,
+                          refresh_interval_steps, success_window, cpu_budget, target_latency, runtime,
+                          speculative)
+
+
+class WatchItemState:
+    """监控商品的运行时状态（识别结果与计数）"""
+
+    def __init__(self):
+        self.price_value = None  # 已确认的价格
+        self.tentative_value = None  # 等待复核确认的暂定价格
+        self.tentative_since_ns = None  # 该暂定价格首次出现时的截图时刻
+        self.tracker = PriceTracker()
+        self.confidence = 0.0
+        self.event_price = None  # 最近一次写入事件记录的读数（读数变化时才再写）
+        self.qualify_since_ns = None  # 满足条件的价格首次出现时的截图时刻
+        self.click_count = 0
+        self.success_count = 0
+        self.done = False  # 已达次数上限，本轮不再点击
+
+    def reset_counts(self):
+        self.click_count = 0
+        self.success_count = 0
+        self.done = False
+
+
+# ==================== 自动购买控制部分 ====================
+class SystemClock:
+    """真实时钟（perf_counter_ns与阻塞等待）"""
+
+    def now_ns(self):
+        return time.perf_counter_ns()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class PynputInput:
+    """通过pynput操作真实鼠标和键盘"""
+
+    def __init__(self):
+        load_engine_modules()
+        self.mouse = MouseController()
+        self.keyboard = KeyboardController()
+
+    @property
+    def position(self):
+        return self.mouse.position
+
+    @position.setter
+    def position(self, value):
+        self.mouse.position = value
+
+    def click(self):
+        self.mouse.click(Button.left, 1)  # 单次点击
+
+    def press_left(self):
+        self.mouse.press(Button.left)
+
+    def release_left(self):
+        self.mouse.release(Button.left)
+
+    def press_escape(self):
+        self.keyboard.press(Key.esc)
+
+    def release_escape(self):
+        self.keyboard.release(Key.esc)
+
+
+class AutoBuyListener:
+    """AutoBuyController的事件回调，默认什么都不做，按需覆盖
+
+    回调在刷新线程中执行（与原来直接在线程里更新界面的方式一致）。
+    """
+
+    def on_refresh(self, cycle, start_ns, end_ns):
+        """完成一次刷新点击"""
+
+    def on_escape(self, start_ns, end_ns):
+        """按下并松开ESC"""
+
+    def on_click_start(self, item_index, price):
+        """即将点击购买（计数已加1）"""
+
+    def on_clicked(self, item_index, price, capture_ns, decision_ns, click_start_ns, click_end_ns):
+        """购买按钮已点击（光标尚未复位）"""
+
+    def on_click_done(self, item_index):
+        """一次点击完成且未达上限"""
+
+    def on_preposition(self, item_index, price):
+        """预判模式：暂定价格满足条件，光标已移到该商品的数量滑块"""
+
+    def on_preposition_cancelled(self, item_index):
+        """预判落空（暂定价格被否决或等待结束），光标已复位"""
+
+    def on_item_limit(self, item_index, message):
+        """该商品达到次数上限，本轮不再点击，其他商品继续"""
+
+    def on_all_limits(self, item_index, message):
+        """所有商品都达到上限，自动刷新已停止；返回后计数归零"""
+
+    def on_counts_reset(self):
+        """全部计数已归零"""
+
+    def on_refresh_error(self, error):
+        """刷新循环异常退出"""
+
+    def on_click_error(self, item_index, error):
+        """点击过程出错"""
+
+
+class AutoBuyController:
+    """自动刷新、点击购买和次数上限的状态机
+
+    不依赖Tk和pynput：输入设备（position属性、click/press_left/release_left/
+    press_escape/release_escape方法）和时钟（now_ns/sleep）都由调用方注入，
+    界面更新等副作用通过listener（AutoBuyListener）回调完成。
+    OverlayApp用真实鼠标键盘和系统时钟驱动它，benchmarks/simulate.py用虚拟时钟和假输入设备驱动它。
+
+    预判模式（speculative）下，刷新后的等待期间持续检查价格：暂定价格满足条件时先把光标移到
+    数量滑块，确认后立即点击（不再等满刷新间隔，也省去移动光标）；暂定价格被否决或等待结束时
+    把光标移回原处，下一次刷新点击仍在原位置。
+    """
+    STEP = 0.05            # 等待拆分粒度（秒），停止后能及时退出
+    CLICK_SETTLE = 0.01    # 移动鼠标后等待到位
+    CLICK_COOLDOWN = 0.5   # 点击并复位光标后的等待
+    SPECULATE_POLL = 0.005  # 预判模式下检查价格的间隔
+
+    def __init__(self, watch_items, item_states, input_device, clock=None, listener=None,
+                 refresh_interval_steps=10, speculative=False):
+        self.watch_items = watch_items
+        self.item_states = item_states
+        self.input = input_device
+        self.clock = clock or SystemClock()
+        self.listener = listener or AutoBuyListener()
+        self.refresh_interval_steps = refresh_interval_steps
+        self.speculative = speculative
+        self.preposition = None  # 预判中的(商品序号, 光标原位置)
+        self.preposition_hits = 0
+        self.preposition_misses = 0
+        self.refresh_end_ns = None  # 最近一次刷新点击松开的时刻，此前截图的价格属于旧页面
+        self.running = False  # 自动刷新是否进行中
+        self.refresh_cycle = 0
+        self.click_count = 0
+        self.success_count = 0
+        self.success_item_index = 0  # 最近一次点击的商品，成功标志计入该商品
+
+    def wait_steps(self, steps):
+        """等待steps个STEP，期间停止则返回False"""
+        for _ in range(steps):  # 拆分成N次*0.05秒
+            if not self.running:
+                return False
+            self.clock.sleep(self.STEP)
+        return True
+
+    def run_refresh_loop(self):
+        """循环：刷新点击 -> 等待 -> 检查价格并购买 -> ESC -> 等待，直到running变为False"""
+        clock = self.clock
+        try:
+            while self.running:
+                clock.sleep(self.STEP)
+                start_ns = clock.now_ns()
+                self.input.press_left()
+                clock.sleep(self.STEP)
+                self.input.release_left()
+                self.refresh_cycle += 1
+                self.refresh_end_ns = clock.now_ns()
+                self.listener.on_refresh(self.refresh_cycle, start_ns, self.refresh_end_ns)
+                if self.speculative:
+                    waited = self.wait_for_price(self.refresh_interval_steps)
+                else:
+                    waited = self.wait_steps(self.refresh_interval_steps)
+                if not waited:
+                    self.cancel_preposition()
+                    return
+
+                self.try_buy()
+                self.cancel_preposition()
+                # ESC按键
+                if not self.running:
+                    return
+                start_ns = clock.now_ns()
+                self.input.press_escape()
+                clock.sleep(self.STEP)
+                self.input.release_escape()
+                self.listener.on_escape(start_ns, clock.now_ns())
+                if not self.wait_steps(self.refresh_interval_steps):
+                    return
+        except Exception as e:
+            self.listener.on_refresh_error(e)
+
+    def wait_for_price(self, steps):
+        """预判模式的刷新后等待：确认的价格满足条件时提前返回，期间停止则返回False"""
+        clock = self.clock
+        deadline = clock.now_ns() + int(steps * self.STEP * 1e9)
+        while clock.now_ns() < deadline:
+            if not self.running:
+                return False
+            if self.find_candidate() is not None:
+                return True
+            self.update_preposition()
+            clock.sleep(self.SPECULATE_POLL)
+        return self.running
+
+    def find_candidate(self, tentative=False):
+        """返回第一个价格满足条件且未达上限的商品序号；tentative为True时看暂定价格
+
+        只接受刷新点击之后截图得到的价格：识别有延迟，刷新后的头几帧可能还是旧页面。
+        """
+        refresh_end_ns = self.refresh_end_ns
+        for index, (item, state) in enumerate(zip(self.watch_items, self.item_states)):
+            if tentative:
+                price, since_ns = state.tentative_value, state.tentative_since_ns
+            else:
+                price, since_ns = state.price_value, state.qualify_since_ns
+            if state.done or price is None or not item.threshold1 < price < item.threshold2:
+                continue
+            if refresh_end_ns is not None and (since_ns is None or since_ns <= refresh_end_ns):
+                continue
+            return index
+        return None
+
+    def update_preposition(self):
+        """按暂定价格移动或复位光标"""
+        index = self.find_candidate(tentative=True)
+        current = self.preposition[0] if self.preposition is not None else None
+        if index == current:
+            return
+        if index is None:
+            self.cancel_preposition()
+            return
+        original_pos = self.preposition[1] if self.preposition is not None else self.input.position
+        self.input.position = self.watch_items[index].num_position
+        self.preposition = (index, original_pos)
+        self.listener.on_preposition(index, self.item_states[index].tentative_value)
+
+    def cancel_preposition(self):
+        """预判落空：光标移回原位置"""
+        if self.preposition is None:
+            return
+        index, original_pos = self.preposition
+        self.preposition = None
+        self.input.position = original_pos
+        self.preposition_misses += 1
+        self.listener.on_preposition_cancelled(index)
+
+    def try_buy(self):
+        """依次检查各监控商品，每轮最多购买一个（点击后页面会变化），返回是否点击"""
+        index = self.find_candidate()
+        if index is None:
+            return False
+        state = self.item_states[index]
+        decision_ns = self.clock.now_ns()
+        self.perform_click(state.price_value, state.qualify_since_ns or decision_ns, decision_ns, index)
+        return True
+
+    def perform_click(self, price, capture_ns=None, decision_ns=None, item_index=0):
+        """在指定商品的位置执行点击，并处理次数上限"""
+        item = self.watch_items[item_index]
+        state = self.item_states[item_index]
+        clock = self.clock
+        try:
+            state.click_count += 1
+            self.click_count += 1
+            self.listener.on_click_start(item_index, price)
+
+            click_start_ns = clock.now_ns()
+            preposition, self.preposition = self.preposition, None
+            if preposition is None:
+                original_pos = self.input.position  # 保存原始位置
+            else:
+                original_pos = preposition[1]  # 预判时已移动过光标
+            # 先点数量滑块，再点购买按钮（预判命中时光标已在数量滑块上）
+            if preposition is not None and preposition[0] == item_index:
+                self.preposition_hits += 1
+            else:
+                if preposition is not None:
+                    self.preposition_misses += 1
+                self.input.position = item.num_position
+            self.input.click()
+            clock.sleep(self.CLICK_SETTLE)
+            self.input.position = item.click_position
+            clock.sleep(self.CLICK_SETTLE)
+            self.input.click()
+            click_end_ns = clock.now_ns()
+            if decision_ns is None:
+                decision_ns = click_start_ns
+            self.success_item_index = item_index
+            self.listener.on_clicked(item_index, price, capture_ns or decision_ns, decision_ns,
+                                     click_start_ns, click_end_ns)
+            clock.sleep(self.CLICK_SETTLE)
+
+            # 返回原始位置
+            self.input.position = original_pos
+            clock.sleep(self.CLICK_COOLDOWN)
+
+            limit_message = None
+            if state.click_count >= item.max_attempts:
+                limit_message = f"已达到最多尝试次数({item.max_attempts})"
+            elif state.success_count >= item.max_success:
+                limit_message = f"已达最多成功次数({item.max_success})"
+
+            if limit_message is None:
+                self.listener.on_click_done(item_index)
+                return
 
+            # 该商品本轮结束，其他商品仍继续
+            state.reset_counts()
+            state.done = True
+            if not all(s.done for s in self.item_states):
+                self.listener.on_item_limit(item_index, limit_message)
+                return
 
-def save_config(config):
-    """加密并保存配置"""
-    encrypted = encrypt_config(config)
-    config_path = get_config_path()
+            # 所有商品都已结束：停止自动刷新，计数归零
+            self.running = False
+            self.listener.on_all_limits(item_index, limit_message)
+            for s in self.item_states:
+                s.reset_counts()
+            self.click_count = 0
+            self.success_count = 0
+            self.listener.on_counts_reset()
+        except Exception as e:
+            self.listener.on_click_error(item_index, e)
 
-    # 确保目录存在
-    config_path.parent.mkdir(exist_ok=True, parents=True)
+    def record_success(self):
+        """成功标志上升沿（成功检测线程调用），计入最近一次点击的商品，返回商品序号"""
+        index = self.success_item_index
+        self.item_states[index].success_count += 1
+        self.success_count += 1
+        return index
 
-    with open(config_path, 'w') as f:
-        f.write(encrypted)
 
-# ====== 新增关机功能 ======
-def shutdown_computer():
-    """执行关机命令，支持Windows和Linux系统"""
-    try:
-        system_name = platform.system()
-        if system_name == "Windows":
-            # Windows关机命令（立即关机）
-            os.system("shutdown /s /t 0")
-        elif system_name == "Linux":
-            # Linux关机命令
-            os.system("sudo shutdown -h now")
-        else:
-            print(f"不支持的系统: {system_name}")
-    except Exception as e:
-        print(f"关机失败: {str(e)}")
+def get_data_dir(name):
+    """获取配置目录下的数据子目录（统计、日志等）"""
+    data_dir = get_config_path().parent / name
+    data_dir.mkdir(exist_ok=True, parents=True)
+    return data_dir
 
 
 class RegionSelector:
@@ -349,11 +3205,194 @@ class RegionSelector:
         return self.region
 
 
+class WatchlistEditor:
+    """额外监控商品编辑窗口（模态）"""
+
+    def __init__(self, parent, items):
+        self.items = list(items)
+        self.top = tk.Toplevel(parent)
+        self.top.title("监控列表")
+        self.top.attributes('-topmost', True)
+        self.top.resizable(False, False)
+
+        tk.Label(self.top,
+                 text="主商品使用主界面的设置，这里添加同时监控的其他商品",
+                 font=("微软雅黑", 8),
+                 fg="#666").pack(padx=10, pady=(10, 0))
+
+        self.listbox = tk.Listbox(self.top, width=60, height=8, font=("微软雅黑", 9))
+        self.listbox.pack(padx=10, pady=10)
+
+        btn_frame = tk.Frame(self.top)
+        btn_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        tk.Button(btn_frame, text="添加商品", command=self.add_item,
+                  font=("微软雅黑", 9)).pack(side=tk.LEFT)
+        tk.Button(btn_frame, text="删除选中", command=self.remove_item,
+                  font=("微软雅黑", 9)).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="完成", command=self.top.destroy,
+                  font=("微软雅黑", 9), bg="#4CAF50", fg="white").pack(side=tk.RIGHT)
+
+        self.refresh_list()
+        self.top.grab_set()
+        self.top.wait_window()
+
+    def refresh_list(self):
+        self.listbox.delete(0, tk.END)
+        for item in self.items:
+            x, y, w, h = item.region
+            self.listbox.insert(tk.END, f"{item.name}  {item.threshold1:,}~{item.threshold2:,}HV＄"
+                                        f"  区域({x},{y})-WH({w}x{h})")
+
+    def _select_point(self, title):
+        """框选区域并返回中心点"""
+        region = RegionSelector(self.top, title).get_region()
+        if not region:
+            return None
+        return region[0] + region[2] // 2, region[1] + region[3] // 2
+
+    def add_item(self):
+        """依次询问名称、区域、点击位置和价格区间，任一步取消则放弃"""
+        name = simpledialog.askstring("添加商品", "商品名称:", parent=self.top)
+        if not name:
+            return
+        region = RegionSelector(self.top, f"请框选「{name}」的价格区域").get_region()
+        if not region:
+            return
+        num_position = self._select_point(f"请框选「{name}」的数量滑块")
+        if not num_position:
+            return
+        click_position = self._select_point(f"请框选「{name}」的购买按钮")
+        if not click_position:
+            return
+
+        threshold1 = simpledialog.askinteger("价格下限", "低于此值不触发:", parent=self.top, minvalue=1)
+        if threshold1 is None:
+            return
+        threshold2 = simpledialog.askinteger("价格上限", "高于此值不触发:", parent=self.top,
+                                             minvalue=threshold1 + 1)
+        if threshold2 is None:
+            return
+        max_attempts = simpledialog.askinteger("最多点击次数", "达到此次数后停止点击该商品:",
+                                               parent=self.top, minvalue=1, initialvalue=1)
+        if max_attempts is None:
+            return
+        max_success = simpledialog.askinteger("最多成功次数", "达到此次数后停止点击该商品:",
+                                              parent=self.top, minvalue=1, initialvalue=1)
+        if max_success is None:
+            return
+
+        self.items.append(WatchItem(name, tuple(region), threshold1, threshold2,
+                                    click_position, num_position, max_attempts, max_success))
+        self.refresh_list()
+
+    def remove_item(self):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        del self.items[selection[0]]
+        self.refresh_list()
+
+
+class CalibrationDialog:
+    """数字模板校准窗口（模态）：显示截图与分割出的数字，输入当前价格后生成专用模板"""
+
+    PREVIEW_SCALE = 3
+
+    def __init__(self, parent, img_bgra, region):
+        self.img_bgra = img_bgra
+        self.region = region
+        self.directory = get_calibration_dir(region)
+        self.boxes, self.binary = segment_digit_glyphs(img_bgra)
+        self.saved = False
+
+        self.top = tk.Toplevel(parent)
+        self.top.title("数字模板校准")
+        self.top.attributes('-topmost', True)
+        self.top.resizable(False, False)
+
+        # 截图预览（放大显示）并标出分割出的数字
+        h, w = img_bgra.shape[:2]
+        scale = self.PREVIEW_SCALE
+        rgb = cv2.cvtColor(img_bgra, cv2.COLOR_BGRA2RGB)
+        self.tk_img = ImageTk.PhotoImage(Image.fromarray(rgb).resize((w * scale, h * scale), Image.NEAREST))
+        canvas = tk.Canvas(self.top, width=w * scale, height=h * scale, highlightthickness=0)
+        canvas.pack(padx=10, pady=10)
+        canvas.create_image(0, 0, anchor=tk.NW, image=self.tk_img)
+        for x, y, bw, bh in self.boxes:
+            canvas.create_rectangle(x * scale, y * scale, (x + bw) * scale, (y + bh) * scale, outline="red")
+
+        tk.Label(self.top,
+                 text=f"检测到{len(self.boxes)}个数字（红框），请输入截图中显示的价格：",
+                 font=("微软雅黑", 9)).pack(padx=10, anchor="w")
+        entry_frame = tk.Frame(self.top)
+        entry_frame.pack(fill=tk.X, padx=10, pady=5)
+        self.price_entry = tk.Entry(entry_frame, width=20, font=("微软雅黑", 10))
+        self.price_entry.pack(side=tk.LEFT)
+        tk.Button(entry_frame, text="自动识别", command=self.fill_offline,
+                  font=("微软雅黑", 9)).pack(side=tk.LEFT, padx=5)
+
+        btn_frame = tk.Frame(self.top)
+        btn_frame.pack(fill=tk.X, padx=10, pady=10)
+        tk.Button(btn_frame, text="保存模板", command=self.save,
+                  font=("微软雅黑", 9), bg="#4CAF50", fg="white").pack(side=tk.LEFT)
+        tk.Button(btn_frame, text="跳过", command=self.top.destroy,
+                  font=("微软雅黑", 9)).pack(side=tk.RIGHT)
+
+        self.price_entry.focus_set()
+        self.top.grab_set()
+        self.top.wait_window()
+
+    def fill_offline(self):
+        """用离线OCR引擎（Tesseract/PaddleOCR）预填价格"""
+        price = read_price_offline(self.img_bgra)
+        if price is None:
+            messagebox.showwarning("自动识别", "没有可用的离线OCR引擎或未识别出数字，请手动输入", parent=self.top)
+            return
+        self.price_entry.delete(0, tk.END)
+        self.price_entry.insert(0, str(price))
+
+    def save(self):
+        price_text = self.price_entry.get().strip()
+        meta = load_calibration_meta(self.directory) or {}
+        previous = None
+        if meta.get('captured'):
+            previous = (load_calibrated_templates(self.directory) or {}).get(CALIBRATED_RESOLUTION)
+            if previous:
+                previous = {digit: previous[digit] for digit in meta['captured']}
+        try:
+            templates, missing = build_calibrated_templates(
+                self.binary, self.boxes, price_text, load_digit_templates(), previous)
+        except ValueError as e:
+            messagebox.showerror("校准失败", str(e), parent=self.top)
+            return
+
+        captured = sorted(set(meta.get('captured', [])) | {int(c) for c in price_text if c.isdigit()})
+        save_calibrated_templates(templates, self.directory, {
+            'region': list(self.region),
+            'dpi': get_screen_dpi(),
+            'price': price_text,
+            'captured': captured,
+            'calibrated_at': datetime.now().isoformat(timespec='seconds'),
+            'calibration_id': uuid.uuid4().hex,
+        })
+        self.saved = True
+        message = f"模板已保存到\n{self.directory}"
+        if missing:
+            message += (f"\n\n数字{''.join(map(str, missing))}未在价格中出现，暂用自带模板缩放代替，"
+                        f"可在价格含有这些数字时重新框选监控区域再校准一次")
+        messagebox.showinfo("校准完成", message, parent=self.top)
+        self.top.destroy()
+
+
 class ParameterSelector:
-    """分辨率选择器（带阈值设置）"""
+    """分辨率选择器（带阈值设置）
 
-    def __init__(self):
-        self.rs = tk.Tk()
+    master为None时作为启动窗口（独立的Tk根窗口和主循环）；
+    传入运行中的主窗口时作为它的模态子窗口，关闭后返回，由调用方把新设置推给引擎。
+    """
+
+    def __init__(self, master=None):
+        self.rs = tk.Tk() if master is None else tk.Toplevel(master)
         self.rs.iconbitmap(resource_path('mouse.ico'))
         self.rs.title("参数配置")
         self.center_window()
@@ -374,6 +3413,16 @@ class ParameterSelector:
         self.shutdown_time = self.config['shutdown_time']  # 关机时间
         self.auto_refresh_time = self.config['auto_refresh_time']  # 关机时间
         self.refresh_interval_steps = self.config['refresh_interval_steps']
+        self.success_window = self.config.get('success_window', 3.0)
+        self.cpu_budget = self.config.get('cpu_budget', 50)  # 百分比
+        self.target_latency_ms = self.config.get('target_latency_ms', 50)
+        self.cv_threads = self.config.get('cv_threads')  # None为DEFAULT_CV_THREADS（单线程）
+        self.ocr_cores = tuple(self.config.get('ocr_cores') or ())
+        self.click_cores = tuple(self.config.get('click_cores') or ())
+        self.boost_click = self.config.get('boost_click', True)
+        self.event_stream = self.config.get('event_stream', False)
+        self.speculative_click = self.config.get('speculative_click', False)
+        self.watchlist = load_watchlist(self.config)
         # 设置样式
         self.rs.configure(bg="#f0f0f0")
         tk.Label(self.rs,
@@ -409,6 +3458,68 @@ class ParameterSelector:
         self.max_success_entry.insert(0, str(self.max_success))
         tk.Label(success_frame, text="次(达到此次数后自动暂停)", bg="#f0f0f0",
                  font=("微软雅黑", 8), fg="#666").grid(row=0, column=2, sticky="w")
+        tk.Label(success_frame,
+                 text="成功检测窗口:",
+                 font=("微软雅黑", 10),
+                 bg="#f0f0f0").grid(row=1, column=0, sticky="w", pady=5)
+        self.success_window_entry = tk.Entry(success_frame, width=10)
+        self.success_window_entry.grid(row=1, column=1, padx=5, pady=2)
+        self.success_window_entry.insert(0, str(self.success_window))
+        tk.Label(success_frame, text="秒(点击后在此时间内检测成功标志)", bg="#f0f0f0",
+                 font=("微软雅黑", 8), fg="#666").grid(row=1, column=2, sticky="w")
+        # === 性能设置区域 ===
+        perf_frame = tk.Frame(self.rs, bg="#f0f0f0")
+        perf_frame.pack(fill=tk.X, padx=20, pady=10)
+        tk.Label(perf_frame,
+                 text="CPU预算:",
+                 font=("微软雅黑", 10),
+                 bg="#f0f0f0").grid(row=0, column=0, sticky="w", pady=5)
+        self.cpu_budget_entry = tk.Entry(perf_frame, width=10)
+        self.cpu_budget_entry.grid(row=0, column=1, padx=5, pady=2)
+        self.cpu_budget_entry.insert(0, str(self.cpu_budget))
+        tk.Label(perf_frame, text="%(每个识别线程最多占用单核的比例，电脑较弱时调低)", bg="#f0f0f0",
+                 font=("微软雅黑", 8), fg="#666").grid(row=0, column=2, sticky="w")
+        tk.Label(perf_frame,
+                 text="目标延迟:",
+                 font=("微软雅黑", 10),
+                 bg="#f0f0f0").grid(row=1, column=0, sticky="w", pady=5)
+        self.target_latency_entry = tk.Entry(perf_frame, width=10)
+        self.target_latency_entry.grid(row=1, column=1, padx=5, pady=2)
+        self.target_latency_entry.insert(0, str(self.target_latency_ms))
+        tk.Label(perf_frame, text="毫秒(识别刷新周期，越小越快但越占CPU)", bg="#f0f0f0",
+                 font=("微软雅黑", 8), fg="#666").grid(row=1, column=2, sticky="w")
+        tk.Label(perf_frame,
+                 text="OpenCV线程:",
+                 font=("微软雅黑", 10),
+                 bg="#f0f0f0").grid(row=2, column=0, sticky="w", pady=5)
+        self.cv_threads_entry = tk.Entry(perf_frame, width=10)
+        self.cv_threads_entry.grid(row=2, column=1, padx=5, pady=2)
+        self.cv_threads_entry.insert(0, "" if self.cv_threads is None else str(self.cv_threads))
+        tk.Label(perf_frame, text="(留空为1即单线程，少占游戏的核心；大于1时按整个进程的CPU占用限速)", bg="#f0f0f0",
+                 font=("微软雅黑", 8), fg="#666").grid(row=2, column=2, sticky="w")
+        tk.Label(perf_frame,
+                 text="识别线程核心:",
+                 font=("微软雅黑", 10),
+                 bg="#f0f0f0").grid(row=3, column=0, sticky="w", pady=5)
+        self.ocr_cores_entry = tk.Entry(perf_frame, width=10)
+        self.ocr_cores_entry.grid(row=3, column=1, padx=5, pady=2)
+        self.ocr_cores_entry.insert(0, format_core_list(self.ocr_cores))
+        tk.Label(perf_frame, text=f"(如 2,3 或 2-3，留空不绑定；本机共{os.cpu_count()}个逻辑核心)", bg="#f0f0f0",
+                 font=("微软雅黑", 8), fg="#666").grid(row=3, column=2, sticky="w")
+        tk.Label(perf_frame,
+                 text="点击线程核心:",
+                 font=("微软雅黑", 10),
+                 bg="#f0f0f0").grid(row=4, column=0, sticky="w", pady=5)
+        self.click_cores_entry = tk.Entry(perf_frame, width=10)
+        self.click_cores_entry.grid(row=4, column=1, padx=5, pady=2)
+        self.click_cores_entry.insert(0, format_core_list(self.click_cores))
+        self.boost_click_var = tk.BooleanVar(value=self.boost_click)
+        tk.Checkbutton(perf_frame, text="提升点击线程优先级", variable=self.boost_click_var,
+                       bg="#f0f0f0", font=("微软雅黑", 8)).grid(row=4, column=2, sticky="w")
+        self.event_stream_var = tk.BooleanVar(value=self.event_stream)
+        tk.Checkbutton(perf_frame, text="推送识别结果和事件（供本机看板/记录程序订阅）",
+                       variable=self.event_stream_var,
+                       bg="#f0f0f0", font=("微软雅黑", 8)).grid(row=5, column=0, columnspan=3, sticky="w")
         # === 区域选择区域 ===
         region_frame = tk.Frame(self.rs, bg="#f0f0f0")
         region_frame.pack(fill=tk.X, padx=20, pady=10)
@@ -444,10 +3555,21 @@ class ParameterSelector:
                                   command=self.select_text_region,
                                   font=("微软雅黑", 9))
         self.text_btn.grid(row=0, column=4, padx=5)
+
+        # 额外监控商品
+        tk.Button(region_frame,
+                  text="监控列表",
+                  command=self.edit_watchlist,
+                  font=("微软雅黑", 9)).grid(row=0, column=5, padx=5)
+        self.watchlist_label = tk.Label(region_frame,
+                                        text=f"额外监控商品: {len(self.watchlist)}个",
+                                        font=("微软雅黑", 8),
+                                        fg="#666",
+                                        bg="#f0f0f0")
+        self.watchlist_label.grid(row=5, column=1, columnspan=2, sticky="w")
         # 显示当前区域信息
         self.monitor_label = tk.Label(region_frame,
-                                      text="未选择" if not self.monitor_region else
-                                      f"价格监控区: ({self.monitor_region[0]},{self.monitor_region[1]})-WH({self.monitor_region[2]}x{self.monitor_region[3]})",
+                                      text=self.format_monitor_label(),
                                       font=("微软雅黑", 8),
                                       fg="#666",
                                       bg="#f0f0f0")
@@ -553,7 +3675,39 @@ class ParameterSelector:
         self.auto_refresh_time_val = None  # 新增关机时间变量
         self.closed_by_user = False
 
+        if master is not None:
+            # 重新配置：模态子窗口，引擎依赖已加载
+            self.rs.transient(master)
+            self.rs.grab_set()
+            master.wait_window(self.rs)
+            return
+
+        # 窗口显示后在后台预加载识别引擎依赖，缩短点击保存后的等待
+        self.rs.after(300, preload_engine_modules)
+        if STARTUP_PROBE:
+            self.rs.after_idle(self._startup_probe_close)
+
         self.rs.mainloop()
+
+    def engine_settings(self):
+        """保存参数后的设置（EngineSettings）"""
+        return make_engine_settings(self.threshold1_val, self.threshold2_val, self.max_attempts_val,
+                                    self.max_success_val, self.monitor_region, self.click_region,
+                                    self.num_region, self.text_region, self.shutdown_time_val,
+                                    self.auto_refresh_time_val, self.refresh_interval_steps,
+                                    self.success_window, self.watchlist,
+                                    self.cpu_budget / 100, self.target_latency_ms / 1000,
+                                    self.runtime_settings(), self.speculative_click)
+
+    def runtime_settings(self):
+        """线程运行参数（RuntimeSettings）"""
+        return RuntimeSettings(self.cv_threads, self.ocr_cores, self.click_cores, self.boost_click)
+
+    def _startup_probe_close(self):
+        """启动基准模式：窗口绘制完成后记录时刻并关闭"""
+        self.rs.update()
+        startup_probe_mark('config_window')
+        self.on_close()
     def create_activation_status(self):
         """创建激活状态显示区域"""
         frame = tk.Frame(self.rs, bg="#f0f0f0")
@@ -632,6 +3786,14 @@ class ParameterSelector:
                  fg="#666",
                  bg="#f0f0f0").pack(side=tk.LEFT, padx=(10, 0))
 
+        # 预判点击：价格待复核时先移动光标，确认后不等刷新间隔立即点击
+        self.speculative_click_var = tk.BooleanVar(value=self.speculative_click)
+        tk.Checkbutton(control_frame,
+                       text="预判点击",
+                       variable=self.speculative_click_var,
+                       font=("微软雅黑", 8),
+                       bg="#f0f0f0").pack(side=tk.LEFT, padx=(10, 0))
+
     def increase_refresh_interval(self):
         """增加刷新间隔步数"""
         self.refresh_interval_steps += 1
@@ -681,12 +3843,41 @@ class ParameterSelector:
         region = selector.get_region()
         if region:
             self.monitor_region = region
-            self.monitor_label.config(
-                text=f"价格监控区: ({region[0]},{region[1]})-WH({region[2]}x{region[3]})"
-            )
             # 更新配置
             self.config['monitor_region'] = region
             save_config(self.config)
+            self.calibrate_templates()
+            self.monitor_label.config(text=self.format_monitor_label())
+
+    def format_monitor_label(self):
+        if not self.monitor_region:
+            return "未选择"
+        x, y, w, h = self.monitor_region
+        calibrated = "（已校准模板）" if load_calibration_meta(get_calibration_dir(self.monitor_region)) else ""
+        return f"价格监控区: ({x},{y})-WH({w}x{h}){calibrated}"
+
+    def calibrate_templates(self):
+        """截取监控区域，用当前显示的价格生成该区域尺寸/DPI专用的数字模板"""
+        if not messagebox.askyesno("数字模板校准",
+                                   "是否用监控区域当前显示的价格校准数字模板？\n"
+                                   "（非常见分辨率/缩放比例下可明显提高识别率，请确认区域内正显示价格）",
+                                   parent=self.rs):
+            return
+        try:
+            load_engine_modules()
+            # 先隐藏配置窗口，避免遮挡监控区域
+            self.rs.withdraw()
+            self.rs.update()
+            time.sleep(0.2)
+            x, y, w, h = self.monitor_region
+            with mss() as sct:
+                img_bgra = np.array(sct.grab({'left': x, 'top': y, 'width': w, 'height': h}))
+        except Exception as e:
+            messagebox.showerror("校准失败", f"截图失败: {e}", parent=self.rs)
+            return
+        finally:
+            self.rs.deiconify()
+        CalibrationDialog(self.rs, img_bgra, self.monitor_region)
 
     def select_click_region(self):
         """选择点击区域"""
@@ -731,7 +3922,20 @@ class ParameterSelector:
             # 更新配置
             self.config['text_region'] = text_region
             save_config(self.config)
+    def edit_watchlist(self):
+        """编辑额外监控商品"""
+        editor = WatchlistEditor(self.rs, self.watchlist)
+        self.watchlist = editor.items
+        self.watchlist_label.config(text=f"额外监控商品: {len(self.watchlist)}个")
+        self.config['watchlist'] = [watch_item_to_dict(item) for item in self.watchlist]
+        save_config(self.config)
+
     def start_monitoring(self):
+        """保存参数：所有配置改动合并为一次加密写入"""
+        with config_transaction():
+            self._start_monitoring()
+
+    def _start_monitoring(self):
         try:
 
             # 获取并验证最多尝试次数
@@ -755,6 +3959,51 @@ class ParameterSelector:
             # 保存配置
             self.config['max_success'] = max_success
             save_config(self.config)
+            success_window = float(self.success_window_entry.get())
+            if success_window <= 0:
+                messagebox.showerror("错误", "成功检测窗口必须大于0秒")
+                return
+            self.success_window = success_window
+            self.config['success_window'] = success_window
+            cpu_budget = int(self.cpu_budget_entry.get())
+            if not 1 <= cpu_budget <= 100:
+                messagebox.showerror("错误", "CPU预算必须在1到100之间")
+                return
+            target_latency_ms = int(self.target_latency_entry.get())
+            if target_latency_ms <= 0:
+                messagebox.showerror("错误", "目标延迟必须大于0毫秒")
+                return
+            self.cpu_budget = cpu_budget
+            self.target_latency_ms = target_latency_ms
+            self.config['cpu_budget'] = cpu_budget
+            self.config['target_latency_ms'] = target_latency_ms
+            cv_threads_text = self.cv_threads_entry.get().strip()
+            cv_threads = int(cv_threads_text) if cv_threads_text else None
+            if cv_threads is not None and cv_threads < 0:
+                messagebox.showerror("错误", "OpenCV线程数不能为负")
+                return
+            try:
+                ocr_cores = parse_core_list(self.ocr_cores_entry.get())
+                click_cores = parse_core_list(self.click_cores_entry.get())
+            except ValueError:
+                messagebox.showerror("错误", "核心格式错误，请填写如 2,3 或 2-3")
+                return
+            cpu_count = os.cpu_count() or 1
+            if any(core >= cpu_count for core in ocr_cores + click_cores):
+                messagebox.showerror("错误", f"核心编号必须小于{cpu_count}")
+                return
+            self.cv_threads = cv_threads
+            self.ocr_cores = ocr_cores
+            self.click_cores = click_cores
+            self.boost_click = self.boost_click_var.get()
+            self.config['cv_threads'] = cv_threads
+            self.config['ocr_cores'] = list(ocr_cores)
+            self.config['click_cores'] = list(click_cores)
+            self.config['boost_click'] = self.boost_click
+            self.event_stream = self.event_stream_var.get()
+            self.config['event_stream'] = self.event_stream
+            self.speculative_click = self.speculative_click_var.get()
+            self.config['speculative_click'] = self.speculative_click
             if threshold1 >= threshold2:
                 messagebox.showerror("错误", "上限阈值必须大于下限阈值")
                 return
@@ -840,88 +4089,122 @@ class ParameterSelector:
         self.rs.destroy()
 
 
-class OverlayApp:
+class OverlayApp(AutoBuyListener):
     def __init__(self, root, threshold1, threshold2, max_attempts, max_success, monitor_region, click_region, num_region,text_region,
-                 shutdown_time=None, auto_refresh_time=None,refresh_interval_steps=10):
-        """初始化主应用，接收配置参数"""
+                 shutdown_time=None, auto_refresh_time=None,refresh_interval_steps=10, success_window=3.0,
+                 watchlist=(), cpu_budget=0.5, target_latency=0.05, input_device=None, clock=None,
+                 frame_source=None, runtime=DEFAULT_RUNTIME, event_stream=False, speculative=False):
+        """初始化主应用，接收配置参数
+
+        input_device/clock/frame_source默认为pynput、系统时钟和mss，
+        仿真和长时间运行测试（benchmarks/soak.py）可替换为回放实现。
+        event_stream为True时向本机订阅者推送事件（见EventPublisher）。
+        """
+        load_engine_modules()
         self.root = root
+        # 截图来源：调用后得到支持with和grab(region)的对象（与mss()接口一致）
+        self.frame_source = frame_source or mss
+        # 合并调度的after回调：key -> after id
+        self.pending_after = {}
+        self.after_lock = threading.Lock()
         self.root.title("鼠鼠伴生器灵Ver2.3")
-        # 添加新的事件和状态标志
-
-        # 保存阈值配置
-        self.THRESHOLD1 = threshold1
-        self.THRESHOLD2 = threshold2
-        # 保存最多尝试次数
-        self.MAX_ATTEMPTS = max_attempts
-        self.MAX_SUCCESS = max_success
-
-        # 使用用户选择的区域
-        self.MONITOR_REGION = {
-            'left': monitor_region[0],
-            'top': monitor_region[1],
-            'width': monitor_region[2],
-            'height': monitor_region[3]
-        }
-        self.TEXT_REGION = {
-            'left': text_region[0],
-            'top': text_region[1],
-            'width': text_region[2],
-            'height': text_region[3]
-        }
-        self.CLICK_POSITION = click_region
-        self.NUM_POSITION = num_region
 
-        self.shutdown_time = shutdown_time  # 保存关机时间
-        self.shutdown_timer = None  # 关机定时器
-        self.shutdown_delay = None  # 关机倒计时（秒）
-
-        self.auto_refresh_time = auto_refresh_time  # 保存自动刷新时间
-        self.auto_refresh_timer = None  # 自动刷新定时器
-        self.auto_refresh_delay = None  # 自动刷新倒计时（秒）
-        self.refresh_interval_steps = refresh_interval_steps
-
-        self.shutdown_after_id = None
-        self.auto_refresh_after_id = None
+        # 当前生效的(设置, 各商品运行时状态)：重新配置时整体替换这一对，
+        # 各线程每帧开始时读取一次，不会拿到新设置配旧状态
+        settings = make_engine_settings(threshold1, threshold2, max_attempts, max_success, monitor_region,
+                                        click_region, num_region, text_region, shutdown_time, auto_refresh_time,
+                                        refresh_interval_steps, success_window, watchlist,
+                                        cpu_budget, target_latency, runtime, speculative)
+        self.active = (settings, [WatchItemState() for _ in settings.watch_items])
+        # OpenCV线程池、线程绑核/优先级和各线程CPU占用
+        self.runtime = ThreadRuntime()
+        self.runtime.configure_opencv(runtime.cv_threads)
+        self.runtime.track('ui', threading.get_native_id())
+        # 刷新/点击/次数上限状态机（输入设备和时钟可注入）
+        self.controller = AutoBuyController(self.watch_items, self.item_states,
+                                            input_device or PynputInput(), clock, self,
+                                            refresh_interval_steps, speculative)
+        self.match_mode = MatchModeSelector()
+        self.ocr_cache = OcrResultCache()
+        # 两个识别线程各自按CPU预算和目标延迟调节帧周期
+        self.capture_governor = FrameGovernor("价格识别", cpu_budget, target_latency)
+        self.text_governor = FrameGovernor("成功检测", cpu_budget, target_latency)
+        for governor in (self.capture_governor, self.text_governor):
+            governor.count_pool_threads(self.runtime.opencv_pooled)
+        # 每帧复用的OpenCV缓冲区（采集线程专用）
+        self.ocr_workspaces = [FrameWorkspace() for _ in settings.watch_items]
+        self.mosaic_workspace = FrameWorkspace()
+        self.text_workspace = FrameWorkspace()
+
+        self.shutdown_task = None  # 关机定时任务
+        self.auto_refresh_task = None  # 自动刷新定时任务
+
+        # 成功标志只在点击后的检测窗口内匹配，其余时间文本线程低频空转
+        self.success_armed_until = 0.0
+        self.success_arm_event = threading.Event()
+
+        # 关机和自动刷新共用一个截止时刻调度器，倒计时由截止时刻推算
+        self.scheduler = DeadlineScheduler(lambda callback: self.root.after(0, callback))
+        self.countdown_after_id = None
+
+        # 各阶段耗时统计（常开）
+        self.perf = PerfStats()
+        # 时间线追踪（F7导出）与结构化日志文件
+        self.trace = TraceRecorder()
+        try:
+            LOG.open(get_data_dir("logs") / f"app_{datetime.now().strftime('%Y%m%d')}.jsonl")
+        except OSError as e:
+            print(f"无法打开日志文件: {e}")
+        # 低置信度读数的后台复核
+        self.verifier = PriceVerifier(self.perf)
+        # 抢购端到端延迟记录
+        self.latency_log = BuyLatencyLog(get_data_dir("latency") / "buy_latency.jsonl")
+        # 会话事件记录（价格、点击、成功、刷新）
+        self.events = SessionEventStore(get_data_dir("events"))
+        self.publisher = None
+        self.set_event_stream(event_stream)
+        # 各商品确认价格的流式统计（跨会话累计）
+        self.price_stats = PriceStatsBook(get_data_dir("stats") / "price_stats.json")
+        self.price_value = None  # 主商品当前价格
+        self.stats_window = None
+        self.stats_after_id = None
+        # F6采样分析器
+        self.profiler = SamplingProfiler()
 
         # 显示当前配置信息
         config_frame = tk.Frame(root)
         config_frame.pack(fill=tk.X, padx=5, pady=5)
 
-        tk.Label(config_frame,
-                 text=f"最多尝试次数: {self.MAX_ATTEMPTS}次\n最多成功次数: {self.MAX_SUCCESS}次",
-                 font=("微软雅黑", 8),
-                 fg="blue").pack(side=tk.LEFT, padx=10)
+        self.limits_label = tk.Label(config_frame,
+                                     font=("微软雅黑", 8),
+                                     fg="blue")
+        self.limits_label.pack(side=tk.LEFT, padx=10)
 
-        tk.Label(config_frame,
-                 text=f"最低价{self.THRESHOLD1:,}HV＄\n最高价{self.THRESHOLD2:,}HV＄",
-                 font=("微软雅黑", 9),
-                 fg="green").pack(side=tk.RIGHT, padx=10)
+        self.thresholds_label = tk.Label(config_frame,
+                                         font=("微软雅黑", 9),
+                                         fg="green")
+        self.thresholds_label.pack(side=tk.RIGHT, padx=10)
 
         # 显示监控区域信息
-        tk.Label(config_frame,
-                 text=f"监控区域: {monitor_region[0]}x{monitor_region[1]} "
-                      f"({monitor_region[2]}x{monitor_region[3]})",
-                 font=("微软雅黑", 8),
-                 fg="gray").pack(side=tk.LEFT, padx=10)
+        self.region_label = tk.Label(config_frame,
+                                     font=("微软雅黑", 8),
+                                     fg="gray")
+        self.region_label.pack(side=tk.LEFT, padx=10)
+        self.update_config_labels()
 
         # 窗口设置
         self.root.attributes('-topmost', True)  # 窗口置顶
         self.root.attributes('-alpha', 1)  # 70%透明度
 
-        # 初始化鼠标控制器
-        self.mouse = MouseController()
-        # 初始化键盘控制器
-        self.keyboard = KeyboardController()
-
         # 创建画布用于显示截图
         self.canvas = Canvas(root,
-                             width=self.MONITOR_REGION['width'],
-                             height=self.MONITOR_REGION['height'])
+                             width=monitor_region[2],
+                             height=monitor_region[3])
         self.canvas.pack(pady=(5, 0))
         # 文本监控区域画布
         self.text_canvas = Canvas(root,
-                                  width=self.TEXT_REGION['width'],
-                                  height=self.TEXT_REGION['height'])
+                                  width=text_region[2],
+                                  height=text_region[3])
         self.text_canvas.pack(pady=(5, 0))
         # 识别结果显示区域
         self.result_label = tk.Label(root,
@@ -935,6 +4218,14 @@ class OverlayApp:
                                    font=("微软雅黑", 10),
                                    bg='white')
         self.text_result_label.pack(fill=tk.X, padx=5, pady=5)
+        # 确认价格的分位数统计
+        self.price_stats_label = tk.Label(root,
+                                          text="\n".join(self.price_stats.format_summary(item)
+                                                         for item in self.watch_items),
+                                          font=("微软雅黑", 8),
+                                          fg="gray",
+                                          justify=tk.LEFT)
+        self.price_stats_label.pack(fill=tk.X, padx=5)
 
         # 状态显示区域
         self.status_frame = Frame(root)
@@ -969,13 +4260,11 @@ class OverlayApp:
         self.btn_frame.pack(fill=tk.X, padx=5, pady=5)
 
         # 点击计数器
-        self.click_count = 0
         self.click_count_label = Label(self.btn_frame,
                                        text=f"点击: 0次",
                                        font=("微软雅黑", 9))
         self.click_count_label.pack(side=tk.LEFT)
         # 成功次数计数器
-        self.success_count = 0
         self.success_count_label = Label(self.btn_frame,
                                         text=f"成功: 0次",
                                         font=("微软雅黑", 9))
@@ -994,7 +4283,6 @@ class OverlayApp:
                   bg="#FF6B6B").pack(side=tk.RIGHT, padx=5)
 
         # === 自动刷新功能 ===
-        self.auto_refresh_running = False
         # 使用按钮作为状态指示器（不可点击）
         self.auto_refresh_label = tk.Label(
             self.btn_frame,
@@ -1017,11 +4305,11 @@ class OverlayApp:
 
         # 启动截图线程
         self.running = True
-        self.thread = threading.Thread(target=self.update_overlay)
+        self.thread = threading.Thread(target=self.update_overlay, name="capture")
         self.thread.daemon = True
         self.thread.start()
         # +++ 启动文本监控线程 +++
-        self.text_thread = threading.Thread(target=self.update_text_overlay)
+        self.text_thread = threading.Thread(target=self.update_text_overlay, name="text")
         self.text_thread.daemon = True
         self.text_thread.start()
         # 添加重新配置按钮
@@ -1031,14 +4319,16 @@ class OverlayApp:
                                       bg="#9C27B0",  # 紫色背景
                                       fg="white")
         self.reconfig_btn.pack(side=tk.RIGHT, padx=5)
+        # 性能统计面板按钮
+        tk.Button(self.btn_frame,
+                  text="性能统计",
+                  command=self.toggle_stats_panel,
+                  bg="#607D8B",
+                  fg="white").pack(side=tk.RIGHT, padx=5)
 
 
-        # ====== 启动自动刷新定时功能 ======
-        if self.auto_refresh_time:
-            self.start_auto_refresh_timer()
-        # ====== 启动定时关机功能 ======
-        if self.shutdown_time:
-            self.start_shutdown_timer()
+        # ====== 启动自动刷新定时和定时关机 ======
+        self.start_timers()
         # 获取窗口实际宽高（基于内容）
         width = self.root.winfo_width()
         height = self.root.winfo_height()
@@ -1052,48 +4342,100 @@ class OverlayApp:
         # 应用新位置（保持原窗口尺寸）
         self.root.geometry(f"+{x}+{y}")
 
-    def start_auto_refresh_timer(self):
-        """启动自动刷新定时任务"""
-        try:
-            # 解析自动刷新时间
-            refresh_hour, refresh_minute = map(int, self.auto_refresh_time.split(':'))
-
-            # 获取当前时间
-            now = get_accurate_time()
-            # 构建目标自动刷新时间（今天）
-            refresh_datetime = now.replace(hour=refresh_hour, minute=refresh_minute,
-                                           second=0, microsecond=0)
-
-            # 如果目标时间已过，设置为明天
-            if refresh_datetime < now:
-                refresh_datetime += timedelta(days=1)
-
-            # 计算时间差（秒）
-            self.auto_refresh_delay = (refresh_datetime - now).total_seconds()
-
-            # 更新状态显示
-            self.auto_refresh_label.config(
-                text=f"自动刷新: {self.auto_refresh_time} (倒计时: {self.format_time(self.auto_refresh_delay)})")
+    @property
+    def settings(self):
+        """当前生效的EngineSettings"""
+        return self.active[0]
+
+    @property
+    def watch_items(self):
+        return self.active[0].watch_items
+
+    @property
+    def item_states(self):
+        return self.active[1]
+
+    def update_config_labels(self):
+        """按当前设置刷新顶部的配置信息"""
+        primary = self.watch_items[0]
+        x, y, w, h = primary.region
+        self.limits_label.config(text=f"最多尝试次数: {primary.max_attempts}次\n最多成功次数: {primary.max_success}次")
+        self.thresholds_label.config(text=f"最低价{primary.threshold1:,}HV＄\n最高价{primary.threshold2:,}HV＄")
+        region_text = f"监控区域: {x}x{y} ({w}x{h})"
+        if len(self.watch_items) > 1:
+            region_text += f"\n另有{len(self.watch_items) - 1}个监控商品"
+        self.region_label.config(text=region_text)
+
+    def start_timers(self):
+        """按当前设置启动自动刷新定时和定时关机"""
+        if self.settings.auto_refresh_time:
+            self.start_auto_refresh_timer()
+        if self.settings.shutdown_time:
+            self.start_shutdown_timer()
 
-            # 启动定时器
-            self.auto_refresh_timer = threading.Timer(self.auto_refresh_delay, self.initiate_auto_refresh)
-            self.auto_refresh_timer.daemon = True
-            self.auto_refresh_timer.start()
+    def apply_settings(self, settings):
+        """把新设置推给运行中的引擎（界面线程调用）
 
-            # 启动倒计时更新
-            self.update_auto_refresh_countdown()
+        采集和成功检测线程每帧开始时读取self.active，下一帧即按新的区域、价格区间工作；
+        缓冲区、截图句柄、监听器和各线程都保留，数字模板只在区域尺寸变化或重新校准后
+        重新加载（见TemplateSource）。区域不变的商品沿用原识别状态，所有计数归零（与重新启动一致）。
+        """
+        old_settings, old_states = self.active
+        reusable = {item.region: state for item, state in zip(old_settings.watch_items, old_states)}
+        states = []
+        for item in settings.watch_items:
+            state = reusable.pop(item.region, None) or WatchItemState()
+            state.reset_counts()
+            state.qualify_since_ns = None  # 价格区间可能已变，下一帧重新判断
+            states.append(state)
+        self.active = (settings, states)
+
+        # 自动刷新已在重新配置前停止，这里直接替换状态机的商品列表
+        controller = self.controller
+        controller.watch_items = settings.watch_items
+        controller.item_states = states
+        controller.refresh_interval_steps = settings.refresh_interval_steps
+        controller.speculative = settings.speculative
+        controller.click_count = 0
+        controller.success_count = 0
+        self.runtime.configure_opencv(settings.runtime.cv_threads)
+        for governor in (self.capture_governor, self.text_governor):
+            governor.cpu_budget = max(0.01, min(1.0, settings.cpu_budget))
+            governor.target_latency = max(0.001, settings.target_latency)
+            governor.count_pool_threads(self.runtime.opencv_pooled)
+
+        primary = settings.watch_items[0]
+        self.canvas.config(width=primary.region[2], height=primary.region[3])
+        self.text_canvas.config(width=settings.text_region[2], height=settings.text_region[3])
+        self.update_config_labels()
+        self.refresh_price_stats_label(settings.watch_items)  # 区域变化的商品换成对应的统计
+        self.on_counts_reset()
+
+        self.cancel_timers()
+        self.shutdown_label.config(text="", fg="purple")
+        self.auto_refresh_label.config(text="F5启动自动刷新", bg="#2196F3")
+        self.start_timers()
+        LOG.info('settings', "已应用新配置", items=len(settings.watch_items),
+                 thresholds=[(item.threshold1, item.threshold2) for item in settings.watch_items])
 
+    def start_auto_refresh_timer(self):
+        """启动自动刷新定时任务"""
+        try:
+            deadline = next_daily_deadline(self.settings.auto_refresh_time)
         except Exception as e:
             print(f"自动刷新设置失败: {str(e)}")
             self.auto_refresh_label.config(text=f"自动刷新设置失败", fg="red")
+            return
+
+        self.scheduler.cancel(self.auto_refresh_task)
+        self.auto_refresh_task = self.scheduler.call_at(deadline, self.initiate_auto_refresh)
+        self.update_countdowns()
 
     def initiate_auto_refresh(self):
-        """执行自动刷新操作"""
-        # 在主线程中更新UI
+        """执行自动刷新操作（由调度器投递到界面线程）"""
+        self.auto_refresh_task = None
         if self.click_paused:  # 若点击功能被暂停
             self.toggle_click()  # 启用点击
-        self.root.after(0, lambda: self.auto_refresh_label.config(text="正在启动自动刷新...", fg="white"))
-        self.root.update()
 
         # 执行自动刷新
         if not self.auto_refresh_running:
@@ -1102,59 +4444,18 @@ class OverlayApp:
         # 更新显示
         self.auto_refresh_label.config(text="自动刷新已启动", fg="white")
 
-    def update_auto_refresh_countdown(self):
-        """更新自动刷新倒计时显示"""
-        if self.auto_refresh_delay is None or self.auto_refresh_delay <= 0:
-            return
-
-        # 减少倒计时
-        self.auto_refresh_delay -= 1
-
-        # 更新显示
-        if self.auto_refresh_delay > 0:
-            self.auto_refresh_label.config(
-                text=f"自动刷新: {self.auto_refresh_time} (倒计时: {self.format_time(self.auto_refresh_delay)})"
-                     f"\n---按下F5以取消定时立刻开始自动刷新---")
-            if self.auto_refresh_after_id  is not None:
-                self.root.after_cancel(self.auto_refresh_after_id )
-            # 每秒更新一次
-            self.auto_refresh_after_id = self.root.after(1000, self.update_auto_refresh_countdown)
-        else:
-            self.auto_refresh_label.config(text="正在启动自动刷新...", fg="white")
-
     def start_shutdown_timer(self):
         """启动定时关机任务"""
         try:
-            # 解析关机时间
-            shutdown_hour, shutdown_minute = map(int, self.shutdown_time.split(':'))
-
-            # 获取当前时间
-            now = get_accurate_time()
-            # 构建目标关机时间（今天）
-            shutdown_datetime = now.replace(hour=shutdown_hour, minute=shutdown_minute, second=0, microsecond=0)
-
-            # 如果目标时间已过，设置为明天
-            if shutdown_datetime < now:
-                shutdown_datetime += timedelta(days=1)
-
-            # 计算时间差（秒）
-            self.shutdown_delay = (shutdown_datetime - now).total_seconds()
-
-            # 更新状态显示
-            self.shutdown_label.config(
-                text=f"定时关机: {self.shutdown_time} (倒计时: {self.format_time(self.shutdown_delay)})")
-
-            # 启动定时关机线程
-            self.shutdown_timer = threading.Timer(self.shutdown_delay, self.initiate_shutdown)
-            self.shutdown_timer.daemon = True
-            self.shutdown_timer.start()
-
-            # 启动倒计时更新
-            self.update_shutdown_countdown()
-
+            deadline = next_daily_deadline(self.settings.shutdown_time)
         except Exception as e:
             print(f"定时关机设置失败: {str(e)}")
             self.shutdown_label.config(text=f"定时关机设置失败", fg="red")
+            return
+
+        self.scheduler.cancel(self.shutdown_task)
+        self.shutdown_task = self.scheduler.call_at(deadline, self.initiate_shutdown)
+        self.update_countdowns()
 
     def format_time(self, seconds):
         """将秒数格式化为HH:MM:SS"""
@@ -1163,36 +4464,45 @@ class OverlayApp:
         seconds = int(seconds % 60)
         return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
-    def update_shutdown_countdown(self):
-        """更新关机倒计时显示"""
-        if self.shutdown_delay is None or self.shutdown_delay <= 0:
-            return
+    def update_countdowns(self):
+        """刷新关机和自动刷新的倒计时显示（剩余时间由截止时刻推算，不会累积误差）"""
+        if self.countdown_after_id is not None:
+            self.root.after_cancel(self.countdown_after_id)
+            self.countdown_after_id = None
 
-        # 减少倒计时
-        self.shutdown_delay -= 1
+        pending = [task for task in (self.shutdown_task, self.auto_refresh_task)
+                   if task is not None and not task.cancelled and not task.fired]
 
-        # 更新显示
-        if self.shutdown_delay > 0:
+        if self.shutdown_task in pending:
             self.shutdown_label.config(
-                text=f"定时关机: {self.shutdown_time} (倒计时: {self.format_time(self.shutdown_delay)})")
-            if self.shutdown_after_id is not None:
-                self.root.after_cancel(self.shutdown_after_id)
-            # 每秒更新一次
-            self.shutdown_after_id = self.root.after(1000, self.update_shutdown_countdown)
-        else:
-            self.shutdown_label.config(text="正在关机...", fg="red")
-
-    def initiate_shutdown(self):
-        """执行关机操作"""
-        # 在主线程中更新UI
-        self.root.after(0, lambda: self.shutdown_label.config(text="正在关机...", fg="red"))
-        self.root.update()
+                text=f"定时关机: {self.settings.shutdown_time} (倒计时: {self.format_time(self.shutdown_task.remaining())})")
+        if self.auto_refresh_task in pending:
+            self.auto_refresh_label.config(
+                text=f"自动刷新: {self.settings.auto_refresh_time} (倒计时: {self.format_time(self.auto_refresh_task.remaining())})"
+                     f"\n---按下F5以取消定时立刻开始自动刷新---")
 
-        # 给用户1秒钟时间看到提示
-        time.sleep(1)
+        if pending:
+            # 对齐到下一个整秒变化的时刻
+            fraction = min(task.remaining() for task in pending) % 1
+            self.countdown_after_id = self.root.after(int(fraction * 1000) + 10, self.update_countdowns)
 
-        # 执行关机命令
-        shutdown_computer()
+    def initiate_shutdown(self):
+        """执行关机操作（由调度器投递到界面线程）"""
+        self.shutdown_task = None
+        self.shutdown_label.config(text="正在关机...", fg="red")
+
+        # 给用户1秒钟时间看到提示，关机命令在调度线程执行
+        self.scheduler.call_later(1, shutdown_computer, on_ui=False)
+
+    def cancel_timers(self):
+        """取消关机和自动刷新定时任务及倒计时显示"""
+        self.scheduler.cancel(self.shutdown_task)
+        self.scheduler.cancel(self.auto_refresh_task)
+        self.shutdown_task = None
+        self.auto_refresh_task = None
+        if self.countdown_after_id is not None:
+            self.root.after_cancel(self.countdown_after_id)
+            self.countdown_after_id = None
 
     def initiate_reconfiguration(self):
         """启动重新配置流程"""
@@ -1200,120 +4510,45 @@ class OverlayApp:
         self.click_paused = True
         self.auto_refresh_running = False
 
-        # 取消关机定时器
-        if self.shutdown_timer and self.shutdown_timer.is_alive():
-            self.shutdown_timer.cancel()
-        # 取消自动刷新定时器
-        if self.auto_refresh_timer and self.auto_refresh_timer.is_alive():
-            self.auto_refresh_timer.cancel()
+        # 取消关机和自动刷新定时任务
+        self.cancel_timers()
         # 更新状态
         self.status_label1.config(text="自动点击: 配置中...", fg="blue")
         self.status_label2.config(text="自动刷新: 已暂停", fg="gray")
         self.auto_refresh_label.config(text="F5启动自动刷新", bg="#2196F3")
 
-        # 安全关闭当前窗口
-        self.safe_shutdown()
-
-        # 创建新配置窗口
-        self.root.after(100, self.launch_new_configuration)
-
-    def safe_shutdown(self):
-        """安全停止所有线程和资源"""
-        # 停止倒计时的after调度
-        if self.shutdown_after_id is not None:
-            self.root.after_cancel(self.shutdown_after_id)
-            self.shutdown_after_id = None
-        if self.auto_refresh_after_id is not None:
-            self.root.after_cancel(self.auto_refresh_after_id)
-            self.auto_refresh_after_id = None
-
-        # 停止自动刷新
-        self.auto_refresh_running = False
-
-        # 停止主循环
-        self.running = False
-
-        # 停止键盘监听器
-        if hasattr(self, 'key_listener'):
-            self.key_listener.stop()
-
-        # 取消关机定时器
-        if self.shutdown_timer and self.shutdown_timer.is_alive():
-            self.shutdown_timer.cancel()
-
-        # 短暂等待确保线程退出
-        time.sleep(0.1)
-
-    def launch_new_configuration(self):
-        """启动新的配置窗口"""
-        # 关闭当前主窗口
-        self.root.destroy()
-
-        # 创建新的配置选择器
-        selector = ParameterSelector()
-
-        # 如果用户完成新配置，创建新的主窗口
+        # 配置窗口作为主窗口的模态子窗口，引擎线程继续运行（预览照常刷新）
+        selector = ParameterSelector(self.root)
         if not selector.closed_by_user and selector.threshold1_val and selector.threshold2_val:
-            # 创建新的主窗口
-            new_root = tk.Tk()
-            new_root.iconbitmap(resource_path('mouse.ico'))
-
-            # 计算并设置右上角位置
-            screen_width = new_root.winfo_screenwidth()
-            new_root.update_idletasks()
-            width = new_root.winfo_width()
-            x = screen_width - width
-            new_root.geometry(f"+{x}+0")
-
-            # 使用新配置启动应用
-            OverlayApp(new_root,
-                       selector.threshold1_val,
-                       selector.threshold2_val,
-                       selector.max_attempts_val,
-                       selector.max_success_val,
-                       selector.monitor_region,
-                       selector.click_region,
-                       selector.num_region,
-                       selector.text_region,
-                       selector.shutdown_time_val,  # 传递关机时间
-                       selector.auto_refresh_time_val,# 传递自动刷新时间
-                       selector.refresh_interval_steps)
-            new_root.protocol("WM_DELETE_WINDOW", lambda: self.close_app(new_root))
-            new_root.mainloop()
-
-    def close_app(self, window=None):
-        """安全退出应用（支持指定窗口）"""
-        if not window:
-            window = self.root
-
-        # 停止所有操作
-        self.auto_refresh_running = False
-        self.running = False
-
-        # 停止键盘监听器
-        if hasattr(self, 'key_listener'):
-            self.key_listener.stop()
-
-        # 取消关机定时器
-        if self.shutdown_timer and self.shutdown_timer.is_alive():
-            self.shutdown_timer.cancel()
-        # 取消自动刷新定时器
-        if self.auto_refresh_timer and self.auto_refresh_timer.is_alive():
-            self.auto_refresh_timer.cancel()
-        if hasattr(self, 'thread') and self.thread.is_alive():
-            self.thread.join(0.5)
-
-        if hasattr(self, 'text_thread') and self.text_thread.is_alive():
-            self.text_thread.join(0.5)
-        # 销毁窗口
-        window.destroy()
-        sys.exit()
+            self.apply_settings(selector.engine_settings())
+            self.set_event_stream(selector.event_stream)
+        else:
+            # 取消配置：沿用原设置，恢复定时任务
+            self.start_timers()
+        self.status_label1.config(text="自动点击: 已暂停", fg="gray")
+        self.toggle_button.config(text="允许点击", bg="#4CAF50")
+
+    def set_event_stream(self, enabled):
+        """开启/关闭事件推送（事件写入线程负责发送，识别线程不受影响）"""
+        if enabled and self.publisher is None:
+            try:
+                self.publisher = EventPublisher(get_data_dir("events"))
+            except OSError as e:
+                print(f"无法开启事件推送: {e}")
+                return
+            self.events.publisher = self.publisher
+            LOG.info('event_stream', "事件推送已开启", address=self.publisher.address)
+        elif not enabled and self.publisher is not None:
+            self.events.publisher = None
+            self.publisher.close()
+            self.publisher = None
 
     def start_global_keyboard_listener(self):
         """启动全局键盘监听器，解决窗口焦点问题"""
         self.key_listener = KeyboardListener(on_press=self.on_key_press)
         self.key_listener.daemon = True
         self.key_listener.start()
+        self.runtime.track('keyboard', getattr(self.key_listener, 'native_id', None))
 
     def on_key_press(self, key):
         """全局键盘事件处理"""
@@ -1322,14 +4557,45 @@ class OverlayApp:
             if key == Key.f5:
                 # 通过线程安全方式切换状态
                 self.root.after(0, self.toggle_auto_refresh)
+            # 检测F6按键：开始/停止采样分析
+            elif key == Key.f6:
+                self.root.after(0, self.toggle_profiler)
+            # 检测F7按键：导出时间线
+            elif key == Key.f7:
+                self.root.after(0, self.export_trace)
         except AttributeError:
             pass
 
+    def export_trace(self):
+        """导出最近的时间线（Chrome trace格式）到配置目录"""
+        try:
+            path = self.trace.export(get_data_dir("trace"))
+            LOG.info('trace.export', f"时间线已导出: {path}", events=len(self.trace.events))
+        except OSError as e:
+            LOG.error('trace.export', f"导出时间线失败: {e}")
+
+    def toggle_profiler(self):
+        """通过F6键开始/停止采样分析，停止时在配置文件旁输出折叠栈文件"""
+        if not self.profiler.running:
+            self.profiler.start()
+            self.root.title("鼠鼠伴生器灵Ver2.3 [F6采样中]")
+            return
+
+        self.profiler.stop()
+        self.root.title("鼠鼠伴生器灵Ver2.3")
+        try:
+            path = self.profiler.dump(get_config_path().parent)
+            print(f"采样结果已保存: {path}（{self.profiler.samples}次采样）")
+        except OSError as e:
+            print(f"保存采样结果失败: {e}")
+
     def toggle_auto_refresh(self, event=None):
         """通过F5键切换自动刷新状态"""
         self.auto_refresh_running = not self.auto_refresh_running
-        # 取消自动刷新定时器
-        self.auto_refresh_delay = None
+        # 取消自动刷新定时任务（F5立即开始/停止）
+        if self.auto_refresh_task is not None:
+            self.scheduler.cancel(self.auto_refresh_task)
+            self.auto_refresh_task = None
         if self.auto_refresh_running:
 
             if self.click_paused:  # 若点击功能被暂停
@@ -1339,6 +4605,7 @@ class OverlayApp:
             # 启动循环点击线程
             self.auto_refresh_thread = threading.Thread(
                 target=self.auto_refresh_action,
+                name="refresh",
                 daemon=True
             )
             self.auto_refresh_thread.start()
@@ -1352,44 +4619,96 @@ class OverlayApp:
             self.status_label2.config(text="自动刷新:已暂停", fg="gray")
 
     def auto_refresh_action(self):
-        event = threading.Event()
-        """执行循环点击操作"""
-        steps = self.refresh_interval_steps
+        """执行循环点击操作（状态机见AutoBuyController）"""
+        runtime_settings = self.settings.runtime
+        self.runtime.enter('click', runtime_settings.click_cores, runtime_settings.boost_click)
+        self.controller.refresh_interval_steps = self.settings.refresh_interval_steps
+        self.controller.speculative = self.settings.speculative
+        self.controller.run_refresh_loop()
+
+    # === 控制器状态（由AutoBuyController维护） ===
+    @property
+    def auto_refresh_running(self):
+        return self.controller.running
+
+    @auto_refresh_running.setter
+    def auto_refresh_running(self, value):
+        self.controller.running = value
+
+    @property
+    def click_count(self):
+        return self.controller.click_count
+
+    @property
+    def success_count(self):
+        return self.controller.success_count
+
+    # === AutoBuyListener回调（在刷新线程中执行） ===
+    def on_refresh(self, cycle, start_ns, end_ns):
+        self.trace.add('refresh_click', start_ns, end_ns)
+        self.events.append(EVENT_REFRESH, cycle)
+
+    def on_escape(self, start_ns, end_ns):
+        self.trace.add('esc', start_ns, end_ns)
+
+    def on_click_start(self, item_index, price):
+        self.status_label1.config(text=f"自动点击: {self.item_prefix(item_index)}尝试以（{price}Hv＄）点击", fg="red")
+        self.click_count_label.config(text=f"点击: {self.click_count}次")
+
+    def on_clicked(self, item_index, price, capture_ns, decision_ns, click_start_ns, click_end_ns):
+        self.latency_log.begin_attempt(price, capture_ns, decision_ns, click_start_ns, click_end_ns)
+        self.trace.add('click', click_start_ns, click_end_ns, item=item_index, price=price)
+        self.events.append(EVENT_CLICK, item_index, price)
+        self.arm_success_detection()
+
+    def on_click_done(self, item_index):
+        # 添加视觉反馈
+        self.flash_canvas("green")
+
+    def on_preposition(self, item_index, price):
+        self.trace.instant('preposition', item=item_index, price=price)
+
+    def on_preposition_cancelled(self, item_index):
+        self.trace.instant('preposition_cancelled', item=item_index)
+
+    def on_item_limit(self, item_index, message):
+        self.status_label1.config(text=f"{self.item_prefix(item_index)}{message}，停止点击该商品", fg="red")
+        self.flash_canvas("green")
+
+    def on_all_limits(self, item_index, message):
+        prefix = self.item_prefix(item_index)
+        # 所有商品都已结束：自动刷新暂停
+        self.auto_refresh_label.config(text="F5启动自动刷新", bg="#2196F3")
+        self.status_label2.config(text="自动刷新:已暂停", fg="gray")
 
-        try:
-            while self.auto_refresh_running:
+        # 自动暂停自动采购
+        self.click_paused = True
+        self.toggle_button.config(text="允许点击", bg="#4CAF50")
+        self.status_label1.config(text=f"{prefix}{message}", fg="red")
 
-                # 如果点击完成后自动刷新被停止了，则退出
-                if not self.auto_refresh_running:
-                    return
-                event.wait(0.05)
-                self.mouse.press(Button.left)
-                event.wait(0.05)
-                self.mouse.release(Button.left)
-                # 使用短时循环替代长sleep
-                for _ in range(steps):  # 拆分成N次*0.05秒
-                    if not self.auto_refresh_running:
-                        return
-                    event.wait(0.05)
-                if self.price_value is not None and self.THRESHOLD1 < self.price_value < self.THRESHOLD2:
-                    self.perform_click(self.price_value)
-                # ESC按键
-                if not self.auto_refresh_running:
-                    return
+        # 添加视觉反馈
+        self.flash_canvas("red")
 
-                self.keyboard.press(Key.esc)
-                event.wait(0.05)
-                self.keyboard.release(Key.esc)
-                # 使用短时循环替代长sleep
-                for _ in range(steps):  # 拆分成N次*0.05秒
-                    if not self.auto_refresh_running:
-                        return
-                    event.wait(0.05)
+        # 显示提示信息
+        messagebox.showinfo("提示", f"{prefix}{message}，计数归零，自动点击已暂停")
+
+    def on_counts_reset(self):
+        self.click_count_label.config(text=f"点击: {self.click_count}次")
+        self.success_count_label.config(text=f"成功: {self.success_count}次")
+
+    def on_refresh_error(self, error):
+        LOG.error('refresh', f"自动刷新异常: {str(error)}")
+        self.root.after(0, lambda: self.status_label2.config(
+            text=f"自动刷新异常: {str(error)}", fg="red"))
+
+    def on_click_error(self, item_index, error):
+        self.status_label1.config(text=f"状态: 点击失败 - {str(error)}", fg="red")
+        LOG.error('click', f"点击失败: {str(error)}", item=item_index)
+
+    def item_prefix(self, item_index):
+        """多商品时在提示前加上商品名"""
+        return f"[{self.watch_items[item_index].name}]" if len(self.watch_items) > 1 else ""
 
-        except Exception as e:
-            print(f"自动刷新异常: {str(e)}")
-            self.root.after(0, lambda: self.status_label2.config(
-                text=f"自动刷新异常: {str(e)}", fg="red"))
     def toggle_click(self):
         """切换点击启用状态"""
         with self.lock:
@@ -1403,175 +4722,219 @@ class OverlayApp:
 
     def update_overlay(self):
         """持续更新识别区域内容"""
-        with mss() as sct:
+        with self.frame_source() as sct:
             event = threading.Event()
-            # 创建字典存储不同分辨率的模板 [1](@ref)
-            templates = {resolution: {} for resolution in ['1k', '2k', '4k']}
-
-            # 加载三个分辨率的所有模板
-            for resolution in templates.keys():
-                for digit in range(10):
-                    template_path = resource_path(f"digits{resolution}/{digit}.png")
-                    try:
-                        with open(template_path, 'rb') as f:
-                            img_data = np.frombuffer(f.read(), dtype=np.uint8)
-                            template = cv2.imdecode(img_data, cv2.IMREAD_GRAYSCALE)
-                        templates[resolution][digit] = template
-                    except Exception as e:
-                        print(f"加载模板失败 [{resolution}/{digit}]: {e}")
+            template_source = TemplateSource(self.ocr_cache)
+            current = None  # 当前截图范围对应的设置
 
+            perf = self.perf
+            trace = self.trace
+            governor = self.capture_governor
+            backoff = self.ERROR_BACKOFF_MIN
             while self.running:
-                start_time = time.time()
+                governor.begin()
 
                 try:
-                    # 1. 截取指定区域
-                    screenshot = sct.grab(self.MONITOR_REGION)
-                    img_bgra = np.array(screenshot)
-                    if img_bgra.size == 0:
-                        print("警告：空截图，跳过本帧")
+                    # 0. 帧间取用最新设置，区域变化时才重算截图范围和切换模板
+                    settings, states = self.active
+                    if settings is not current:
+                        if current is None or settings.runtime != current.runtime:
+                            self.runtime.enter('capture', settings.runtime.ocr_cores)
+                        if current is None or len(settings.watch_items) != len(current.watch_items):
+                            self.match_mode = MatchModeSelector()  # 商品数变化后重新比较两种匹配方式
+                        current = settings
+                        capture_groups = capture_layout(settings.watch_items)
+                        images = [None] * len(settings.watch_items)
+                        while len(self.ocr_workspaces) < len(settings.watch_items):
+                            self.ocr_workspaces.append(FrameWorkspace())
+                        # 有该区域尺寸/DPI的校准模板时只用这一套，否则用三个分辨率的所有模板；
+                        # 重新配置时可能刚重新校准过，校准版本变化也重新加载
+                        if template_source.refresh(settings.watch_items[0].region):
+                            LOG.info('templates', "数字模板已加载", directory=str(template_source.key[0]),
+                                     calibrated=template_source.key[1] is not None)
+                        templates = template_source.templates
+
+                    # 1. 每组相邻区域截一次图（直接引用mss的像素缓冲区，不复制）
+                    t0 = time.perf_counter_ns()
+                    empty_region = None
+                    for capture_region, item_slices in capture_groups:
+                        screenshot = sct.grab(capture_region)
+                        capture_bgra = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(
+                            screenshot.height, screenshot.width, 4)
+                        if capture_bgra.size == 0:
+                            empty_region = capture_region
+                            break
+                        for index, rows, cols in item_slices:
+                            images[index] = capture_bgra[rows, cols]
+                    t1 = time.perf_counter_ns()
+                    perf.record('grab', t1 - t0)
+                    trace.add('capture', t0, t1, grabs=len(capture_groups))
+                    if empty_region is not None:
+                        LOG.warning('capture.empty', "警告：空截图，跳过本帧", region=empty_region)
+                        event.wait(backoff)
+                        backoff = min(backoff * 2, self.ERROR_BACKOFF_MAX)
                         continue
 
-                    # 转换为灰度图并进行预处理
-                    gray = cv2.cvtColor(img_bgra, cv2.COLOR_BGRA2GRAY)
-                    self.adaptive_threshold = self.preprocess_image(gray)
-                    img = Image.fromarray(self.adaptive_threshold)
-
-                    # 2. 在画布上实时显示
-                    self.display_on_canvas(img)
-
-                    # 3. 多分辨率OCR识别
-                    self.process_ocr(img_bgra, templates)
-
-                    process_time =  time.time() - start_time
-                    wait_time = max(0.05 - process_time, 0.001)
-                    event.wait(timeout=wait_time)
+                    # 2. 多分辨率OCR识别（预处理结果写入各商品的工作缓冲区）
+                    self.process_ocr(images, templates, t0, settings.watch_items, states)
+                    t2 = time.perf_counter_ns()
+                    trace.add('ocr', t1, t2, items=len(images))
+
+                    # 3. 在画布上实时显示主商品的二值图
+                    self.adaptive_threshold = self.ocr_workspaces[0].buffers['padded'][
+                        PRICE_PADDING:-PRICE_PADDING, PRICE_PADDING:-PRICE_PADDING]
+                    self.display_on_canvas(Image.fromarray(self.adaptive_threshold), settings.watch_items[0].region)
+                    t3 = time.perf_counter_ns()
+                    perf.record('preview', t3 - t2)
+                    perf.record('frame', t3 - t0)
+
+                    # 按CPU预算/目标延迟决定下一帧的等待时间
+                    backoff = self.ERROR_BACKOFF_MIN
+                    event.wait(timeout=governor.end())
                 except Exception as e:
-                    print(f"更新覆盖层出错: {e}")
-                    break
-    def display_on_canvas(self, pil_img):
-        """在Canvas上显示图像"""
-        tk_img = ImageTk.PhotoImage(pil_img.resize(
-            (self.MONITOR_REGION['width'], self.MONITOR_REGION['height'])))
-
-        self.canvas.create_image(0, 0, anchor=tk.NW, image=tk_img)
-        self.canvas.image = tk_img  # 防止被垃圾回收
-
-    def process_ocr(self, img_bgra, templates):
-        """执行OCR并更新UI，支持多分辨率模板匹配与优化"""
-        self.price_value = None  # 默认设置为None，表示当前没有识别到价格
-        # 1. 图像预处理强化
-        gray = cv2.cvtColor(img_bgra, cv2.COLOR_BGRA2GRAY)
-        self.adaptive_threshold = self.preprocess_image(gray)
-        # 在预处理后，进行填充
-        padding_width = 20
-        self.adaptive_threshold = cv2.copyMakeBorder(self.adaptive_threshold,
-                                                padding_width, padding_width,
-                                                padding_width, padding_width,
-                                                cv2.BORDER_CONSTANT, value=0)
-        # 2. 存储匹配结果 (x, y, w, h, digit, confidence, resolution)
-        matches = []
-
-        # 多分辨率模板匹配
-        for resolution, digit_templates in templates.items():
-            for digit, template in digit_templates.items():
-                # 跳过空模板
-                if template.size == 0:
-                    continue
+                    # 出错后退避重试，连续出错时等待时间翻倍（上限ERROR_BACKOFF_MAX秒）
+                    LOG.error('capture.error', f"更新覆盖层出错: {e}", retry_in=backoff)
+                    event.wait(backoff)
+                    backoff = min(backoff * 2, self.ERROR_BACKOFF_MAX)
 
-                # 模板匹配
-                res = cv2.matchTemplate(self.adaptive_threshold, template, cv2.TM_CCOEFF_NORMED)
-                _, max_val, _, max_loc = cv2.minMaxLoc(res)
+    ERROR_BACKOFF_MIN = 0.05  # 采集出错后的首次重试等待（秒）
+    ERROR_BACKOFF_MAX = 2.0
 
-                # 动态阈值：最高置信度的75%且不低于0.72
-                threshold = max(0.7, max_val * 0.75)
-                loc = np.where(res >= threshold)
+    def display_on_canvas(self, pil_img, region):
+        """在Canvas上显示图像（按监控区域尺寸）"""
+        self.show_preview(self.canvas, pil_img, (region[2], region[3]))
 
-                # 提取匹配位置
-                w, h = template.shape[::-1]
-                for pt in zip(*loc[::-1]):
-                    confidence = res[pt[1], pt[0]]
-                    # 存储完整信息（新增resolution字段）
-                    matches.append((pt[0], pt[1], w, h, digit, confidence, resolution))
+    def show_preview(self, canvas, pil_img, size):
+        """把图像显示到预览画布
 
-        # 3. 非极大值抑制（NMS）处理重复匹配
-        if not matches:
-            self.result_label.config(text="识别结果: 无数字")
+        画布上始终只有一个图像项：尺寸不变时把像素贴进已有的PhotoImage，
+        否则新建PhotoImage并用itemconfig替换，长时间运行时画布项和Tk图像不会累积。
+        """
+        pil_img = pil_img.resize(size)
+        photo = getattr(canvas, 'image', None)
+        if photo is not None and (photo.width(), photo.height()) == size:
+            photo.paste(pil_img)
             return
-
-        boxes_wh = np.array([[x, y, w, h] for (x, y, w, h, _, _, _) in matches])
-        confidences = [conf for (_, _, _, _, _, conf, _) in matches]
-
-        # OpenCV NMS处理
-        indices = cv2.dnn.NMSBoxes(
-            boxes_wh.tolist(),
-            confidences,
-            score_threshold=0.5,
-            nms_threshold=0.3  # 重叠度>30%则抑制
-        )
-
-        # 4. 保留NMS筛选后的匹配
-        filtered_matches = []
-        if indices is not None:
-            for i in indices.flatten():
-                x, y, w, h, digit, conf, res = matches[i]
-                filtered_matches.append((x, digit, conf, res))
+        photo = ImageTk.PhotoImage(pil_img)
+        item = getattr(canvas, 'image_item', None)
+        if item is None:
+            canvas.image_item = canvas.create_image(0, 0, anchor=tk.NW, image=photo)
         else:
-            self.result_label.config(text="识别结果: 无有效匹配")
-            return
-
-        # 5. 空间聚类与数字序列组合
-        filtered_matches.sort(key=lambda x: x[0])  # 按x坐标排序
-        digits = []
-        prev_x = -100
-        used_resolutions = set()
-
-        for x, digit, conf, res in filtered_matches:
-            if abs(x - prev_x) > 5:  # 基础去重
-                digits.append(str(digit))
-                prev_x = x
-                used_resolutions.add(res)  # 记录使用的分辨率
-
-        # 6. 结果格式化与校验
-        price_str = ''.join(digits)
-        if not price_str.isdigit():
-            self.result_label.config(text=f"非法字符: {price_str}")
-            return
-
-        self.price_value = int(price_str)
-        self.price_formatted = f"{self.price_value:,}" if len(price_str) > 3 else price_str
-        # 7. 更新UI与条件检查（添加分辨率信息）
-        res_info = "&".join(used_resolutions) if used_resolutions else "无"
-        display_text = f"识别结果: {self.price_formatted} (置信度: {np.mean(confidences):.2f}, 模板: {res_info})"
-        self.result_label.config(text=display_text)
+            canvas.itemconfig(item, image=photo)
+        canvas.image = photo  # 防止被垃圾回收
 
+    def after_coalesced(self, key, delay_ms, callback):
+        """调度after回调，同一key只保留最新的一个
 
-    def preprocess_image(self,image):
+        高频调用（每帧更新标签、闪烁复位）时旧的待执行回调会被取消，界面线程的队列不会堆积。
         """
-        对图像进行自适应二值化预处理，可选择添加形态学操作
-        参数:
-            image: 输入灰度图像
-            apply_morphology: 是否应用形态学操作
-        返回:
-            预处理后的二值图像
+        def run():
+            with self.after_lock:
+                if self.pending_after.get(key) == after_id[0]:
+                    del self.pending_after[key]
+            callback()
+
+        after_id = [None]
+        with self.after_lock:
+            previous = self.pending_after.pop(key, None)
+            if previous is not None:
+                self.root.after_cancel(previous)
+            after_id[0] = self.pending_after[key] = self.root.after(delay_ms, run)
+
+    def process_ocr(self, images, templates, capture_ns, watch_items, item_states):
+        """对所有监控商品执行OCR并更新UI，支持多分辨率模板匹配与优化
+
+        watch_items/item_states是本帧开始时取到的一致快照（见apply_settings）。
+        capture_ns为截图开始时刻，自动购买据此判断价格是否来自刷新之后的页面。
         """
-        # 自适应二值化参数设置
-        block_size = 31  # 邻域大小，必须是奇数
-        c_value = -2  # 从计算阈值中减去的常数
-
-        # 应用自适应二值化（高斯加权）
-        binary = cv2.adaptiveThreshold(
-            image,
-            255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY,
-            block_size,
-            c_value
-        )
+        lines = []
+        stats_changed = False
+        results = self.match_mode.recognize(images, templates, self.perf, self.ocr_cache,
+                                            self.ocr_workspaces, self.mosaic_workspace)
+        verify_available = self.verifier.available is not False
+        for index, (item, state, result) in enumerate(zip(watch_items, item_states, results)):
+            tracker = state.tracker
+            sequence = tracker.observe(result, verify_available)
+            if sequence is not None and not self.verifier.submit(
+                    images[index], functools.partial(tracker.verify, sequence)):
+                tracker.cancel_verify(sequence)
+            previous_price = state.price_value
+            previous_tentative = (state.tentative_value, state.tentative_since_ns)
+            price = tracker.price
+            pending = tracker.pending
+            # 价格变化时先清空再写时刻和新价格，刷新线程不会拿到新价格配旧时刻（或反过来）
+            if price != previous_price:
+                state.price_value = None
+            if pending != state.tentative_value:
+                state.tentative_value = None
+                state.tentative_since_ns = capture_ns if pending is not None else None
+
+            # 记录满足条件的价格首次出现的帧（用于端到端延迟统计，自动购买据此排除刷新前的旧页面），
+            # 复核后确认的价格从暂定价格首次出现的帧算起
+            if price is not None and item.threshold1 < price < item.threshold2:
+                if state.qualify_since_ns is None or price != previous_price:
+                    since_ns = previous_tentative[1] if previous_tentative[0] == price else None
+                    state.qualify_since_ns = since_ns or capture_ns
+            else:
+                state.qualify_since_ns = None
+            state.tentative_value = pending
+            state.price_value = price
+            state.confidence = result.confidence
+
+            # 每次新确认的价格计入统计（同一价格的后续帧不重复计入）
+            if price is not None and price != previous_price:
+                self.price_stats.update(item, price)
+                stats_changed = True
+
+            # 价格事件只在读数变化时记录（读不出后再出现同一价格也算变化）
+            event_price = result.value if result.status == 'ok' else None
+            if event_price is not None and event_price != state.event_price:
+                self.events.append(EVENT_PRICE, index, result.value, result.confidence)
+            state.event_price = event_price
+            line = self.format_ocr_result(result)
+            status = tracker.status_text()
+            lines.append(f"{line} [{status}]" if status else line)
+
+        self.price_value = item_states[0].price_value
+        if len(lines) == 1:
+            self.result_label.config(text=lines[0])
+        else:
+            self.result_label.config(text="\n".join(
+                f"{item.name} {line}" for item, line in zip(watch_items, lines)))
+        if stats_changed:
+            self.refresh_price_stats_label(watch_items)
+
+    def refresh_price_stats_label(self, watch_items):
+        self.price_stats_label.config(text="\n".join(
+            self.price_stats.format_summary(item) for item in watch_items))
+
+    def format_ocr_result(self, result):
+        """识别结果的显示文本"""
+        if result.status == 'no_digits':
+            return "识别结果: 无数字"
+        if result.status == 'no_match':
+            return "识别结果: 无有效匹配"
+        if result.status == 'invalid':
+            return f"非法字符: {result.text}"
+
+        price_formatted = f"{result.value:,}" if len(result.text) > 3 else result.text
+        # 添加分辨率信息
+        res_info = "&".join(result.resolutions) if result.resolutions else "无"
+        return f"识别结果: {price_formatted} (置信度: {result.confidence:.2f}, 模板: {res_info})"
+
+    def preprocess_image(self, image):
+        """对图像进行自适应二值化预处理"""
+        return preprocess_image(image)
+
+    SUCCESS_THRESHOLD = 0.68      # 全分辨率确认阈值
+    SUCCESS_COARSE_SCALE = 0.5    # 粗匹配缩放比例
+    SUCCESS_COARSE_THRESHOLD = 0.5  # 粗匹配低于此值直接跳过该模板
+    SUCCESS_IDLE_INTERVAL = 0.5   # 未布防时的预览刷新间隔（秒）
 
-        return binary
     def load_success_templates(self):
-        """加载成功标志模板"""
+        """加载成功标志模板（同时准备粗匹配用的缩小模板）"""
         self.success_templates = []
+        self.success_templates_coarse = []
         template_dir = resource_path('success')
 
         for i in range(3):  # 0,1,2
@@ -1580,72 +4943,133 @@ class OverlayApp:
                 template_img = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
                 if template_img is not None:
                     self.success_templates.append(template_img)
+                    self.success_templates_coarse.append(cv2.resize(
+                        template_img, None,
+                        fx=self.SUCCESS_COARSE_SCALE, fy=self.SUCCESS_COARSE_SCALE,
+                        interpolation=cv2.INTER_AREA))
             except Exception as e:
                 print(f"加载模板 {i}.png 失败: {e}")
 
+    def arm_success_detection(self):
+        """点击后布防成功检测，持续success_window秒"""
+        self.success_armed_until = time.monotonic() + self.settings.success_window
+        self.success_arm_event.set()
 
     def match_success_templates(self, text_img):
-        """在文本监控区域匹配成功标志"""
+        """在文本监控区域匹配成功标志（先在缩小图上粗定位，再在候选位置附近全分辨率确认）"""
         if not hasattr(self, 'success_templates') or not self.success_templates:
-            return False
+            return 0, False
+
+        workspace = self.text_workspace
+        scale = self.SUCCESS_COARSE_SCALE
+        img_h, img_w = text_img.shape[:2]
+        coarse_size = (max(1, int(round(img_w * scale))), max(1, int(round(img_h * scale))))
+        coarse_img = cv2.resize(text_img, coarse_size, interpolation=cv2.INTER_AREA,
+                                dst=workspace.buffer('coarse', coarse_size[::-1]))
+        margin = int(round(1 / scale)) + 2
 
-        # 预处理文本区域图像
         # 对每个模板进行匹配
-        for template in self.success_templates:
-            res = cv2.matchTemplate(text_img, template, cv2.TM_CCOEFF_NORMED)
+        for index, (template, coarse_template) in enumerate(zip(self.success_templates, self.success_templates_coarse)):
+            t_h, t_w = template.shape[:2]
+            c_h, c_w = coarse_template.shape[:2]
+            if t_h > img_h or t_w > img_w or c_h > coarse_img.shape[0] or c_w > coarse_img.shape[1]:
+                continue
+
+            # 粗匹配定位候选位置
+            res = workspace.buffer(('coarse_match', index),
+                                   (coarse_img.shape[0] - c_h + 1, coarse_img.shape[1] - c_w + 1), 'float32')
+            res = cv2.matchTemplate(coarse_img, coarse_template, cv2.TM_CCOEFF_NORMED, result=res)
+            _, coarse_val, _, coarse_loc = cv2.minMaxLoc(res)
+            if coarse_val < self.SUCCESS_COARSE_THRESHOLD:
+                continue
+
+            # 在候选位置附近用全分辨率模板确认
+            x = int(coarse_loc[0] / scale)
+            y = int(coarse_loc[1] / scale)
+            x0, y0 = max(0, x - margin), max(0, y - margin)
+            x1, y1 = min(img_w, x + t_w + margin), min(img_h, y + t_h + margin)
+            if y1 - y0 < t_h or x1 - x0 < t_w:
+                continue
+            res = workspace.buffer(('fine_match', index), (y1 - y0 - t_h + 1, x1 - x0 - t_w + 1), 'float32')
+            res = cv2.matchTemplate(text_img[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED, result=res)
             _, max_val, _, _ = cv2.minMaxLoc(res)
 
             # 如果匹配度超过阈值则认为匹配成功
-            if max_val > 0.68:
-                return max_val,True
+            if max_val > self.SUCCESS_THRESHOLD:
+                return max_val, True
 
-        return 0,False
+        return 0, False
 
     def update_text_overlay(self):
         """更新文本监控区域内容"""
-        with mss() as sct:
+        with self.frame_source() as sct:
             event = threading.Event()
             self.load_success_templates()  # 加载模板
 
             # 记录上一帧是否匹配成功（用于边缘检测）
             last_match = False
+            last_idle_text = None
 
+            perf = self.perf
+            governor = self.text_governor
+            region = text_region = runtime_settings = None
             while self.running:
-                start_time = time.time()
+                governor.begin()
                 try:
-                    # 截取文本监控区域
-                    screenshot = sct.grab(self.TEXT_REGION)
-                    img_bgra = np.array(screenshot)
+                    if self.settings.runtime != runtime_settings:
+                        runtime_settings = self.settings.runtime
+                        self.runtime.enter('text', runtime_settings.ocr_cores)
+                    # 截取文本监控区域（帧间取用最新设置）
+                    if self.settings.text_region != region:
+                        region = self.settings.text_region
+                        text_region = capture_bounds([region])
+                    t0 = time.perf_counter_ns()
+                    screenshot = sct.grab(text_region)
+                    img_bgra = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(
+                        screenshot.height, screenshot.width, 4)
+                    t1 = time.perf_counter_ns()
+                    perf.record('text_grab', t1 - t0)
 
                     if img_bgra.size == 0:
+                        LOG.warning('text.empty', "警告：文本区域空截图，跳过本帧", region=text_region)
                         event.wait(0.05)
                         continue
 
-                    # 转换为灰度图并进行预处理
-                    gray = cv2.cvtColor(img_bgra, cv2.COLOR_BGRA2GRAY)
-                    self.adaptive_threshold_text = self.preprocess_image(gray)
-                    img = Image.fromarray(self.adaptive_threshold_text)
-                    # 在预处理后，进行填充
+                    # 转换为灰度图、预处理并填充（写入预分配缓冲区）
                     padding_width = 70
-                    padded_img  = cv2.copyMakeBorder(self.adaptive_threshold_text,
-                                                                 padding_width, padding_width,
-                                                                 padding_width, padding_width,
-                                                                 cv2.BORDER_CONSTANT, value=0)
+                    padded_img = binarize_padded(img_bgra, padding_width, self.text_workspace)
+                    self.adaptive_threshold_text = padded_img[padding_width:-padding_width,
+                                                              padding_width:-padding_width]
+                    img = Image.fromarray(self.adaptive_threshold_text)
+                    t2 = time.perf_counter_ns()
+                    perf.record('text_preprocess', t2 - t1)
                     # 在画布上实时显示
-                    self.display_on_text_canvas(img)
-
-                    # 尝试匹配成功标志
-                    confidences, current_match = self.match_success_templates(padded_img)
+                    self.display_on_text_canvas(img, region)
+                    t3 = time.perf_counter_ns()
+                    perf.record('text_preview', t3 - t2)
+
+                    # 只在点击后的检测窗口内匹配成功标志
+                    armed = time.monotonic() < self.success_armed_until
+                    if armed:
+                        confidences, current_match = self.match_success_templates(padded_img)
+                        t4 = time.perf_counter_ns()
+                        perf.record('success_match', t4 - t3)
+                        self.trace.add('success_detect', t3, t4, matched=current_match)
+                    else:
+                        confidences, current_match = 0, False
 
                     # 只在从非匹配状态变为匹配状态时计数（上升沿触发）
                     if current_match and not last_match:
-                        # 成功计数器加1
-                        self.success_count += 1
-                        self.root.after(0, lambda: self.success_count_label.config(
+                        # 成功计数器加1（计入最近一次点击的商品）
+                        success_index = self.controller.record_success()
+                        self.trace.instant('success', item=success_index)
+                        self.latency_log.mark_success(time.perf_counter_ns())
+                        self.events.append(EVENT_SUCCESS, success_index, confidences)
+                        self.after_coalesced('success_count', 0, lambda: self.success_count_label.config(
                             text=f"成功: {self.success_count}次"))
 
                         # 更新识别结果显示
-                        self.root.after(0, lambda: self.text_result_label.config(
+                        self.after_coalesced('text_result', 0, lambda: self.text_result_label.config(
                             text=f"文本识别: 成功匹配! (置信度: {np.mean(confidences):.2f})",
                             fg="green"))
 
@@ -1655,127 +5079,132 @@ class OverlayApp:
                     # 更新匹配状态
                     last_match = current_match
 
-                    # 更新识别状态（如果没有匹配）
-                    if not current_match:
-                        self.root.after(0, lambda: self.text_result_label.config(
-                            text=f"文本识别: 未匹配成功",
+                    # 更新识别状态（如果没有匹配，只在状态变化时更新）
+                    idle_text = "文本识别: 未匹配成功" if armed else "文本识别: 等待点击后检测"
+                    if not current_match and idle_text != last_idle_text:
+                        self.after_coalesced('text_result', 0, lambda text=idle_text: self.text_result_label.config(
+                            text=text,
                             fg="black"))
+                    last_idle_text = None if current_match else idle_text
 
-                    process_time = time.time() - start_time
-                    wait_time = max(0.05 - process_time, 0.001)
-                    event.wait(timeout=wait_time)
+                    if armed:
+                        event.wait(timeout=governor.end())
+                    else:
+                        # 未布防：低频刷新预览，点击布防时立即唤醒
+                        self.success_arm_event.wait(self.SUCCESS_IDLE_INTERVAL)
+                        self.success_arm_event.clear()
 
                 except Exception as e:
-                    print(f"更新文本监控出错: {e}")
-                    # 打印图像尺寸
                     try:
-                        print(f"图像尺寸: {padded_img.shape}")
-                    except:
-                        print("图像尺寸未知")
+                        shape = padded_img.shape
+                    except NameError:
+                        shape = "未知"
+                    LOG.error('text.error', f"更新文本监控出错: {e}", shape=shape)
                     time.sleep(0.1)
 
-    def display_on_text_canvas(self, pil_img):
-        """在文本Canvas上显示图像"""
-        tk_img = ImageTk.PhotoImage(pil_img.resize(
-            (self.TEXT_REGION['width'], self.TEXT_REGION['height'])))
-
-        self.text_canvas.create_image(0, 0, anchor=tk.NW, image=tk_img)
-        self.text_canvas.image = tk_img  # 防止被垃圾回收
+    def display_on_text_canvas(self, pil_img, region):
+        """在文本Canvas上显示图像（按文本区域尺寸）"""
+        self.show_preview(self.text_canvas, pil_img, (region[2], region[3]))
 
     def flash_text_canvas(self, color):
         """文本匹配成功视觉反馈"""
         self.text_canvas.config(bg=color)
-        self.root.after(100, lambda: self.text_canvas.config(bg='white'))
-    def perform_click(self, current_num):
-        """在指定位置执行鼠标点击"""
-        event = threading.Event()
+        self.after_coalesced('text_flash', 100, lambda: self.text_canvas.config(bg='white'))
+    def perform_click(self, current_num, capture_ns=None, decision_ns=None, item_index=0):
+        """在指定商品的位置执行鼠标点击"""
+        self.controller.perform_click(current_num, capture_ns, decision_ns, item_index)
+
+    def toggle_stats_panel(self):
+        """打开/关闭性能统计面板"""
+        if self.stats_window is not None:
+            self.close_stats_panel()
+            return
 
+        self.stats_window = tk.Toplevel(self.root)
+        self.stats_window.title("性能统计")
+        self.stats_window.attributes('-topmost', True)
+        self.stats_window.protocol("WM_DELETE_WINDOW", self.close_stats_panel)
+
+        self.stats_text_label = tk.Label(self.stats_window,
+                                         text="",
+                                         font=("Consolas", 9),
+                                         justify=tk.LEFT,
+                                         anchor="w")
+        self.stats_text_label.pack(fill=tk.BOTH, padx=10, pady=5)
+
+        stats_btn_frame = tk.Frame(self.stats_window)
+        stats_btn_frame.pack(fill=tk.X, padx=10, pady=5)
+        tk.Button(stats_btn_frame, text="清零", command=self.reset_stats).pack(side=tk.LEFT)
+        tk.Button(stats_btn_frame, text="导出", command=self.export_perf_stats).pack(side=tk.LEFT, padx=5)
+        tk.Button(stats_btn_frame, text="导出时间线", command=self.export_trace).pack(side=tk.LEFT)
+        tk.Button(stats_btn_frame, text="清空价格统计", command=self.reset_price_stats).pack(side=tk.LEFT, padx=5)
+
+        self.update_stats_panel()
+
+    def update_stats_panel(self):
+        """每秒刷新一次统计面板"""
+        if self.stats_window is None:
+            return
+        self.runtime.sample()
+        self.stats_text_label.config(text="\n".join([self.perf.format_table(), "",
+                                                     self.ocr_cache.format_stats(),
+                                                     self.verifier.format_stats(),
+                                                     self.capture_governor.format_status(),
+                                                     self.text_governor.format_status(), "",
+                                                     self.runtime.format_status(),
+                                                     self.format_preposition_stats(),
+                                                     self.publisher.format_stats() if self.publisher else "", "",
+                                                     self.price_stats.format_table(self.watch_items)]))
+        self.stats_after_id = self.root.after(1000, self.update_stats_panel)
+
+    def format_preposition_stats(self):
+        controller = self.controller
+        if not controller.speculative:
+            return "预判点击: 未开启"
+        return f"预判点击: 命中{controller.preposition_hits}次  落空{controller.preposition_misses}次"
+
+    def reset_stats(self):
+        """统计面板清零"""
+        self.perf.reset()
+        self.ocr_cache.reset_counters()
+
+    def reset_price_stats(self):
+        """清空当前监控商品的价格统计（换了商品但区域没变时使用）"""
+        if not messagebox.askyesno("价格统计", "清空当前监控商品的价格统计？", parent=self.stats_window):
+            return
+        watch_items = self.watch_items
+        self.price_stats.reset(watch_items)
+        self.refresh_price_stats_label(watch_items)
+
+    def close_stats_panel(self):
+        """关闭统计面板"""
+        if self.stats_after_id is not None:
+            self.root.after_cancel(self.stats_after_id)
+            self.stats_after_id = None
+        if self.stats_window is not None:
+            self.stats_window.destroy()
+            self.stats_window = None
+
+    def export_perf_stats(self):
+        """导出性能统计到配置目录"""
         try:
-            # 设置点击中状态，暂停自动刷新
-            self.is_clicking = True
-            # 更新状态显示
-            self.status_label1.config(text=f"自动点击: 尝试以（{current_num}Hv＄）点击", fg="red")
-            # 更新点击计数器
-            self.click_count += 1
-            self.click_count_label.config(text=f"点击: {self.click_count}次")
-            # 使用pynput执行精确点击
-            original_pos = self.mouse.position  # 保存原始位置
-
-            # 移动鼠标到目标位置
-            self.mouse.position = self.NUM_POSITION
-              # 确保移动到位
-            # 执行左键点击
-            self.mouse.click(Button.left, 1)  # 单次点击
-            event.wait(0.01)  # 确保移动到位
-
-            # 移动鼠标到目标位置
-            self.mouse.position = self.CLICK_POSITION
-            event.wait(0.01)  # 确保移动到位
-
-            # 执行左键点击
-            self.mouse.click(Button.left, 1)  # 单次点击
-            event.wait(0.01)  # 确保移动到位
-
-            # 可选：返回原始位置（根据需求决定）
-            self.mouse.position = original_pos
-            event.wait(0.5)  # 确保移动到位
-
-
-
-            if self.click_count >= self.MAX_ATTEMPTS:
-                # 自动刷新暂停
-                self.auto_refresh_running = False
-                self.auto_refresh_label.config(text="F5启动自动刷新", bg="#2196F3")
-                self.status_label2.config(text="自动刷新:已暂停", fg="gray")
-
-                # 自动暂停自动采购
-                self.click_paused = True
-                self.toggle_button.config(text="允许点击", bg="#4CAF50")
-                self.status_label1.config(text=f"已达最多尝试次数({self.MAX_ATTEMPTS})", fg="red")
-
-                # 添加视觉反馈
-                self.flash_canvas("red")
-
-                # 显示提示信息
-                messagebox.showinfo("提示", f"已达到最多尝试次数({self.MAX_ATTEMPTS})，计数归零，自动点击已暂停")
-
-                self.click_count = 0
-                self.click_count_label.config(text=f"点击: {self.click_count}次")
-                self.success_count = 0
-                self.success_count_label.config(text=f"成功: {self.success_count}次")
-            if self.success_count >= self.MAX_SUCCESS:
-                # 自动刷新暂停
-                self.auto_refresh_running = False
-                self.auto_refresh_label.config(text="F5启动自动刷新", bg="#2196F3")
-                self.status_label2.config(text="自动刷新:已暂停", fg="gray")
-
-                # 自动暂停自动采购
-                self.click_paused = True
-                self.toggle_button.config(text="允许点击", bg="#4CAF50")
-                self.status_label1.config(text=f"已达最多成功次数({self.MAX_SUCCESS})", fg="red")
-
-                # 添加视觉反馈
-                self.flash_canvas("red")
-
-                # 显示提示信息
-                messagebox.showinfo("提示", f"已达最多成功次数({self.MAX_SUCCESS})，计数归零，自动点击已暂停")
-                self.click_count = 0
-                self.click_count_label.config(text=f"点击: {self.click_count}次")
-                self.success_count = 0
-                self.success_count_label.config(text=f"成功: {self.success_count}次")
-            else:
-                # 添加视觉反馈
-                self.flash_canvas("green")
-
+            json_path, _ = self.perf.export(get_data_dir("perf"))
+            print(f"性能统计已导出: {json_path}")
         except Exception as e:
-            self.status_label1.config(text=f"状态: 点击失败 - {str(e)}", fg="red")
-            print(f"点击失败: {str(e)}")
+            print(f"导出性能统计失败: {e}")
 
+    def save_price_stats(self):
+        """保存价格统计，下次启动继续累计"""
+        try:
+            path = self.price_stats.save()
+            print(f"价格统计已保存: {path}")
+        except Exception as e:
+            print(f"保存价格统计失败: {e}")
 
     def flash_canvas(self, color):
         """点击成功视觉反馈"""
         self.canvas.config(bg=color)
-        self.root.after(100, lambda: self.canvas.config(bg='white'))
+        self.after_coalesced('flash', 100, lambda: self.canvas.config(bg='white'))
 
     def close_app(self):
         """安全退出应用"""
@@ -1783,10 +5212,20 @@ class OverlayApp:
         self.running = False
         if hasattr(self, 'key_listener'):
             self.key_listener.stop()  # 停止全局键盘监听器
-        # 取消关机定时器
-        if self.shutdown_timer and self.shutdown_timer.is_alive():
-            self.shutdown_timer.cancel()
+        # 取消定时任务
+        self.cancel_timers()
+        self.scheduler.stop()
         time.sleep(0.3)  # 等待线程结束
+        # 退出时导出本次会话的性能统计
+        if self.profiler.running:
+            self.toggle_profiler()
+        self.export_perf_stats()
+        self.save_price_stats()
+        self.latency_log.close()
+        self.events.close()
+        self.set_event_stream(False)
+        self.verifier.close()
+        LOG.close()
         self.root.destroy()
         sys.exit()
 
@@ -1799,6 +5238,9 @@ if __name__ == "__main__":
     except:
         pass
 
+    # 后台同步网络时间，不阻塞界面
+    TIME_SERVICE.start()
+
     # 先显示配置选择器
     selector = ParameterSelector()
 
@@ -1832,6 +5274,13 @@ if __name__ == "__main__":
                      selector.text_region,
                      selector.shutdown_time_val,  # 传递关机时间
                      selector.auto_refresh_time_val,  # 传递自动刷新时间
-                     selector.refresh_interval_steps)
+                     selector.refresh_interval_steps,
+                     selector.success_window,
+                     selector.watchlist,
+                     selector.cpu_budget / 100,
+                     selector.target_latency_ms / 1000,
+                     runtime=selector.runtime_settings(),
+                     event_stream=selector.event_stream,
+                     speculative=selector.speculative_click)
     root.protocol("WM_DELETE_WINDOW", app.close_app)
     root.mainloop()
@@ -0,0 +1,5 @@
+"""离线基准测试工具
+
+在仓库根目录下以模块方式运行，例如:
+    python -m benchmarks.ocr_bench --samples 200 --output ocr.json
+"""
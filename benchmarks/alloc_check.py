@@ -0,0 +1,86 @@
+"""每帧内存分配检查
+
+用tracemalloc统计稳态下识别一帧新分配的内存（NumPy/OpenCV数组都计入），
+对比使用与不使用预分配工作缓冲区（FrameWorkspace）两种情况，
+并核对两种情况的识别结果一致。超过上限时返回非零退出码，可用于回归检查。
+
+用法:
+    python -m benchmarks.alloc_check --rois 3 --frames 50
+"""
+import argparse
+import sys
+import tracemalloc
+
+import AutoShopping
+from benchmarks.synth import generate_dataset
+
+
+def measure(frames, templates, workspaces, mosaic_workspace, mosaic, warmup=5):
+    """返回 (每帧平均分配字节数, 每帧峰值字节数, 识别结果)"""
+    def run(images):
+        return [r.value for r in AutoShopping.recognize_prices(
+            images, templates, mosaic=mosaic, workspaces=workspaces, mosaic_workspace=mosaic_workspace)]
+
+    for images in frames[:warmup]:
+        run(images)
+
+    values = []
+    total = 0
+    peak = 0
+    tracemalloc.start()
+    try:
+        for images in frames:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            values.append(run(images))
+            current, frame_peak = tracemalloc.get_traced_memory()
+            total += max(0, current - before)
+            peak = max(peak, frame_peak - before)
+    finally:
+        tracemalloc.stop()
+    return total / len(frames), peak, values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="每帧内存分配检查")
+    parser.add_argument('--rois', type=int, default=1, help="每帧价格区域数")
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--resolution', default='2k')
+    parser.add_argument('--templates-dir', default=None, help="digits1k/2k/4k 所在目录（默认与脚本同目录）")
+    parser.add_argument('--max-peak-kb', type=float, default=16.0,
+                        help="使用工作缓冲区时允许的每帧峰值分配（KB）")
+    args = parser.parse_args(argv)
+
+    templates = AutoShopping.load_digit_templates(base_dir=args.templates_dir)
+    # 同一组区域尺寸固定（与运行时一致），每帧内容不同
+    samples = generate_dataset(templates, args.resolution, args.rois, seed=0, scale_jitter=0.0)
+    shapes = [image.shape for image, _ in samples]
+    pool = generate_dataset(templates, args.resolution, args.rois * args.frames, seed=1, scale_jitter=0.0)
+    frames = []
+    for i in range(args.frames):
+        images = []
+        for j, shape in enumerate(shapes):
+            image = pool[i * args.rois + j][0]
+            canvas = AutoShopping.np.zeros(shape, dtype=AutoShopping.np.uint8)
+            h, w = min(shape[0], image.shape[0]), min(shape[1], image.shape[1])
+            canvas[:h, :w] = image[:h, :w]
+            images.append(canvas)
+        frames.append(images)
+
+    failed = False
+    for mosaic in ([False, True] if args.rois > 1 else [False]):
+        mode = '拼图' if mosaic else '逐区域'
+        plain_avg, plain_peak, plain_values = measure(frames, templates, None, None, mosaic)
+        workspaces = [AutoShopping.FrameWorkspace() for _ in range(args.rois)]
+        ws_avg, ws_peak, ws_values = measure(frames, templates, workspaces, AutoShopping.FrameWorkspace(), mosaic)
+        agree = plain_values == ws_values
+        print(f"{mode:<4} 无缓冲区: 峰值 {plain_peak / 1024:8.1f}KB/帧  残留 {plain_avg / 1024:6.1f}KB/帧")
+        print(f"{mode:<4} 工作缓冲区: 峰值 {ws_peak / 1024:8.1f}KB/帧  残留 {ws_avg / 1024:6.1f}KB/帧"
+              f"  结果一致: {'是' if agree else '否'}")
+        if not agree or ws_peak / 1024 > args.max_peak_kb:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
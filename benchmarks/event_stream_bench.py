@@ -0,0 +1,139 @@
+"""事件推送的开销、延迟和慢订阅者处理
+
+用临时目录中的SessionEventStore+EventPublisher模拟识别线程持续写入价格事件，同时连接:
+    若干个正常订阅者    用subscribe_events逐个读取，统计收到的事件数和推送延迟（写入->收到）
+    一个卡住的订阅者    连上后不读取，积压超过上限后被断开，且不影响写入方
+                        （TCP的内核缓冲区较大，事件少时可能还没到上限）
+并对比开启/关闭推送时识别线程调用append()的耗时。Unix域套接字和TCP各测一轮。
+
+用法:
+    python -m benchmarks.event_stream_bench --events 20000 --rate 2000 --subscribers 3
+    python -m benchmarks.event_stream_bench --events 200000 --rate 0 --transport tcp   # 突发写入
+"""
+import argparse
+import json
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import AutoShopping
+from benchmarks.ocr_bench import percentile
+
+
+def produce(store, events, rate):
+    """模拟识别线程写入价格事件，返回每次append的耗时（纳秒）"""
+    costs = []
+    interval = 1.0 / rate if rate else 0.0
+    next_time = time.perf_counter()
+    for index in range(events):
+        started = time.perf_counter_ns()
+        store.append(AutoShopping.EVENT_PRICE, index % 4, 100000 + index, 0.9)
+        costs.append(time.perf_counter_ns() - started)
+        if interval:
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    return costs
+
+
+def run_transport(transport, events, subscribers, rate, backlog):
+    with tempfile.TemporaryDirectory() as directory:
+        store = AutoShopping.SessionEventStore(directory)
+        publisher = AutoShopping.EventPublisher(directory, backlog, prefer_unix=transport == 'unix')
+        store.publisher = publisher
+
+        received = [0] * subscribers
+        lags = [[] for _ in range(subscribers)]
+
+        def consume(index):
+            for event in AutoShopping.subscribe_events(directory):
+                received[index] += 1
+                if received[index] % 100 == 0:
+                    lags[index].append((time.time() - event.timestamp) * 1000)
+
+        readers = [threading.Thread(target=consume, args=(i,), daemon=True) for i in range(subscribers)]
+        for reader in readers:
+            reader.start()
+        # 卡住的订阅者：连接后从不读取
+        address = publisher.address
+        if address['family'] == 'unix':
+            stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stalled.connect(address['address'])
+        else:
+            stalled = socket.create_connection(tuple(address['address']))
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        deadline = time.time() + 2
+        while publisher.connected < subscribers + 1 and time.time() < deadline:
+            time.sleep(0.01)
+
+        costs = produce(store, events, rate)
+        store.close()
+        publisher.flush()
+        publisher.close()
+        for reader in readers:
+            reader.join(5)
+        stalled.close()
+
+        all_lags = sorted(lag for items in lags for lag in items)
+        costs.sort()
+        return {
+            'transport': publisher.address['family'],
+            'events': events,
+            'written': store.written,
+            'store_dropped': store.dropped,
+            'received': received,
+            'slow_dropped': publisher.dropped,
+            'append_p50_ns': percentile(costs, 50),
+            'append_p99_ns': percentile(costs, 99),
+            'lag_p50_ms': round(percentile(all_lags, 50), 3),
+            'lag_p99_ms': round(percentile(all_lags, 99), 3),
+        }
+
+
+def baseline(events, rate):
+    """不开启推送时append的耗时"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = AutoShopping.SessionEventStore(directory)
+        costs = sorted(produce(store, events, rate))
+        store.close()
+    return {'append_p50_ns': percentile(costs, 50), 'append_p99_ns': percentile(costs, 99)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="事件推送基准")
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--subscribers', type=int, default=3, help="正常订阅者个数")
+    parser.add_argument('--rate', type=float, default=2000, help="每秒写入事件数（0为尽快写入）")
+    parser.add_argument('--backlog', type=int, default=256 * 1024, help="单个订阅者积压上限（字节）")
+    parser.add_argument('--transport', choices=['unix', 'tcp', 'both'], default='both')
+    parser.add_argument('--output', help="结果JSON输出路径")
+    args = parser.parse_args(argv)
+
+    transports = ['unix', 'tcp'] if args.transport == 'both' else [args.transport]
+    results = {'baseline': baseline(args.events, args.rate)}
+    print(f"未推送     append p50 {results['baseline']['append_p50_ns']}ns"
+          f"  p99 {results['baseline']['append_p99_ns']}ns")
+
+    failed = False
+    for transport in transports:
+        row = run_transport(transport, args.events, args.subscribers, args.rate, args.backlog)
+        results[transport] = row
+        complete = all(count == row['written'] for count in row['received'])
+        failed |= not complete or row['slow_dropped'] > 1
+        stalled = "已断开" if row['slow_dropped'] else "未断开（积压未超过内核缓冲区+上限）"
+        print(f"{row['transport']:<10} append p50 {row['append_p50_ns']}ns  p99 {row['append_p99_ns']}ns"
+              f"  推送延迟 p50 {row['lag_p50_ms']:.3f}ms  p99 {row['lag_p99_ms']:.3f}ms")
+        print(f"           写入 {row['written']}  各订阅者收到 {row['received']}"
+              f"{'' if complete else '（不完整）'}  卡住的订阅者{stalled}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""拼图批量匹配基准
+
+同一帧需要识别多个价格区域时，对比两种方式:
+    per-roi  每个区域分别对每个模板调用一次matchTemplate
+    mosaic   所有区域拼成一张图，每个模板只调用一次matchTemplate
+随区域数增加统计每帧耗时，并核对两种方式的识别结果是否一致。
+
+另外对比截图范围：紧凑布局（区域相邻）和分散布局（区域分布在屏幕四角）下，
+单个外接矩形与capture_layout分组截图各要复制多少像素（按像素数模拟一次截图的复制耗时）。
+
+用法:
+    python -m benchmarks.mosaic_bench --rois 1,2,4,8,16 --output mosaic.json
+    python -m benchmarks.mosaic_bench --threads 1   # 单线程对比
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+import AutoShopping
+from benchmarks.ocr_bench import percentile
+from benchmarks.synth import generate_dataset
+
+
+def per_roi(binaries, templates):
+    return [AutoShopping.decode_digit_matches(AutoShopping.match_digit_templates(b, templates))
+            for b in binaries]
+
+
+def mosaic(binaries, templates):
+    return [AutoShopping.decode_digit_matches(matches)
+            for matches in AutoShopping.match_digit_templates_mosaic(binaries, templates)]
+
+
+METHODS = {
+    'per-roi': per_roi,
+    'mosaic': mosaic,
+}
+
+
+def time_method(method, frames, templates, warmup=3):
+    """返回 (每帧耗时ms列表, 每帧结果列表)"""
+    for binaries in frames[:warmup]:
+        method(binaries, templates)
+    latencies = []
+    outputs = []
+    for binaries in frames:
+        t0 = time.perf_counter_ns()
+        results = method(binaries, templates)
+        latencies.append((time.perf_counter_ns() - t0) / 1e6)
+        outputs.append([r.value for r in results])
+    latencies.sort()
+    return latencies, outputs
+
+
+SCREEN_SIZE = (2560, 1440)
+
+# 截图布局: 名称 -> [(x, y, w, h)]
+LAYOUTS = {
+    'compact': [(1200, 600, 120, 30), (1200, 640, 120, 30), (1330, 600, 120, 30), (1330, 640, 120, 30)],
+    'spread': [(40, 40, 120, 30), (2400, 40, 120, 30), (40, 1370, 120, 30), (2400, 1370, 120, 30)],
+}
+
+
+def grab_copy(screen, bounds):
+    """模拟一次截图：按范围从整屏缓冲区复制像素"""
+    top, left = bounds['top'], bounds['left']
+    return screen[top:top + bounds['height'], left:left + bounds['width']].copy()
+
+
+def capture_case(regions, screen, repeats=200):
+    """单个外接矩形 vs 分组截图：复制的像素数和p50耗时"""
+    single = [AutoShopping.capture_bounds(regions)]
+    grouped = [bounds for bounds, _ in AutoShopping.capture_layout(
+        [AutoShopping.WatchItem(str(i), region, 0, 0, (0, 0), (0, 0), 0, 0) for i, region in enumerate(regions)])]
+    row = {'region_pixels': sum(w * h for _, _, w, h in regions)}
+    for name, grabs in (('bbox', single), ('grouped', grouped)):
+        latencies = []
+        for _ in range(repeats):
+            t0 = time.perf_counter_ns()
+            for bounds in grabs:
+                grab_copy(screen, bounds)
+            latencies.append((time.perf_counter_ns() - t0) / 1e6)
+        latencies.sort()
+        row[name] = {'grabs': len(grabs), 'pixels': sum(b['width'] * b['height'] for b in grabs),
+                     'p50_ms': round(percentile(latencies, 50), 3)}
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="拼图批量匹配基准")
+    parser.add_argument('--rois', default='1,2,4,8,16', help="逗号分隔的每帧区域数")
+    parser.add_argument('--frames', type=int, default=30, help="每种区域数的帧数")
+    parser.add_argument('--resolution', default='2k', help="合成图片使用的模板分辨率")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--templates-dir', default=None, help="digits1k/2k/4k 所在目录（默认与脚本同目录）")
+    parser.add_argument('--threads', type=int, default=None, help="cv2.setNumThreads（默认不改）")
+    parser.add_argument('--output', help="结果JSON输出路径")
+    args = parser.parse_args(argv)
+
+    AutoShopping.load_vision_modules()
+    if args.threads is not None:
+        AutoShopping.cv2.setNumThreads(args.threads)
+
+    templates = AutoShopping.load_digit_templates(base_dir=args.templates_dir)
+    counts = [int(n) for n in args.rois.split(',') if n]
+    pool = generate_dataset(templates, args.resolution, max(counts) * args.frames, seed=args.seed)
+    binaries = [AutoShopping.binarize_price_image(image) for image, _ in pool]
+
+    results = []
+    for count in counts:
+        frames = [binaries[i * count:(i + 1) * count] for i in range(args.frames)]
+        row = {'rois': count}
+        outputs = {}
+        for name, method in METHODS.items():
+            latencies, outputs[name] = time_method(method, frames, templates)
+            row[name] = {
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+            }
+        row['speedup'] = round(row['per-roi']['p50_ms'] / row['mosaic']['p50_ms'], 3) if row['mosaic']['p50_ms'] else 0.0
+        row['agree'] = outputs['per-roi'] == outputs['mosaic']
+        results.append(row)
+        print(f"{count:>3}个区域  per-roi p50 {row['per-roi']['p50_ms']:>8.2f}ms"
+              f"  mosaic p50 {row['mosaic']['p50_ms']:>8.2f}ms  加速 {row['speedup']:.2f}x"
+              f"  结果一致: {'是' if row['agree'] else '否'}")
+
+    screen = np.zeros((SCREEN_SIZE[1], SCREEN_SIZE[0], 4), dtype=np.uint8)
+    capture = {}
+    for name, regions in LAYOUTS.items():
+        row = capture[name] = capture_case(regions, screen)
+        print(f"{name:>8}布局  外接矩形 {row['bbox']['pixels']:>8}像素 {row['bbox']['p50_ms']:>7.3f}ms"
+              f"  分组截图 {row['grouped']['grabs']}次 {row['grouped']['pixels']:>8}像素"
+              f" {row['grouped']['p50_ms']:>7.3f}ms  （区域共 {row['region_pixels']}像素）")
+    # 分组后截图像素不应超过各区域面积之和的CAPTURE_MERGE_RATIO倍
+    bounded = all(row['grouped']['pixels'] <= AutoShopping.CAPTURE_MERGE_RATIO * row['region_pixels']
+                  for row in capture.values())
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'resolution': args.resolution, 'frames': args.frames,
+                       'threads': AutoShopping.cv2.getNumThreads(), 'results': results,
+                       'capture': capture},
+                      f, ensure_ascii=False, indent=2)
+    return 0 if bounded and all(row['agree'] for row in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
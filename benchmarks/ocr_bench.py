@@ -0,0 +1,169 @@
+"""OCR速度与准确率基准
+
+对每种数字模板分辨率生成一批合成价格图片，分别交给各个识别引擎/配置，
+统计帧率、p50/p99延迟和完全匹配准确率，结果写成JSON便于不同版本之间对比。
+同时统计置信度低于PriceTracker.LOW_CONFIDENCE、会送去复核的读数比例（verify），
+以及置信度足够却读错、会被直接确认的比例（confident_wrong）。
+
+用法:
+    python -m benchmarks.ocr_bench --samples 300 --output result.json
+    python -m benchmarks.ocr_bench --compare baseline.json --output result.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+
+import AutoShopping
+from benchmarks.synth import generate_dataset
+
+
+def _engine_all_sets(templates, resolution):
+    """默认配置：三套模板全部参与匹配（与运行时一致）"""
+    return lambda img: AutoShopping.recognize_price(img, templates)
+
+
+def _engine_exact_set(templates, resolution):
+    """只使用与图片分辨率对应的一套模板"""
+    subset = {resolution: templates[resolution]}
+    return lambda img: AutoShopping.recognize_price(img, subset)
+
+
+# 引擎名 -> 工厂函数(templates, resolution) -> callable(BGRA图像) -> OcrResult
+ENGINES = {
+    'template': _engine_all_sets,
+    'template-exact': _engine_exact_set,
+}
+
+
+def percentile(sorted_values, percent):
+    """对已排序列表取百分位（最近秩）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(len(sorted_values) * percent / 100.0 + 0.999999) - 1))
+    return sorted_values[index]
+
+
+def run_engine(recognize, samples, warmup=5):
+    """运行一个引擎，返回统计字典"""
+    for image, _ in samples[:warmup]:
+        recognize(image)
+
+    latencies = []
+    correct = verify = confident_wrong = 0
+    started = time.perf_counter()
+    for image, expected in samples:
+        t0 = time.perf_counter_ns()
+        result = recognize(image)
+        latencies.append((time.perf_counter_ns() - t0) / 1e6)
+        if result.value == expected:
+            correct += 1
+        if result.status == 'ok':
+            if result.confidence < AutoShopping.PriceTracker.LOW_CONFIDENCE:
+                verify += 1
+            elif result.value != expected:
+                confident_wrong += 1
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'samples': len(samples),
+        'fps': round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'accuracy': round(correct / len(samples), 4) if samples else 0.0,
+        'verify': round(verify / len(samples), 4) if samples else 0.0,
+        'confident_wrong': round(confident_wrong / len(samples), 4) if samples else 0.0,
+    }
+
+
+def git_version():
+    """当前提交号（不在git仓库中时返回unknown）"""
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=Path(__file__).resolve().parent.parent,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(current, baseline, tolerance):
+    """与基线结果对比，打印差异，返回是否存在超出容差的退化"""
+    baseline_rows = {(r['engine'], r['resolution']): r for r in baseline.get('results', [])}
+    regressed = False
+    for row in current['results']:
+        old = baseline_rows.get((row['engine'], row['resolution']))
+        if old is None:
+            continue
+        fps_delta = (row['fps'] - old['fps']) / old['fps'] if old['fps'] else 0.0
+        acc_delta = row['accuracy'] - old['accuracy']
+        flag = ''
+        if fps_delta < -tolerance or acc_delta < -0.005:
+            flag = '  <-- 退化'
+            regressed = True
+        print(f"{row['engine']:<16}{row['resolution']:<5}"
+              f" fps {old['fps']:>8.1f} -> {row['fps']:>8.1f} ({fps_delta:+.1%})"
+              f"  准确率 {old['accuracy']:.3f} -> {row['accuracy']:.3f}{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OCR基准测试（合成价格图片）")
+    parser.add_argument('--samples', type=int, default=200, help="每种分辨率的样本数")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engines', default=','.join(ENGINES), help="逗号分隔的引擎名")
+    parser.add_argument('--resolutions', default=','.join(AutoShopping.DIGIT_RESOLUTIONS))
+    parser.add_argument('--templates-dir', default=None, help="digits1k/2k/4k 所在目录（默认与脚本同目录）")
+    parser.add_argument('--no-commas', action='store_true', help="不插入千位分隔符")
+    parser.add_argument('--output', help="结果JSON输出路径")
+    parser.add_argument('--compare', help="对比的基线JSON")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="允许的帧率退化比例")
+    args = parser.parse_args(argv)
+
+    templates = AutoShopping.load_digit_templates(base_dir=args.templates_dir)
+    resolutions = [r for r in args.resolutions.split(',') if r]
+    engines = [e for e in args.engines.split(',') if e]
+
+    results = []
+    for resolution in resolutions:
+        samples = generate_dataset(templates, resolution, args.samples, seed=args.seed,
+                                   commas=not args.no_commas)
+        for name in engines:
+            recognize = ENGINES[name](templates, resolution)
+            row = {'engine': name, 'resolution': resolution}
+            row.update(run_engine(recognize, samples))
+            results.append(row)
+            print(f"{name:<16}{resolution:<5} {row['fps']:>8.1f} fps  p50 {row['p50_ms']:>7.2f}ms"
+                  f"  p99 {row['p99_ms']:>7.2f}ms  准确率 {row['accuracy']:.3f}"
+                  f"  复核 {row['verify']:.1%}  高置信度误读 {row['confident_wrong']:.1%}")
+
+    report = {
+        'version': git_version(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'config': {'samples': args.samples, 'seed': args.seed, 'commas': not args.no_commas},
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
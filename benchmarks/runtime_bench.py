@@ -0,0 +1,109 @@
+"""线程绑核/优先级对点击线程唤醒延迟的影响
+
+后台开若干个负载线程做OpenCV运算（模拟识别线程和游戏抢占CPU），
+点击线程按自动刷新的节奏反复短暂等待，统计每次醒来比预定时刻晚了多少。
+先测默认设置，再测ThreadRuntime配置（OpenCV线程数、负载线程绑核、点击线程绑核并提升优先级），
+对比p50/p99/最大延迟。Linux下绑核用os.sched_setaffinity，提升优先级需要权限（否则只绑核）。
+
+用法:
+    python -m benchmarks.runtime_bench --duration 5 --load-threads 4
+    python -m benchmarks.runtime_bench --cv-threads 1 --load-cores 1-3 --click-cores 0
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import AutoShopping
+from benchmarks.ocr_bench import percentile
+
+
+def run_scenario(runtime, duration, load_threads, load_cores, click_cores, boost, interval):
+    """运行一轮，返回点击线程唤醒延迟统计（毫秒）和各线程CPU占用"""
+    cv2 = AutoShopping.cv2
+    np = AutoShopping.np
+    stop = threading.Event()
+
+    def load(index):
+        runtime.enter(f'load{index}', load_cores)
+        frame = np.random.default_rng(index).integers(0, 255, size=(1080, 1920), dtype=np.uint8)
+        out = np.empty_like(frame)
+        while not stop.is_set():
+            cv2.GaussianBlur(frame, (31, 31), 0, dst=out)
+            cv2.adaptiveThreshold(out, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 31, 5, dst=frame)
+
+    lateness = []
+
+    def click():
+        runtime.enter('click', click_cores, boost)
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            target = time.perf_counter() + interval
+            time.sleep(interval)
+            lateness.append((time.perf_counter() - target) * 1000)
+
+    workers = [threading.Thread(target=load, args=(i,), name=f"load{i}", daemon=True) for i in range(load_threads)]
+    for worker in workers:
+        worker.start()
+    clicker = threading.Thread(target=click, name="click")
+    clicker.start()
+    time.sleep(min(0.5, duration / 4))
+    runtime.sample()
+    clicker.join()
+    shares = runtime.sample()
+    stop.set()
+    for worker in workers:
+        worker.join(2)
+
+    lateness.sort()
+    return {
+        'wakeups': len(lateness),
+        'p50_ms': round(percentile(lateness, 50), 3),
+        'p99_ms': round(percentile(lateness, 99), 3),
+        'max_ms': round(lateness[-1], 3) if lateness else 0.0,
+        'cpu': {role: round(share, 3) for role, share in shares.items()},
+        'click_boosted': runtime.threads.get('click', {}).get('boosted', False),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="点击线程唤醒延迟基准（绑核/优先级）")
+    parser.add_argument('--duration', type=float, default=5.0, help="每轮时长（秒）")
+    parser.add_argument('--load-threads', type=int, default=os.cpu_count() or 2, help="负载线程数")
+    parser.add_argument('--interval', type=float, default=AutoShopping.AutoBuyController.STEP,
+                        help="点击线程每次等待的秒数")
+    parser.add_argument('--cv-threads', type=int, default=1, help="配置轮的OpenCV线程数")
+    parser.add_argument('--load-cores', default="", help="配置轮负载线程绑定的核心，如 1-3")
+    parser.add_argument('--click-cores', default="", help="配置轮点击线程绑定的核心，如 0")
+    parser.add_argument('--no-boost', action='store_true', help="配置轮不提升点击线程优先级")
+    parser.add_argument('--output', help="结果JSON输出路径")
+    args = parser.parse_args(argv)
+
+    AutoShopping.load_vision_modules()
+    load_cores = AutoShopping.parse_core_list(args.load_cores)
+    click_cores = AutoShopping.parse_core_list(args.click_cores)
+
+    results = {}
+    results['default'] = run_scenario(AutoShopping.ThreadRuntime(), args.duration, args.load_threads,
+                                      (), (), False, args.interval)
+    runtime = AutoShopping.ThreadRuntime()
+    runtime.configure_opencv(args.cv_threads)
+    results['configured'] = run_scenario(runtime, args.duration, args.load_threads, load_cores, click_cores,
+                                         not args.no_boost, args.interval)
+
+    for name, row in results.items():
+        boosted = "（已提升优先级）" if row['click_boosted'] else ""
+        print(f"{name:<11} 唤醒{row['wakeups']:>5}次  延迟 p50 {row['p50_ms']:7.3f}ms"
+              f"  p99 {row['p99_ms']:7.3f}ms  最大 {row['max_ms']:7.3f}ms{boosted}")
+        print("            CPU " + "  ".join(f"{role} {share:.0%}" for role, share in row['cpu'].items()))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
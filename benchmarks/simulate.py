@@ -0,0 +1,347 @@
+"""自动刷新/点击状态机的虚拟时钟仿真
+
+用虚拟时钟和假输入设备驱动AutoShopping.AutoBuyController，不需要鼠标、键盘和游戏：
+每次刷新点击后，脚本化的"市场"在OCR延迟之后给出一个价格（按概率落在购买区间内），
+部分读数先作为暂定价格，复核延迟后确认或作废（模拟低置信度读数的复核），
+点击购买后按概率在一段延迟后给出成功标志。虚拟时间里的等待不消耗真实时间，
+一秒真实时间可以跑上千个刷新周期。
+
+报告:
+    cycles/min      虚拟时间下的刷新周期数/分钟
+    reaction p50/99 价格满足条件 -> 开始点击 的虚拟延迟
+    limits          单个商品达到上限 / 所有商品达到上限（自动刷新停止并归零）的次数
+    preposition     预判模式下光标预先移动的命中/落空次数
+    violations      状态机违反约束的次数（次数上限、区间外或旧页面价格点击、光标不在原位时刷新，应为0）
+    wall            真实耗时与每秒仿真周期数
+
+用法:
+    python -m benchmarks.simulate --cycles 5000 --items 3 --deal-prob 0.2
+    python -m benchmarks.simulate --cycles 20000 --success-prob 0.5 --output sim.json
+    python -m benchmarks.simulate --verify-prob 0.5 --reject-prob 0.3 --speculative   # 对比预判点击
+"""
+import argparse
+import functools
+import heapq
+import json
+import random
+import sys
+import time
+
+import AutoShopping
+from benchmarks.ocr_bench import percentile
+
+
+class VirtualClock:
+    """虚拟时钟：sleep只推进时间，并按时间顺序执行到期的回调"""
+
+    def __init__(self):
+        self.now = 0
+        self.queue = []
+        self.sequence = 0  # 同一时刻按登记顺序执行
+
+    def now_ns(self):
+        return self.now
+
+    def call_at(self, when_ns, callback):
+        heapq.heappush(self.queue, (when_ns, self.sequence, callback))
+        self.sequence += 1
+
+    def call_later(self, seconds, callback):
+        self.call_at(self.now + int(seconds * 1e9), callback)
+
+    def sleep(self, seconds):
+        deadline = self.now + int(seconds * 1e9)
+        while self.queue and self.queue[0][0] <= deadline:
+            when, _, callback = heapq.heappop(self.queue)
+            self.now = max(self.now, when)
+            callback()
+        self.now = deadline
+
+
+class FakeInput:
+    """记录操作的假输入设备，刷新点击和ESC转发给市场脚本"""
+    HOME = (-1, -1)  # 用户放在商品上的光标位置（刷新点击的位置）
+
+    def __init__(self, market, targets):
+        self.market = market
+        self.targets = set(targets)  # 购买点击允许落在的位置
+        self.position = self.HOME
+        self.clicks = 0
+        self.misplaced = []
+
+    def click(self):
+        self.clicks += 1
+        if self.position not in self.targets:
+            self.misplaced.append(f"在{self.position}执行了购买点击")
+
+    def press_left(self):
+        if self.position != self.HOME:
+            self.misplaced.append(f"光标未复位（{self.position}）就执行了刷新点击")
+
+    def release_left(self):
+        self.market.on_refresh()
+
+    def press_escape(self):
+        pass
+
+    def release_escape(self):
+        self.market.on_escape()
+
+
+class Market:
+    """脚本化的游戏页面：刷新后出价、ESC后清空、点击后按概率成功
+
+    识别有延迟：刷新或ESC之后，旧页面的价格还会保留ocr_delay左右，直到新页面的读数到达。
+    value_pages记录各商品当前价格读自哪个页面，在旧页面价格上点击购买记为违反约束。
+    """
+
+    def __init__(self, clock, items, states, rng, deal_prob, success_prob, ocr_delay, success_delay,
+                 verify_prob=0.0, verify_delay=0.15, reject_prob=0.0):
+        self.clock = clock
+        self.items = items
+        self.states = states
+        self.rng = rng
+        self.deal_prob = deal_prob
+        self.success_prob = success_prob
+        self.ocr_delay = ocr_delay
+        self.success_delay = success_delay
+        self.verify_prob = verify_prob
+        self.verify_delay = verify_delay
+        self.reject_prob = reject_prob
+        self.controller = None
+        self.successes = 0
+        self.page = 0  # 页面编号，过期的回调据此作废
+        self.value_pages = [None] * len(items)
+
+    def ocr_lag(self):
+        # 识别耗时在ocr_delay上下浮动
+        return self.ocr_delay * self.rng.uniform(0.5, 1.5)
+
+    def on_refresh(self):
+        self.page += 1
+        page = self.page
+        self.clock.call_later(self.ocr_lag(), lambda: self.show_prices(page))
+
+    def on_escape(self):
+        self.page += 1
+        page = self.page
+        self.clock.call_later(self.ocr_lag(), lambda: self.clear_prices(page))
+
+    def clear_prices(self, page):
+        """模拟识别线程读到没有价格的列表页"""
+        if page != self.page:
+            return
+        for index, state in enumerate(self.states):
+            state.price_value = None
+            state.tentative_value = None
+            state.tentative_since_ns = None
+            state.qualify_since_ns = None
+            self.value_pages[index] = None
+
+    def show_prices(self, page):
+        """模拟识别线程读出各商品价格：直接确认，或先作为暂定价格等待复核"""
+        if page != self.page:
+            return
+        now = self.clock.now_ns()
+        for index, (item, state) in enumerate(zip(self.items, self.states)):
+            if self.rng.random() < self.deal_prob:
+                price = self.rng.randint(item.threshold1 + 1, item.threshold2 - 1)
+            else:
+                price = self.rng.randint(item.threshold2, item.threshold2 * 2)
+            self.value_pages[index] = page
+            if self.rng.random() < self.verify_prob:
+                state.price_value = None
+                state.qualify_since_ns = None
+                state.tentative_since_ns = now
+                state.tentative_value = price
+                rejected = self.rng.random() < self.reject_prob
+                delay = self.verify_delay * self.rng.uniform(0.5, 1.5)
+                self.clock.call_later(delay, functools.partial(self.verify, page, index, price, rejected))
+            else:
+                state.tentative_value = state.tentative_since_ns = None
+                self.confirm(index, price, now)
+
+    def verify(self, page, index, price, rejected):
+        """模拟复核结果：暂定价格仍在屏幕上（可能已是旧页面）时生效"""
+        state = self.states[index]
+        if self.value_pages[index] != page or state.tentative_value != price:
+            return
+        since_ns = state.tentative_since_ns
+        state.tentative_value = state.tentative_since_ns = None
+        if not rejected:
+            self.confirm(index, price, since_ns)
+
+    def confirm(self, index, price, since_ns):
+        item, state = self.items[index], self.states[index]
+        state.price_value = price
+        state.qualify_since_ns = since_ns if item.threshold1 < price < item.threshold2 else None
+
+    def on_clicked(self):
+        if self.rng.random() < self.success_prob:
+            self.clock.call_later(self.success_delay, self.show_success)
+
+    def show_success(self):
+        """模拟成功检测线程看到成功标志的上升沿"""
+        self.successes += 1
+        self.controller.record_success()
+
+
+class SimulationListener(AutoShopping.AutoBuyListener):
+    """收集统计并检查次数上限约束"""
+
+    def __init__(self, controller_ref, market, cycles):
+        self.controller_ref = controller_ref
+        self.market = market
+        self.cycles = cycles
+        self.reactions = []
+        self.clicks = 0
+        self.item_limits = 0
+        self.all_limits = 0
+        self.violations = []
+        self.errors = []
+
+    def on_refresh(self, cycle, start_ns, end_ns):
+        # 商品多、出价少时可能很久都达不到全部上限，到达周期数就停止
+        if cycle >= self.cycles:
+            self.controller_ref().running = False
+
+    def on_click_start(self, item_index, price):
+        controller = self.controller_ref()
+        item = controller.watch_items[item_index]
+        state = controller.item_states[item_index]
+        if state.click_count > item.max_attempts:
+            self.violations.append(f"{item.name} 点击{state.click_count}次，超过上限{item.max_attempts}")
+        if not item.threshold1 < price < item.threshold2:
+            self.violations.append(f"{item.name} 以区间外价格{price}点击")
+        if self.market.value_pages[item_index] != self.market.page:
+            self.violations.append(f"{item.name} 以旧页面的价格{price}点击")
+
+    def on_clicked(self, item_index, price, capture_ns, decision_ns, click_start_ns, click_end_ns):
+        self.clicks += 1
+        self.reactions.append((click_start_ns - capture_ns) / 1e6)
+        self.market.on_clicked()
+
+    def on_item_limit(self, item_index, message):
+        self.item_limits += 1
+
+    def on_all_limits(self, item_index, message):
+        self.all_limits += 1
+        controller = self.controller_ref()
+        if controller.running:
+            self.violations.append("所有商品达到上限后自动刷新仍在运行")
+        if not all(s.done for s in controller.item_states):
+            self.violations.append("存在未结束的商品时触发了全部上限")
+
+    def on_refresh_error(self, error):
+        self.errors.append(repr(error))
+
+    def on_click_error(self, item_index, error):
+        self.errors.append(repr(error))
+
+
+def make_items(count, max_attempts, max_success):
+    items = []
+    for index in range(count):
+        low = 1000 * (index + 1)
+        items.append(AutoShopping.WatchItem(
+            f"商品{index + 1}", (0, 40 * index, 200, 40), low, low * 2,
+            (300, 40 * index), (250, 40 * index), max_attempts, max_success))
+    return items
+
+
+def simulate(cycles, items=1, deal_prob=0.2, success_prob=0.3, refresh_steps=10,
+             ocr_delay=0.12, success_delay=0.3, max_attempts=5, max_success=2, seed=0,
+             verify_prob=0.0, verify_delay=0.15, reject_prob=0.0, speculative=False):
+    """运行仿真直到完成cycles个刷新周期，返回统计字典"""
+    clock = VirtualClock()
+    watch_items = make_items(items, max_attempts, max_success)
+    states = [AutoShopping.WatchItemState() for _ in watch_items]
+    market = Market(clock, watch_items, states, random.Random(seed), deal_prob, success_prob,
+                    ocr_delay, success_delay, verify_prob, verify_delay, reject_prob)
+    controller = None
+    listener = SimulationListener(lambda: controller, market, cycles)
+    targets = [position for item in watch_items for position in (item.num_position, item.click_position)]
+    fake_input = FakeInput(market, targets)
+    controller = AutoShopping.AutoBuyController(watch_items, states, fake_input, clock,
+                                                listener, refresh_steps, speculative)
+    market.controller = controller
+
+    started = time.perf_counter()
+    restarts = 0
+    while controller.refresh_cycle < cycles:
+        # 所有商品达到上限后自动刷新会停止，这里模拟用户再次按F5
+        controller.running = True
+        controller.run_refresh_loop()
+        restarts += 1
+        if listener.errors:
+            break
+    wall = time.perf_counter() - started
+    violations = listener.violations + fake_input.misplaced
+    if fake_input.position != FakeInput.HOME:
+        violations.append(f"结束时光标未复位（{fake_input.position}）")
+
+    virtual_minutes = clock.now_ns() / 60e9
+    reactions = sorted(listener.reactions)
+    return {
+        'cycles': controller.refresh_cycle,
+        'virtual_s': round(clock.now_ns() / 1e9, 1),
+        'cycles_per_min': round(controller.refresh_cycle / virtual_minutes, 2) if virtual_minutes else 0.0,
+        'clicks': listener.clicks,
+        'successes': market.successes,
+        'reaction_p50_ms': round(percentile(reactions, 50), 1),
+        'reaction_p99_ms': round(percentile(reactions, 99), 1),
+        'item_limits': listener.item_limits,
+        'all_limits': listener.all_limits,
+        'speculative': speculative,
+        'preposition_hits': controller.preposition_hits,
+        'preposition_misses': controller.preposition_misses,
+        'restarts': restarts,
+        'violations': violations[:20],
+        'errors': listener.errors[:20],
+        'wall_s': round(wall, 3),
+        'cycles_per_wall_s': round(controller.refresh_cycle / wall, 1) if wall > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="自动刷新/点击状态机仿真（虚拟时钟）")
+    parser.add_argument('--cycles', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=1, help="监控商品数")
+    parser.add_argument('--deal-prob', type=float, default=0.2, help="每次刷新每个商品出现区间内价格的概率")
+    parser.add_argument('--success-prob', type=float, default=0.3, help="点击后购买成功的概率")
+    parser.add_argument('--refresh-steps', type=int, default=10, help="刷新间隔（0.05秒的倍数）")
+    parser.add_argument('--ocr-delay', type=float, default=0.12, help="刷新后价格被确认的延迟（秒）")
+    parser.add_argument('--success-delay', type=float, default=0.3, help="点击后成功标志出现的延迟（秒）")
+    parser.add_argument('--max-attempts', type=int, default=5)
+    parser.add_argument('--max-success', type=int, default=2)
+    parser.add_argument('--verify-prob', type=float, default=0.0, help="读数需要复核（先作为暂定价格）的概率")
+    parser.add_argument('--verify-delay', type=float, default=0.15, help="复核耗时（秒）")
+    parser.add_argument('--reject-prob', type=float, default=0.0, help="复核否决暂定价格的概率")
+    parser.add_argument('--speculative', action='store_true', help="开启预判点击")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="结果JSON输出路径")
+    args = parser.parse_args(argv)
+
+    result = simulate(args.cycles, args.items, args.deal_prob, args.success_prob, args.refresh_steps,
+                      args.ocr_delay, args.success_delay, args.max_attempts, args.max_success, args.seed,
+                      args.verify_prob, args.verify_delay, args.reject_prob, args.speculative)
+
+    print(f"刷新周期   {result['cycles']}（虚拟 {result['virtual_s']}s，{result['cycles_per_min']:.1f} 次/分钟）")
+    print(f"点击/成功  {result['clicks']} / {result['successes']}")
+    print(f"反应延迟   p50 {result['reaction_p50_ms']:.1f}ms  p99 {result['reaction_p99_ms']:.1f}ms")
+    print(f"次数上限   单商品 {result['item_limits']} 次，全部 {result['all_limits']} 次")
+    if result['speculative']:
+        print(f"预判点击   命中 {result['preposition_hits']} 次，落空 {result['preposition_misses']} 次")
+    print(f"违反约束   {len(result['violations'])}  异常 {len(result['errors'])}")
+    for message in result['violations'] + result['errors']:
+        print(f"  {message}")
+    print(f"真实耗时   {result['wall_s']:.3f}s（{result['cycles_per_wall_s']:.0f} 周期/秒）")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 1 if result['violations'] or result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""价格分位数草图的精度与内存
+
+生成模拟行情（对数正态的主体价格加少量极端低价/高价），同时喂给PriceStats和完整排序的数组，
+对比各分位数的秩误差（草图给出的值在完整数据中的实际分位与目标分位之差），
+并报告草图保留的元素个数、序列化后的大小和每次更新的耗时。
+另外把数据拆成两半分别统计后合并，检查跨会话累计的精度。
+
+用法:
+    python -m benchmarks.sketch_bench --count 1000000
+    python -m benchmarks.sketch_bench --count 200000 --k 100 --output sketch.json
+"""
+import argparse
+import bisect
+import json
+import random
+import sys
+import time
+
+import AutoShopping
+
+QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+
+def market_prices(count, seed):
+    rng = random.Random(seed)
+    prices = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.02:
+            prices.append(rng.randint(1000, 20000))  # 捡漏价
+        elif roll < 0.04:
+            prices.append(rng.randint(500000, 2000000))  # 离谱高价
+        else:
+            prices.append(int(rng.lognormvariate(11.5, 0.25)))
+    return prices
+
+
+def rank_errors(sketch, exact):
+    """各分位数的秩误差（绝对值）"""
+    errors = {}
+    n = len(exact)
+    for q in QUANTILES:
+        value = sketch.quantile(q)
+        low = bisect.bisect_left(exact, value) / n
+        high = bisect.bisect_right(exact, value) / n
+        errors[q] = 0.0 if low <= q <= high else min(abs(low - q), abs(high - q))
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="价格分位数草图精度与内存")
+    parser.add_argument('--count', type=int, default=1000000, help="读数个数")
+    parser.add_argument('--k', type=int, default=AutoShopping.KllSketch.DEFAULT_K, help="草图参数k")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="结果JSON输出路径")
+    args = parser.parse_args(argv)
+
+    prices = market_prices(args.count, args.seed)
+    stats = AutoShopping.PriceStats(AutoShopping.KllSketch(args.k, seed=args.seed))
+    started = time.perf_counter()
+    for price in prices:
+        stats.update(price)
+    update_us = (time.perf_counter() - started) / args.count * 1e6
+
+    half = args.count // 2
+    first = AutoShopping.KllSketch(args.k, seed=1)
+    second = AutoShopping.KllSketch(args.k, seed=2)
+    for price in prices[:half]:
+        first.update(price)
+    for price in prices[half:]:
+        second.update(price)
+    # 经过一次保存/读取再合并，与跨会话累计的路径一致
+    merged = AutoShopping.KllSketch.from_dict(json.loads(json.dumps(first.to_dict())))
+    merged.merge(second)
+
+    exact = sorted(prices)
+    errors = rank_errors(stats, exact)
+    merged_errors = rank_errors(merged, exact)
+    retained = sum(len(level) for level in stats.sketch.levels)
+    serialized = len(json.dumps(stats.to_dict()))
+
+    print(f"读数 {args.count}，k={args.k}，保留 {retained} 个元素（{len(stats.sketch.levels)} 层），"
+          f"序列化 {serialized / 1024:.1f}KB，更新 {update_us:.2f}us/次")
+    print(f"{'分位':>6}{'精确值':>10}{'草图':>10}{'秩误差':>9}{'合并后':>9}")
+    for q in QUANTILES:
+        print(f"{q:>6.2f}{exact[min(len(exact) - 1, int(q * len(exact)))]:>10}{stats.quantile(q):>10}"
+              f"{errors[q]:>9.2%}{merged_errors[q]:>9.2%}")
+    print(f"最低/最高 {stats.min}/{stats.max}（精确 {exact[0]}/{exact[-1]}），EWMA {stats.ewma:.0f}")
+
+    result = {
+        'count': args.count,
+        'k': args.k,
+        'retained': retained,
+        'levels': len(stats.sketch.levels),
+        'serialized_bytes': serialized,
+        'update_us': round(update_us, 3),
+        'max_rank_error': round(max(errors.values()), 5),
+        'max_merged_rank_error': round(max(merged_errors.values()), 5),
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,466 @@
+"""长时间运行（soak）测试：内存、对象和句柄增长检查
+
+以最大帧率回放合成价格帧，持续指定时长，定时采样:
+    rss_kb        进程常驻内存
+    objects       gc跟踪的Python对象数
+    threads       存活线程数
+    canvas_items  两个预览画布上的图像项总数（仅界面模式）
+    tk_images     Tk图像数（仅界面模式）
+    after_pending 待执行的after回调数（仅界面模式）
+预热之后，若某项指标在最后三分之一时段的最小值仍高于前三分之一时段的最大值（超出容差），
+判定为无界增长，退出码非0。以下情况同样判定失败：工作线程或Tk回调抛出未处理的异常、
+线程数比开始时少（有线程退出了）、一帧都没有处理或预热后帧数不再增加、采样次数不足6次。时间线追踪的环形缓冲区满载前对象数会一直上涨，
+测试时缩小为--trace-capacity，让有界的缓冲区在预热期内就达到稳态。
+
+界面模式创建真正的OverlayApp（截图来源换成回放、鼠标键盘换成记录器，并开启自动刷新），
+需要图形界面（Linux下可用 xvfb-run）；--headless 不创建窗口，只跑识别、复核和文本区域预处理。
+
+--check-recalibration 不跑长时间测试，只在临时目录中检查重新校准：同一区域尺寸先后保存
+两套校准模板，TemplateSource每次都应重新加载并清空识别缓存，同一帧的识别结果随之改变。
+
+用法:
+    python -m benchmarks.soak --duration 600 --output soak.json
+    python -m benchmarks.soak --headless --duration 120
+    python -m benchmarks.soak --check-recalibration
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import AutoShopping
+from benchmarks.synth import glyph_masks, random_price, render_price_strip
+
+# 指标 -> (相对容差, 绝对容差)
+GROWTH_TOLERANCE = {
+    'rss_kb': (0.05, 8192),
+    'objects': (0.02, 2000),
+    'threads': (0.0, 0),
+    'canvas_items': (0.0, 0),
+    'tk_images': (0.0, 0),
+    'after_pending': (0.0, 5),
+}
+
+
+def process_rss_kb():
+    """当前进程常驻内存（KB），无法获取时返回None"""
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize // 1024
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ReplayShot:
+    """与mss截图对象接口一致的回放帧"""
+
+    def __init__(self, raw, width, height):
+        self.raw = raw
+        self.width = width
+        self.height = height
+
+
+class ReplayGrabber:
+    """按区域尺寸循环回放预先生成的BGRA帧，用作OverlayApp的frame_source"""
+
+    def __init__(self, frame_factory):
+        self.frame_factory = frame_factory  # (width, height) -> [BGRA图像]
+        self.frames = {}
+        self.positions = {}
+        self.lock = threading.Lock()
+        self.grabs = 0
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def grab(self, region):
+        size = (region['width'], region['height'])
+        with self.lock:
+            frames = self.frames.get(size)
+            if frames is None:
+                frames = self.frames[size] = [bytes(f) for f in self.frame_factory(*size)]
+            index = self.positions.get(size, 0)
+            self.positions[size] = (index + 1) % len(frames)
+            self.grabs += 1
+        return ReplayShot(frames[index], size[0], size[1])
+
+
+class RecordingInput:
+    """只计数的输入设备（不动真实鼠标键盘）"""
+
+    def __init__(self):
+        self.position = (0, 0)
+        self.actions = 0
+
+    def _record(self):
+        self.actions += 1
+
+    click = press_left = release_left = press_escape = release_escape = _record
+
+
+def make_frame_factory(templates, resolution, count, seed, low, high):
+    """生成价格帧的工厂：约一半价格落在[low, high)区间内，其余在区间外"""
+    masks = glyph_masks(templates[resolution])
+
+    def factory(width, height):
+        rng = np.random.default_rng(seed)
+        frames = []
+        for index in range(count):
+            value = int(rng.integers(low, high)) if index % 2 == 0 else random_price(rng)
+            strip = render_price_strip(value, masks, rng, background='texture', noise=6.0)
+            frames.append(cv2.resize(strip, (width, height), interpolation=cv2.INTER_AREA))
+        return frames
+
+    return factory
+
+
+class SoakSampler:
+    """定时采集各项指标"""
+
+    def __init__(self, probes):
+        self.probes = probes  # 指标名 -> 无参函数
+        self.samples = []
+        self.started = time.monotonic()
+
+    def sample(self, frames=0):
+        row = {'t': round(time.monotonic() - self.started, 2), 'frames': frames}
+        for name, probe in self.probes.items():
+            row[name] = probe()
+        self.samples.append(row)
+        return row
+
+
+class WorkerErrors:
+    """收集运行期间工作线程（threading.excepthook）和Tk回调中未处理的异常"""
+
+    def __init__(self):
+        self.errors = []
+        self.previous_hook = None
+
+    def record(self, where, exc_type, exc_value):
+        self.errors.append(f"{where}: {exc_type.__name__}: {exc_value}")
+
+    def thread_hook(self, hook_args):
+        name = hook_args.thread.name if hook_args.thread is not None else "?"
+        self.record(f"线程{name}", hook_args.exc_type, hook_args.exc_value)
+        self.previous_hook(hook_args)
+
+    def tk_hook(self, exc_type, exc_value, exc_traceback):
+        self.record("Tk回调", exc_type, exc_value)
+        traceback.print_exception(exc_type, exc_value, exc_traceback)
+
+    def __enter__(self):
+        self.previous_hook = threading.excepthook
+        threading.excepthook = self.thread_hook
+        return self
+
+    def __exit__(self, *exc):
+        threading.excepthook = self.previous_hook
+
+
+def find_failures(samples, warmup, errors):
+    """返回测试本身失败的原因列表（没有真正跑起来、线程退出、采样不足）"""
+    failures = list(errors)
+    if len(samples) < 6:
+        failures.append(f"采样次数不足（{len(samples)}次），无法判断增长趋势（加大--duration或减小--interval）")
+    if not samples:
+        return failures
+    first, last = samples[0], samples[-1]
+    if last['frames'] == 0:
+        failures.append("一帧都没有处理")
+    if last['threads'] < first['threads']:
+        failures.append(f"线程数从{first['threads']}降到{last['threads']}，有工作线程退出")
+    steady = [row for row in samples if row['t'] >= warmup]
+    for previous, row in zip(steady, steady[1:]):
+        if row['frames'] <= previous['frames']:
+            failures.append(f"{previous['t']}s~{row['t']}s之间帧数没有增加（{row['frames']}），识别循环停止了")
+            break
+    return failures
+
+
+def find_growth(samples, warmup):
+    """返回无界增长的指标 {指标: (前段最大值, 末段最小值)}"""
+    steady = [row for row in samples if row['t'] >= warmup]
+    if len(steady) < 6:
+        return {}
+    third = len(steady) // 3
+    head, tail = steady[:third], steady[-third:]
+    growth = {}
+    for metric, (relative, absolute) in GROWTH_TOLERANCE.items():
+        head_values = [row[metric] for row in head if row.get(metric) is not None]
+        tail_values = [row[metric] for row in tail if row.get(metric) is not None]
+        if not head_values or not tail_values:
+            continue
+        baseline, final = max(head_values), min(tail_values)
+        if final > baseline * (1 + relative) + absolute:
+            growth[metric] = (baseline, final)
+    return growth
+
+
+def run_gui(args, templates, factory, errors):
+    """在真正的OverlayApp上回放帧，返回采样列表"""
+    import tkinter as tk
+
+    AutoShopping.load_engine_modules()
+    AutoShopping.TraceRecorder.DEFAULT_CAPACITY = args.trace_capacity
+    root = tk.Tk()
+    root.report_callback_exception = errors.tk_hook
+    grabber = ReplayGrabber(factory)
+    region = (0, 0, args.width, args.height)
+    app = AutoShopping.OverlayApp(
+        root, args.low, args.high, 10 ** 9, 10 ** 9, region, (300, 10), (250, 10), (0, 100, 300, 60),
+        refresh_interval_steps=1, cpu_budget=1.0, target_latency=0.0,
+        input_device=RecordingInput(), frame_source=grabber)
+    app.toggle_auto_refresh()  # 开启自动刷新，覆盖点击、闪烁和成功检测布防
+
+    sampler = SoakSampler({
+        'rss_kb': process_rss_kb,
+        'objects': lambda: len(gc.get_objects()),
+        'threads': threading.active_count,
+        'canvas_items': lambda: len(app.canvas.find_all()) + len(app.text_canvas.find_all()),
+        'tk_images': lambda: len(root.tk.splitlist(root.tk.call('image', 'names'))),
+        'after_pending': lambda: len(root.tk.splitlist(root.tk.call('after', 'info'))),
+    })
+    deadline = time.monotonic() + args.duration
+
+    def tick():
+        frame_histogram = app.perf.histograms.get('frame')
+        row = sampler.sample(frame_histogram.total if frame_histogram else 0)
+        if args.verbose:
+            print(row)
+        if time.monotonic() >= deadline:
+            root.quit()
+            return
+        root.after(int(args.interval * 1000), tick)
+
+    root.after(int(args.interval * 1000), tick)
+    root.mainloop()
+
+    app.running = False
+    app.auto_refresh_running = False
+    if hasattr(app, 'key_listener'):
+        app.key_listener.stop()
+    app.scheduler.stop()
+    app.verifier.close()
+    root.destroy()
+    return sampler.samples
+
+
+def run_headless(args, templates, factory, errors):
+    """不创建窗口，按OverlayApp的流程跑识别和文本区域预处理，返回采样列表"""
+    AutoShopping.load_vision_modules()
+    grabber = ReplayGrabber(factory)
+    capture_region = {'left': 0, 'top': 0, 'width': args.width, 'height': args.height}
+    text_region = {'left': 0, 'top': 100, 'width': 300, 'height': 60}
+    perf = AutoShopping.PerfStats()
+    state = AutoShopping.WatchItemState()
+    selector = AutoShopping.MatchModeSelector()
+    cache = AutoShopping.OcrResultCache()
+    workspaces = [AutoShopping.FrameWorkspace()]
+    mosaic_workspace = AutoShopping.FrameWorkspace()
+    text_workspace = AutoShopping.FrameWorkspace()
+    verifier = AutoShopping.PriceVerifier(perf)
+    trace = AutoShopping.TraceRecorder(args.trace_capacity)
+    governor = AutoShopping.FrameGovernor("soak", 1.0, 0.0)
+    running = threading.Event()
+    running.set()
+    frames = [0]
+
+    def capture_loop():
+        event = threading.Event()
+        with grabber() as sct:
+            while running.is_set():
+                governor.begin()
+                t0 = time.perf_counter_ns()
+                shot = sct.grab(capture_region)
+                image = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+                t1 = time.perf_counter_ns()
+                trace.add('capture', t0, t1)
+                results = selector.recognize([image], templates, perf, cache, workspaces, mosaic_workspace)
+                sequence = state.tracker.observe(results[0], verifier.available is not False)
+                if sequence is not None and not verifier.submit(
+                        image, lambda price, seq=sequence: state.tracker.verify(seq, price)):
+                    state.tracker.cancel_verify(sequence)
+                state.price_value = state.tracker.price
+                t2 = time.perf_counter_ns()
+                trace.add('ocr', t1, t2)
+                perf.record('frame', t2 - t0)
+                frames[0] += 1
+                event.wait(governor.end())
+
+    def text_loop():
+        event = threading.Event()
+        with grabber() as sct:
+            while running.is_set():
+                shot = sct.grab(text_region)
+                image = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+                AutoShopping.binarize_padded(image, 70, text_workspace)
+                event.wait(0.005)
+
+    threads = [threading.Thread(target=capture_loop, name="capture", daemon=True),
+               threading.Thread(target=text_loop, name="text", daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    sampler = SoakSampler({
+        'rss_kb': process_rss_kb,
+        'objects': lambda: len(gc.get_objects()),
+        'threads': threading.active_count,
+    })
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        time.sleep(args.interval)
+        row = sampler.sample(frames[0])
+        if args.verbose:
+            print(row)
+
+    running.clear()
+    for thread in threads:
+        thread.join(2)
+    verifier.close()
+    return sampler.samples
+
+
+def check_recalibration(templates, resolution, seed):
+    """同一校准目录先后写入"错位"和正确的两套模板，检查识别结果随校准变化，返回失败信息列表"""
+    AutoShopping.load_vision_modules()
+    rng = np.random.default_rng(seed)
+    value = 1234567
+    strip = render_price_strip(value, glyph_masks(templates[resolution]), rng, background='flat')
+    region = (0, 0, strip.shape[1], strip.shape[0])
+    digits = templates[resolution]
+    cache = AutoShopping.OcrResultCache()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = AutoShopping.TemplateSource(cache, lambda region: directory, templates)
+
+        def read(label, calibrated):
+            changed = source.refresh(region)
+            if not changed:
+                failures.append(f"{label}: 模板没有重新加载")
+            if cache.entries:
+                failures.append(f"{label}: 更换模板后识别缓存没有清空")
+            # 同一帧识别两次，第二次走缓存
+            results = [AutoShopping.recognize_prices([strip], source.templates, cache=cache)[0]
+                       for _ in range(2)]
+            print(f"{label:<10} {'校准模板' if calibrated else '自带模板'}  读数 {results[0].value}"
+                  f"（缓存后 {results[1].value}）")
+            return results[1].value
+
+        def calibrate(mapping):
+            AutoShopping.save_calibrated_templates(
+                {digit: digits[mapping(digit)] for digit in range(10)}, directory,
+                {'region': list(region), 'calibrated_at': datetime.now().isoformat(timespec='seconds'),
+                 'calibration_id': os.urandom(8).hex()})
+
+        bundled = read("未校准", False)
+        # 每个数字标成下一个数字的字形：读数应整体错位
+        calibrate(lambda digit: (digit + 1) % 10)
+        shifted = read("错位校准", True)
+        # 同一区域尺寸重新校准（目录不变）：应恢复正确读数
+        calibrate(lambda digit: digit)
+        fixed = read("重新校准", True)
+        if source.refresh(region):
+            failures.append("校准未变化时不应重新加载模板")
+
+    if bundled != value:
+        failures.append(f"自带模板读数{bundled}，应为{value}")
+    if shifted == bundled:
+        failures.append("错位校准后读数没有变化")
+    if fixed != value:
+        failures.append(f"重新校准后读数{fixed}，应为{value}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="长时间运行测试（内存/对象/句柄增长检查）")
+    parser.add_argument('--duration', type=float, default=300, help="运行时长（秒）")
+    parser.add_argument('--interval', type=float, default=2.0, help="采样间隔（秒）")
+    parser.add_argument('--warmup', type=float, default=None, help="预热时长（秒），默认为总时长的20%%")
+    parser.add_argument('--headless', action='store_true', help="不创建窗口，只测引擎部分")
+    parser.add_argument('--frames', type=int, default=64, help="循环回放的不同帧数")
+    parser.add_argument('--width', type=int, default=200)
+    parser.add_argument('--height', type=int, default=40)
+    parser.add_argument('--low', type=int, default=1000, help="购买区间下限（回放价格约一半落在区间内）")
+    parser.add_argument('--high', type=int, default=5000, help="购买区间上限")
+    parser.add_argument('--resolution', default='2k', choices=AutoShopping.DIGIT_RESOLUTIONS)
+    parser.add_argument('--templates-dir', default=None, help="digits1k/2k/4k 所在目录（默认与脚本同目录）")
+    parser.add_argument('--trace-capacity', type=int, default=5000, help="时间线追踪环形缓冲区容量")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help="打印每次采样")
+    parser.add_argument('--check-recalibration', action='store_true', help="只检查重新校准后模板和缓存是否更新")
+    parser.add_argument('--output', help="结果JSON输出路径")
+    args = parser.parse_args(argv)
+
+    templates = AutoShopping.load_digit_templates(base_dir=args.templates_dir)
+    if args.check_recalibration:
+        failures = check_recalibration(templates, args.resolution, args.seed)
+        for message in failures:
+            print(f"  {message}")
+        print("重新校准检查" + ("失败" if failures else "通过"))
+        return 1 if failures else 0
+    factory = make_frame_factory(templates, args.resolution, args.frames, args.seed, args.low, args.high)
+    with WorkerErrors() as errors:
+        samples = (run_headless if args.headless else run_gui)(args, templates, factory, errors)
+
+    warmup = args.duration * 0.2 if args.warmup is None else args.warmup
+    growth = find_growth(samples, warmup)
+    failures = find_failures(samples, warmup, errors.errors)
+    if samples:
+        first, last = samples[0], samples[-1]
+        elapsed = max(last['t'], 1e-9)
+        print(f"运行 {elapsed:.0f}s，{last['frames']} 帧（{last['frames'] / elapsed:.1f} fps），{len(samples)} 次采样")
+        for metric in GROWTH_TOLERANCE:
+            if last.get(metric) is None:
+                continue
+            flag = "  <-- 持续增长" if metric in growth else ""
+            print(f"  {metric:<14}{first[metric]:>12} -> {last[metric]:<12}{flag}")
+    for message in failures:
+        print(f"失败: {message}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.now().isoformat(timespec='seconds'),
+                       'mode': 'headless' if args.headless else 'gui',
+                       'config': {'duration': args.duration, 'interval': args.interval, 'warmup': warmup},
+                       'growth': {k: list(v) for k, v in growth.items()},
+                       'failures': failures,
+                       'samples': samples}, f, ensure_ascii=False, indent=2)
+    return 1 if growth or failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""启动耗时基准
+
+每项测量都在新进程中进行（冷启动解释器），重复多次取中位数:
+    config_window   进程启动 -> 参数配置窗口绘制完成（需要图形界面）
+    first_ocr_frame 进程启动 -> 导入引擎依赖、加载模板并完成第一帧识别
+    eager_imports   进程启动 -> 一次性导入全部重型依赖（旧版启动方式的参照）
+
+用法:
+    python -m benchmarks.startup_bench --runs 5 --output startup.json
+    python -m benchmarks.startup_bench --command "dist\\AutoShopping.exe"   # 测量打包后的exe
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def _child_first_ocr_frame():
+    """子进程：模拟引擎启动到第一帧识别结果"""
+    import AutoShopping
+
+    try:
+        AutoShopping.load_engine_modules()
+    except Exception as e:
+        # 无图形界面时pynput无法导入，只测识别部分
+        print(f"引擎依赖未能全部导入（{e}），仅测量识别部分", file=sys.stderr)
+        AutoShopping.load_vision_modules()
+    np = AutoShopping.np
+
+    templates = AutoShopping.load_digit_templates(base_dir=os.environ.get("DELTASHOPPING_TEMPLATES_DIR"))
+    frame = None
+    if AutoShopping.mss is not None:
+        try:
+            with AutoShopping.mss() as sct:
+                frame = np.array(sct.grab({'left': 0, 'top': 0, 'width': 200, 'height': 40}))
+        except Exception:
+            frame = None
+    if frame is None:
+        frame = np.zeros((40, 200, 4), dtype=np.uint8)
+    AutoShopping.recognize_price(frame, templates)
+    AutoShopping.startup_probe_mark('first_ocr_frame')
+
+
+def _child_eager_imports():
+    """子进程：按旧版方式在模块顶部一次性导入全部依赖"""
+    import AutoShopping
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+    import mss  # noqa: F401
+    from PIL import Image, ImageTk  # noqa: F401
+    from Crypto.Cipher import AES  # noqa: F401
+    try:
+        import pynput  # noqa: F401
+    except Exception:
+        pass
+    AutoShopping.startup_probe_mark('eager_imports')
+
+
+CHILDREN = {
+    'first_ocr_frame': _child_first_ocr_frame,
+    'eager_imports': _child_eager_imports,
+}
+
+
+def measure(command, mark, timeout=60):
+    """启动一个子进程，返回从启动到探针里程碑的秒数（失败返回None）"""
+    fd, probe_path = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    env = dict(os.environ, DELTASHOPPING_STARTUP_PROBE=probe_path)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(REPO_DIR), env.get('PYTHONPATH')]))
+    try:
+        started = time.time()
+        subprocess.run(command, cwd=REPO_DIR, env=env, timeout=timeout,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        with open(probe_path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['mark'] == mark:
+                    return record['time'] - started
+    except (subprocess.TimeoutExpired, OSError, ValueError):
+        pass
+    finally:
+        os.unlink(probe_path)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--command', help="测量config_window时使用的启动命令（默认用当前Python运行AutoShopping.py）")
+    parser.add_argument('--skip-gui', action='store_true', help="跳过需要图形界面的config_window测量")
+    parser.add_argument('--output', help="结果JSON输出路径")
+    parser.add_argument('--child', choices=sorted(CHILDREN), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        CHILDREN[args.child]()
+        return 0
+
+    app_command = shlex.split(args.command) if args.command else [sys.executable, str(REPO_DIR / 'AutoShopping.py')]
+    commands = {
+        'first_ocr_frame': [sys.executable, '-m', 'benchmarks.startup_bench', '--child', 'first_ocr_frame'],
+        'eager_imports': [sys.executable, '-m', 'benchmarks.startup_bench', '--child', 'eager_imports'],
+    }
+    if not args.skip_gui:
+        commands = dict({'config_window': app_command}, **commands)
+
+    results = {}
+    for mark, command in commands.items():
+        samples = [measure(command, mark) for _ in range(args.runs)]
+        samples = sorted(s for s in samples if s is not None)
+        if not samples:
+            print(f"{mark:<16} 测量失败")
+            results[mark] = None
+            continue
+        results[mark] = {
+            'runs': len(samples),
+            'median_s': round(samples[len(samples) // 2], 4),
+            'min_s': round(samples[0], 4),
+            'max_s': round(samples[-1], 4),
+        }
+        print(f"{mark:<16} 中位数 {results[mark]['median_s'] * 1000:8.1f}ms"
+              f"  (最小 {samples[0] * 1000:.1f}ms, 最大 {samples[-1] * 1000:.1f}ms)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': time.time(), 'python': sys.version.split()[0], 'results': results},
+                      f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
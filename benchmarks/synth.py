@@ -0,0 +1,136 @@
+"""合成价格图片生成器
+
+用自带的 digits1k/2k/4k 数字模板拼出已知数值的价格条，
+可叠加不同背景、噪声、缩放抖动和千位分隔符，输出与mss截图相同的BGRA图像。
+"""
+import cv2
+import numpy as np
+
+BACKGROUNDS = ('flat', 'gradient', 'texture', 'busy')
+
+
+def glyph_masks(digit_templates):
+    """把二值模板整理成前景为255的掩码（兼容黑字白底的模板）"""
+    masks = {}
+    for digit, template in digit_templates.items():
+        if template is None or template.size == 0:
+            continue
+        mask = template if template.mean() < 127 else 255 - template
+        masks[digit] = mask
+    return masks
+
+
+def random_price(rng, min_digits=3, max_digits=7):
+    """生成随机价格（首位非零）"""
+    length = int(rng.integers(min_digits, max_digits + 1))
+    first = int(rng.integers(1, 10))
+    rest = rng.integers(0, 10, size=length - 1)
+    return int(str(first) + ''.join(str(int(d)) for d in rest))
+
+
+def _make_background(height, width, kind, rng):
+    """生成单通道背景"""
+    base = int(rng.integers(20, 90))
+    if kind == 'flat':
+        return np.full((height, width), base, dtype=np.float32)
+    if kind == 'gradient':
+        ramp = np.linspace(base, base + int(rng.integers(20, 70)), width, dtype=np.float32)
+        return np.tile(ramp, (height, 1))
+    if kind == 'texture':
+        noise = rng.normal(base, 25, size=(height, width)).astype(np.float32)
+        return cv2.GaussianBlur(noise, (0, 0), 3)
+    if kind == 'busy':
+        background = np.full((height, width), base, dtype=np.float32)
+        for _ in range(int(rng.integers(3, 8))):
+            x1, x2 = sorted(rng.integers(0, width, size=2))
+            y1, y2 = sorted(rng.integers(0, height, size=2))
+            cv2.rectangle(background, (int(x1), int(y1)), (int(x2), int(y2)),
+                          float(rng.integers(30, 140)), -1)
+        return cv2.GaussianBlur(background, (0, 0), 1)
+    raise ValueError(f"未知背景类型: {kind}")
+
+
+def render_price_strip(value, masks, rng, background='flat', noise=0.0, scale=1.0,
+                       commas=True, margin=12):
+    """渲染一条价格图片
+
+    参数:
+        value: 价格数值
+        masks: glyph_masks() 的返回值
+        rng: numpy.random.Generator
+        background: BACKGROUNDS 之一
+        noise: 高斯噪声标准差（灰度级）
+        scale: 字形缩放比例（模拟分辨率/缩放抖动）
+        commas: 是否每三位插入逗号
+    返回:
+        BGRA uint8 图像
+    """
+    glyphs = []
+    for digit in str(value):
+        mask = masks[int(digit)]
+        if scale != 1.0:
+            h, w = mask.shape
+            size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+            mask = cv2.resize(mask, size, interpolation=cv2.INTER_LINEAR)
+        glyphs.append(mask)
+
+    glyph_height = max(g.shape[0] for g in glyphs)
+    gap = max(1, glyph_height // 8)
+    comma_width = max(2, glyph_height // 5)
+
+    text = str(value)
+    commas_after = set()
+    if commas:
+        commas_after = {i for i in range(len(text) - 1) if (len(text) - 1 - i) % 3 == 0}
+
+    width = sum(g.shape[1] for g in glyphs) + gap * (len(glyphs) - 1) + 2 * margin
+    width += len(commas_after) * (comma_width + gap)
+    height = glyph_height + 2 * margin
+
+    canvas = _make_background(height, width, background, rng)
+    foreground = float(rng.integers(200, 256))
+
+    x = margin
+    for index, glyph in enumerate(glyphs):
+        h, w = glyph.shape
+        y = margin + glyph_height - h
+        region = canvas[y:y + h, x:x + w]
+        alpha = glyph.astype(np.float32) / 255.0
+        region[:] = region * (1 - alpha) + foreground * alpha
+        x += w + gap
+        if index in commas_after:
+            # 逗号：基线附近的小斜块
+            bottom = margin + glyph_height
+            points = np.array([[x, bottom - comma_width], [x + comma_width, bottom - comma_width],
+                               [x + comma_width // 2, bottom + comma_width // 2],
+                               [x - comma_width // 2, bottom + comma_width // 2]], dtype=np.int32)
+            cv2.fillConvexPoly(canvas, points, foreground)
+            x += comma_width + gap
+
+    if noise > 0:
+        canvas += rng.normal(0, noise, size=canvas.shape).astype(np.float32)
+
+    gray = np.clip(canvas, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGRA)
+
+
+def generate_dataset(templates, resolution, count, seed=0, backgrounds=BACKGROUNDS,
+                     noise=(0.0, 12.0), scale_jitter=0.08, commas=True):
+    """生成 [(BGRA图像, 真实价格)] 列表，随机组合背景、噪声和缩放"""
+    rng = np.random.default_rng(seed)
+    masks = glyph_masks(templates[resolution])
+    if len(masks) < 10:
+        raise ValueError(f"分辨率 {resolution} 的数字模板不完整")
+
+    samples = []
+    for _ in range(count):
+        value = random_price(rng)
+        image = render_price_strip(
+            value, masks, rng,
+            background=backgrounds[int(rng.integers(0, len(backgrounds)))],
+            noise=float(rng.uniform(*noise)),
+            scale=float(1.0 + rng.uniform(-scale_jitter, scale_jitter)),
+            commas=commas and bool(rng.integers(0, 2)),
+        )
+        samples.append((image, value))
+    return samples